@@ -22,14 +22,94 @@ tests and real instances when not under test.
 from __future__ import print_function
 from __future__ import unicode_literals
 
+# the modules that are only needed by some of the features, such as asyncio,
+# pickle and mmap, are imported where they are used so that importing this
+# module stays cheap for the programs that do not use those features
+import collections
+import collections.abc
+import contextlib
+import functools
+import importlib
+import io
+import itertools
+import math
+import operator
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import types
+import warnings
+import weakref
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 __all__ = [
     "Fakeable",
     "set_fake_class",
     "set_fake_object",
+    "set_fake_factory",
+    "set_fake_sequence",
+    "SequenceExhaustedError",
+    "set_fake_singleton",
+    "set_shadow_class",
+    "set_fake_latency",
+    "FixedLatency",
+    "UniformLatency",
+    "LognormalLatency",
+    "set_recording",
+    "set_replay",
+    "ReplayError",
+    "set_spy",
+    "set_warm_pool",
+    "set_instance_limit",
+    "InstanceLimitError",
+    "registry_spec",
+    "install_registry_spec",
+    "process_pool_kwargs",
+    "use_control_block",
+    "ControlBlock",
+    "set_fork_policy",
+    "snapshot_registry",
+    "restore_registry",
+    "set_construction_profile",
+    "ConstructionProfile",
+    "ConstructionCost",
+    "set_tracer",
+    "SpanCollector",
+    "Span",
+    "load_config",
+    "swap_registry",
+    "RegistrySwap",
+    "watch_config",
+    "ConfigWatcher",
+    "ConfigReload",
+    "find_fakeable_class",
+    "fakeable_classes",
+    "duplicate_fake_names",
+    "DuplicateFakeNameWarning",
+    "set_strict",
     "unset",
     "clear",
     "add_created_callback",
     "remove_created_callback",
+    "join_created_callbacks",
+    "add_destroyed_callback",
+    "remove_destroyed_callback",
+    "LifetimeHistograms",
+    "LifetimeHistogram",
+    "CreationLog",
+    "CreationEvent",
+    "read_creation_log",
+    "watch",
+    "Watch",
+    "WatchClosedError",
+    "Creation",
     "FakeableCleanupMixin",
 ]
 
@@ -41,301 +121,5730 @@ class Fakeable(type):
     A metaclass to be used by types that wish to be fakeable.
 
     In order to make a class fakeable,
-    all that needs to be done is set *fakeable.Fakeable* as its metaclass.
-    In Python 2, this done by setting the special attribute
-    ``__metaclass__ = fakeable.Fakeable`` in the class definition.
-    In Python 3, this is done by specifying ``metaclass=fakeable.Fakeable``
-    in the base class list of the class definition.
-
-    Python 2 example::
-
-        class HttpDownloader(object):
-            __metaclass__ = fakeable.Fakeable
-            ...
-
-    Python 3 example::
+    all that needs to be done is set *fakeable.Fakeable* as its metaclass,
+    by specifying ``metaclass=fakeable.Fakeable``
+    in the base class list of the class definition::
 
         class HttpDownloader(metaclass=fakeable.Fakeable):
             ...
 
-    If you have the third-party ``six`` module installed,
-    then you can do this in a way that works in both Python 2 and Python 3::
-
-        class HttpDownloader(six.with_metaclass(fakeable.Fakeable)):
-            ...
+    Code that still uses the third-party ``six`` module
+    to support Python 2 may also use
+    ``class HttpDownloader(six.with_metaclass(fakeable.Fakeable))``.
 
     The name used in the *fakeable* module functions to refer to this class
     is simply the name of the class.
     This value is stored in the ``__FAKE_NAME__`` attribute of the class.
     If a class explicitly defines a ``__FAKE_NAME__`` attribute
     then that value will be used instead of the default.
+    Fakeable classes can be looked up by this name with
+    :func:`~fakeable.find_fakeable_class`.
+
+    Instances of classes that need asynchronous setup can be created from a
+    coroutine with ``await HttpDownloader.acreate(...)``;
+    see :meth:`~fakeable.Fakeable.acreate` for details.
+    """
+
+    def __new__(mcs, name, bases, dict_):
+        # use the class name as the "name" of the fake, but allow the class
+        # to override this name by setting __FAKE_NAME__
+        try:
+            __FAKE_NAME__ = dict_["__FAKE_NAME__"]
+        except KeyError:
+            dict_["__FAKE_NAME__"] = name
+        else:
+            # ensure that the __FAKE_NAME__ attribute of the class is hashable
+            hash(__FAKE_NAME__)
+
+        # create the type object with the possibly-slightly-modified dict
+        type_ = type.__new__(mcs, name, bases, dict_)
+        FAKEABLE_INDEX.add(type_)
+        return type_
+
+    def __call__(cls, *args, **kwargs):
+        fake_factory = FAKE_FACTORY
+
+        # pick up changes made to the shared control block, if one is in use
+        control_block = fake_factory.control_block
+        if (control_block is not None
+                and control_block.words[1] != fake_factory.control_generation):
+            fake_factory.sync_control_block()
+
+        # the stub is specialized for the fakes and callbacks that were
+        # registered when it was built, so the stubs are discarded whenever
+        # they change and rebuilt by the first construction afterwards
+        stub = fake_factory.construction_stubs.get(id(cls))
+        if stub is None:
+            stub = fake_factory.install_construction_stub(cls)
+        return stub[1](cls, args, kwargs)
+
+    async def acreate(cls, *args, **kwargs):
+        """
+        Creates an instance of this class from a coroutine, allowing both the
+        real class and fakes to perform asynchronous setup, such as opening
+        connection pools.
+
+        If a fake is registered then it is used just as it would be when
+        creating an instance normally, except that an entry registered with
+        :func:`~fakeable.set_fake_factory` may use a coroutine function as its
+        factory, which is awaited.  If no fake is registered then a real
+        instance is created and, if it has an ``__ainit__()`` method, the
+        awaitable that it returns is awaited before the instance is returned.
+
+        *Example*::
+
+            class ConnectionPool(metaclass=fakeable.Fakeable):
+                def __init__(self, url):
+                    self.url = url
+                async def __ainit__(self):
+                    self.connections = await open_connections(self.url)
+
+            pool = await ConnectionPool.acreate("db://example")
+        """
+        control_block = FAKE_FACTORY.control_block
+        if (control_block is not None
+                and control_block.words[1] != FAKE_FACTORY.control_generation):
+            FAKE_FACTORY.sync_control_block()
+
+        tracer = FAKE_FACTORY.tracer
+        profile = FAKE_FACTORY.profile
+        if tracer is None and profile is None:
+            return await _acreate(cls, args, kwargs)
+        fake_name = cls.__FAKE_NAME__
+        fake_factories = FAKE_FACTORY._fake_factories
+        entry = fake_factories.get(cls)
+        if entry is None:
+            entry = fake_factories.get(fake_name)
+        if tracer is not None:
+            faked = entry is not None and entry.produces_fakes()
+            span = tracer.begin(fake_name, cls, faked)
+        error = None
+        start = time.perf_counter()
+        try:
+            return await _acreate(cls, args, kwargs)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            if profile is not None:
+                profile.record(fake_name, entry, seconds)
+            if tracer is not None:
+                tracer.end(span, fake_name, cls, faked, seconds, error)
+
+
+async def _acreate(cls, args, kwargs):
+    # the body of Fakeable.acreate()
+    fake_name = cls.__FAKE_NAME__
+    for key in (cls, fake_name):
+        try:
+            instance = await FAKE_FACTORY.acreate(key, cls, args, kwargs)
+        except FAKE_FACTORY.FakeNotFound:
+            pass
+        else:
+            FAKE_FACTORY.notify_fakeable_created(fake_name, instance, cls)
+            return instance
+
+    instance = type.__call__(cls, *args, **kwargs)
+    await _ainit(instance)
+    FAKE_FACTORY.notify_fakeable_created(fake_name, instance, cls)
+    return instance
+
+
+async def _ainit(instance):
+    # awaits the asynchronous setup of a newly-created real instance, if any
+    try:
+        ainit = instance.__ainit__
+    except AttributeError:
+        pass
+    else:
+        await ainit()
+
+
+def _trace_construction(tracer, fake_name, entry, create):
+    # returns a construction function that reports a span to the given tracer
+    # around each invocation of the given one, which uses the given entry
+    # (None for real instances)
+    begin = tracer.begin
+    end = tracer.end
+    perf_counter = time.perf_counter
+
+    def traced_create(cls, args, kwargs):
+        # asked on each construction, as lazy entries only know once resolved
+        faked = entry is not None and entry.produces_fakes()
+        span = begin(fake_name, cls, faked)
+        start = perf_counter()
+        try:
+            instance = create(cls, args, kwargs)
+        except BaseException as e:
+            end(span, fake_name, cls, faked, perf_counter() - start, e)
+            raise
+        end(span, fake_name, cls, faked, perf_counter() - start, None)
+        return instance
+
+    return traced_create
+
+
+def _create_real(cls, args, kwargs):
+    # the construction stub for classes without a fake or callbacks
+    return type.__call__(cls, *args, **kwargs)
+
+
+class DuplicateFakeNameWarning(UserWarning):
+    """
+    The warning issued when a Fakeable class is created with the same fake
+    name as another Fakeable class, defined elsewhere, that still exists;
+    fakes registered by that name apply to both classes.
+    """
+
+
+class FakeableIndex(object):
+    """
+    An index of the Fakeable classes by their fake names, to which each
+    class is added when it is created.  The classes are referenced weakly,
+    so that they are not kept alive by the index.
+    """
+
+    def __init__(self):
+        # maps fake names to the most recently created class with that name
+        self.classes = weakref.WeakValueDictionary()
+        # maps fake names shared by different classes to weak references to
+        # all of those classes; only populated in the rare case of duplicates
+        self.duplicates = {}
+        self.lock = threading.Lock()
+
+    def after_fork_in_child(self, clear_caches):
+        """
+        Invoked in the child process after a fork: the lock may have been
+        held by a thread that does not exist in the child.
+        """
+        self.lock = threading.Lock()
+
+    def add(self, cls):
+        """
+        Adds the given Fakeable class to the index, issuing
+        :exc:`DuplicateFakeNameWarning` if its fake name is already used by
+        another class.
+        """
+        name = cls.__FAKE_NAME__
+        with self.lock:
+            other = self.classes.get(name)
+            self.classes[name] = cls
+            if other is None or _same_definition(other, cls):
+                # a class that is defined again, such as when its module is
+                # reloaded, is not a duplicate of its previous definition
+                return
+            refs = self.duplicates.get(name)
+            if refs is None:
+                refs = self.duplicates[name] = [weakref.ref(other)]
+            refs.append(weakref.ref(cls))
+        warnings.warn("Fakeable class {}.{} has the same fake name, {!r}, as "
+            "{}.{}".format(cls.__module__, cls.__qualname__, name,
+            other.__module__, other.__qualname__), DuplicateFakeNameWarning,
+            stacklevel=3)
+
+    def get(self, name):
+        """
+        Returns the Fakeable class with the given fake name, or None if there
+        is none; if several classes have that name, the most recently created
+        one is returned.
+        """
+        return self.classes.get(name)
+
+    def snapshot(self):
+        """
+        Returns a dict that maps fake names to Fakeable classes.
+        """
+        with self.lock:
+            return dict(self.classes.items())
+
+    def get_duplicates(self):
+        """
+        Returns a dict that maps the fake names that are shared by several
+        existing classes to lists of those classes.
+        """
+        result = {}
+        with self.lock:
+            for (name, refs) in list(self.duplicates.items()):
+                classes = []
+                for ref in refs:
+                    cls = ref()
+                    if cls is not None and not any(
+                            _same_definition(x, cls) for x in classes):
+                        classes.append(cls)
+                if len(classes) > 1:
+                    result[name] = classes
+                elif not classes:
+                    del self.duplicates[name]
+        return result
+
+
+def _same_definition(cls1, cls2):
+    return (cls1.__module__ == cls2.__module__
+        and cls1.__qualname__ == cls2.__qualname__)
+
+
+class FakeFactory(object):
+    """
+    A database of fake objects.
+    """
+
+    def __init__(self):
+        # guards changes to the registry, but not lookups, which rely on the
+        # atomicity of dict operations
+        self.lock = threading.RLock()
+        self._fake_factories = {}
+        self.fakeable_created_callbacks = []
+        self.fakeable_destroyed_callbacks = []
+        # maps the ids of the objects being tracked for destroyed callbacks
+        # to their weakref.finalize objects
+        self._destroy_finalizers = {}
+        self.callback_tasks = set()
+        # the futures of the awaitables run on the private event loop, which
+        # is started when first needed; see schedule_callback()
+        self.callback_futures = set()
+        self._callback_loop = None
+        # incremented each time that the registered fakes or callbacks change
+        self.generation = 0
+        # the digest of the last installed spec and the generation that
+        # installing it produced
+        self.installed_spec_digest = None
+        self.installed_spec_generation = None
+        self._spec_cache = None
+        self.control_block = None
+        self.control_generation = None
+        self.control_stand_ins = None
+        self._control_table = {}
+        self.strict = False
+        # maps the ids of Fakeable classes to their construction stubs; kept
+        # here rather than in the classes, and replaced with an empty dict
+        # when the registry changes so that the stubs do not keep entries
+        # alive; see install_construction_stub()
+        self.construction_stubs = {}
+        # maps fake names to the tuple of Watch objects subscribed to them;
+        # replaced rather than modified, like fakeable_destroyed_callbacks
+        self.watches = {}
+        # the snapshots that have not been restored yet, oldest first, and
+        # the journal of the changes made since the oldest of them, which
+        # records how to undo each change; None if there are no snapshots
+        self._snapshots = []
+        self._journal = None
+        # the (is_entry, key) pairs of the changes recorded in the journal
+        # since the latest snapshot; only the first change to each is needed
+        # to restore that snapshot, so the later ones are not recorded
+        self._journal_keys = None
+        self.profile = None
+        self.tracer = None
+
+    @property
+    def fake_factories(self):
+        """
+        A read-only mapping of the names of the registered fakes, or the
+        classes by which they were registered, to their entries.  Fakes must
+        be registered and unregistered with the methods of the fake factory,
+        such as register() and unset(), which also discard the construction
+        stubs that refer to the replaced entries.
+        """
+        return types.MappingProxyType(self._fake_factories)
+
+    def register(self, entry):
+        """
+        Registers the given :class:`FakeEntry`, replacing any entry that was
+        previously registered with the same name, and returns it.
+        """
+        if self.strict:
+            self.check_fake_name(entry.name)
+        with self.lock:
+            self._journal_entry(entry.name)
+            replaced = self._fake_factories.get(entry.name)
+            self._fake_factories[entry.name] = entry
+            if self.profile is not None:
+                self.profile.add_registration(entry)
+            self.registry_changed()
+            dropped = self._dropped_entries([replaced])
+        self._close_entries(dropped)
+        return entry
+
+    def _journal_entry(self, name):
+        # records how to undo a change to the entry with the given name;
+        # must be invoked with self.lock held, before the change; changes to
+        # a dict of entries that is replaced later are not needed either
+        journal_keys = self._journal_keys
+        if (journal_keys is not None and (True, name) not in journal_keys
+                and (False, "_fake_factories") not in journal_keys):
+            journal_keys.add((True, name))
+            self._journal.append(
+                (True, name, self._fake_factories.get(name, _NO_ITEM)))
+
+    def _journal_attrs(self, *attrs):
+        # records how to undo the replacement of the given attributes; must
+        # be invoked with self.lock held, before they are replaced
+        journal_keys = self._journal_keys
+        if journal_keys is not None:
+            for attr in attrs:
+                if (False, attr) not in journal_keys:
+                    journal_keys.add((False, attr))
+                    self._journal.append((False, attr, getattr(self, attr)))
+
+    def _dropped_entries(self, entries):
+        # returns those of the given entries, which were just removed from the
+        # registry, that are no longer registered and that no snapshot can
+        # restore, and that must therefore be closed; must be invoked with
+        # self.lock held
+        dropped = {}
+        for entry in entries:
+            if (entry is None or id(entry) in dropped
+                    or self._entry_referenced(entry)):
+                continue
+            dropped[id(entry)] = entry
+        return list(dropped.values())
+
+    def _entry_referenced(self, entry):
+        # must be invoked with self.lock held
+        if self._fake_factories.get(entry.name) is entry:
+            return True
+        for (is_entry, key, value) in self._journal or ():
+            if is_entry:
+                if value is entry:
+                    return True
+            elif key == "_fake_factories" and value.get(entry.name) is entry:
+                return True
+        return False
+
+    @staticmethod
+    def _close_entries(entries):
+        # closes entries that were dropped from the registry, which stops
+        # their background threads and releases their files; invoked without
+        # self.lock held where possible, since closing may wait for threads
+        for entry in entries:
+            close = getattr(entry, "close", None)
+            if close is not None:
+                close()
+
+    def snapshot(self):
+        """
+        See module-level snapshot_registry() function for full documentation
+        """
+        with self.lock:
+            if self._journal is None:
+                self._journal = []
+            self._journal_keys = set()
+            snapshot = RegistrySnapshot(len(self._journal))
+            self._snapshots.append(snapshot)
+            return snapshot
+
+    def restore(self, snapshot):
+        """
+        See module-level restore_registry() function for full documentation
+        """
+        with self.lock:
+            for (index, candidate) in enumerate(reversed(self._snapshots)):
+                if candidate is snapshot:
+                    break
+            else:
+                raise ValueError("the snapshot was already restored, or was "
+                    "taken before a snapshot that was restored")
+            del self._snapshots[len(self._snapshots) - index - 1:]
+            journal = self._journal
+            # the entries that the changes being undone had registered
+            undone = []
+            while len(journal) > snapshot.position:
+                (is_entry, key, value) = journal.pop()
+                if not is_entry:
+                    if key == "_fake_factories":
+                        undone.extend(self._fake_factories.values())
+                    setattr(self, key, value)
+                elif value is _NO_ITEM:
+                    undone.append(self._fake_factories.pop(key, None))
+                else:
+                    undone.append(self._fake_factories.get(key))
+                    self._fake_factories[key] = value
+            if not self._snapshots:
+                self._journal = None
+                self._journal_keys = None
+            else:
+                position = self._snapshots[-1].position
+                self._journal_keys = set((is_entry, key)
+                    for (is_entry, key, _) in journal[position:])
+            self.registry_changed()
+            dropped = self._dropped_entries(undone)
+        self._close_entries(dropped)
+
+    def set_tracer(self, tracer):
+        """
+        See module-level set_tracer() function for full documentation
+        """
+        with self.lock:
+            previous = self.tracer
+            self.tracer = tracer
+            self.registry_changed()
+        return previous
+
+    def set_profile(self, profile):
+        """
+        See module-level set_construction_profile() function
+        for full documentation
+        """
+        with self.lock:
+            previous = self.profile
+            self.profile = profile
+            if profile is not None:
+                for entry in self._fake_factories.values():
+                    profile.add_registration(entry)
+            self.registry_changed()
+        return previous
+
+    def registry_changed(self):
+        """
+        Records a change to the registered fakes or callbacks, invalidating
+        the construction stubs; must be invoked with self.lock held.
+        """
+        self.generation += 1
+        if self.construction_stubs:
+            self.construction_stubs = {}
+
+    def install_construction_stub(self, cls):
+        """
+        Builds the function that creates the instances of the given Fakeable
+        class for the fakes and callbacks that are currently registered,
+        stores it in ``construction_stubs`` by the id of the class, and
+        returns the stored ``(weakref_to_cls, function)`` tuple, which is
+        removed when the class is garbage collected.  The function takes the
+        class, and the positional and keyword arguments of the constructor as
+        a tuple and a dict.  This method is invoked by the
+        :class:`~fakeable.Fakeable` metaclass the first time that an instance
+        is created after the registered fakes or callbacks change.
+
+        The fake is looked up by the class first and then by its name.
+        Specialized functions are used to create real instances, to return
+        a fake object and to create instances of a fake class; other entries
+        are invoked via their create() method.  The created callbacks are
+        only notified if any callbacks are registered.
+        """
+        with self.lock:
+            return self._install_construction_stub(cls)
+
+    def _install_construction_stub(self, cls):
+        fake_name = cls.__FAKE_NAME__
+        entry = self._fake_factories.get(cls)
+        if entry is None:
+            entry = self._fake_factories.get(fake_name)
+
+        if entry is None:
+            create = _create_real
+        elif type(entry) is FakeObjectEntry:
+            def create(cls, args, kwargs):
+                return entry.value
+        elif type(entry) is FakeClassEntry:
+            def create(cls, args, kwargs):
+                return entry.value(*args, **kwargs)
+        else:
+            create = entry.create
+
+        if (self.fakeable_created_callbacks
+                or self.fakeable_destroyed_callbacks
+                or fake_name in self.watches):
+            create_without_callbacks = create
+            notify_fakeable_created = self.notify_fakeable_created
+            def create(cls, args, kwargs):
+                instance = create_without_callbacks(cls, args, kwargs)
+                notify_fakeable_created(fake_name, instance, cls)
+                return instance
+
+        if self.profile is not None:
+            create = self.profile.wrap(fake_name, entry, create)
+
+        # without a tracer, constructions are not timed at all
+        if self.tracer is not None:
+            create = _trace_construction(self.tracer, fake_name, entry,
+                create)
+
+        key = id(cls)
+        def forget(ref):
+            # the class was garbage collected; its id may be reused
+            stubs = self.construction_stubs
+            stub = stubs.get(key)
+            if stub is not None and stub[0] is ref:
+                stubs.pop(key, None)
+        stub = (weakref.ref(cls, forget), create)
+        self.construction_stubs[key] = stub
+        return stub
+
+    def check_fake_name(self, name):
+        """
+        Raises :exc:`ValueError` if *name* is neither a Fakeable class nor the
+        fake name of an existing Fakeable class; used in strict mode.
+        """
+        if isinstance(name, Fakeable):
+            return
+        try:
+            found = FAKEABLE_INDEX.get(name) is not None
+        except TypeError:
+            found = False
+        if not found:
+            raise ValueError("{!r} is not the name of a Fakeable class "
+                "(strict mode is enabled)".format(name))
+
+    def set_fake_class(self, name, value):
+        """
+        See module-level set_fake_class() function for full documentation
+        """
+        return self.register(FakeClassEntry(self, name, value))
+
+    def set_fake_object(self, name, value):
+        """
+        See module-level set_fake_object() function for full documentation
+        """
+        return self.register(FakeObjectEntry(self, name, value))
+
+    def set_stand_in(self, name, value):
+        """
+        Registers a "stand-in" for the class with the given name, which is
+        interpreted according to its type: an object whose class sets
+        ``__fakeable_stand_in__`` to True, such as a
+        :class:`fakeable_bench.StandIn`, is asked to register itself by
+        invoking its ``install(fake_factory, name)`` method, a class is
+        registered with :meth:`set_fake_class` and any other object is
+        registered with :meth:`set_fake_object`, even if it happens to have
+        an ``install`` attribute.  Returns the registered entry.
+        """
+        if getattr(type(value), "__fakeable_stand_in__", False):
+            return value.install(self, name)
+        elif isinstance(value, type):
+            return self.set_fake_class(name, value)
+        else:
+            return self.set_fake_object(name, value)
+
+    def set_fake_factory(self, name, value):
+        """
+        See module-level set_fake_factory() function for full documentation
+        """
+        return self.register(FakeFactoryEntry(self, name, value))
+
+    def set_fake_sequence(self, name, items, cycle=False, exhausted="raise"):
+        """
+        See module-level set_fake_sequence() function for full documentation
+        """
+        return self.register(
+            FakeSequenceEntry(self, name, items, cycle, exhausted))
+
+    def set_fake_singleton(self, name, value, scope="thread"):
+        """
+        See module-level set_fake_singleton() function for full documentation
+        """
+        return self.register(FakeSingletonEntry(self, name, value, scope))
+
+    def set_shadow_class(self, name, candidate, executor=None, compare=None,
+            deep_copy=False):
+        """
+        See module-level set_shadow_class() function for full documentation
+        """
+        return self.register(FakeShadowEntry(self, name, candidate, executor,
+            compare, deep_copy))
+
+    def set_fake_latency(self, name, wrapped=None, **kwargs):
+        """
+        See module-level set_fake_latency() function for full documentation
+        """
+        return self.register(FakeLatencyEntry(self, name, wrapped, **kwargs))
+
+    def set_recording(self, name, path, wrapped=None):
+        """
+        See module-level set_recording() function for full documentation
+        """
+        return self.register(FakeRecordingEntry(self, name, path, wrapped))
+
+    def set_replay(self, name, path, match="strict"):
+        """
+        See module-level set_replay() function for full documentation
+        """
+        return self.register(FakeReplayEntry(self, name, path, match))
+
+    def set_spy(self, name, wrapped=None, capacity=65536,
+            capture_args=False):
+        """
+        See module-level set_spy() function for full documentation
+        """
+        return self.register(
+            FakeSpyEntry(self, name, wrapped, capacity, capture_args))
+
+    def set_warm_pool(self, name, size=4, args=(), kwargs=None):
+        """
+        See module-level set_warm_pool() function for full documentation
+        """
+        if isinstance(name, Fakeable):
+            cls = name
+        else:
+            cls = FAKEABLE_INDEX.get(name)
+            if cls is None:
+                raise ValueError("{!r} is not the name of a Fakeable class"
+                    .format(name))
+        return self.register(
+            FakeWarmPoolEntry(self, name, cls, size, args, kwargs))
+
+    def set_instance_limit(self, name, limit, wrapped=None, timeout=None):
+        """
+        See module-level set_instance_limit() function for full documentation
+        """
+        return self.register(
+            FakeLimitEntry(self, name, limit, wrapped, timeout))
+
+    def load_config(self, path, cache_path=None):
+        """
+        See module-level load_config() function for full documentation
+        """
+        items = _load_config_items(path, cache_path)
+        return [self.register(FakeLazyEntry(self, *item)) for item in items]
+
+    def swap(self, source):
+        """
+        See module-level swap_registry() function for full documentation
+        """
+        if isinstance(source, FakeFactory):
+            entries = list(source._fake_factories.values())
+        else:
+            entries = list(source)
+        if self.strict:
+            for entry in entries:
+                self.check_fake_name(entry.name)
+        fake_factories = {}
+        for entry in entries:
+            entry.fake_factory = self
+            fake_factories[entry.name] = entry
+        start = time.perf_counter()
+        with self.lock:
+            self._journal_attrs("_fake_factories")
+            replaced = self._fake_factories
+            self._fake_factories = fake_factories
+            if self.profile is not None:
+                for entry in entries:
+                    self.profile.add_registration(entry)
+            self.registry_changed()
+            generation = self.generation
+            swap_seconds = time.perf_counter() - start
+            # not closed, since the instances that they created may still be
+            # in use; see swap_registry()
+            dropped = self._dropped_entries(replaced.values())
+        return RegistrySwap(generation, len(fake_factories), swap_seconds,
+            dropped)
+
+    def watch_config(self, path, interval=1.0, callback=None,
+            cache_path=None):
+        """
+        See module-level watch_config() function for full documentation
+        """
+        return ConfigWatcher(self, path, interval, callback, cache_path)
+
+    def registry_spec(self, factories=None):
+        """
+        See module-level registry_spec() function for full documentation
+        """
+        factories = dict(factories or {})
+        cache = self._spec_cache
+        if (cache is not None and cache[0] == self.generation
+                and cache[1] == factories):
+            return cache[2]
+        spec = RegistrySpec.from_entries(self._fake_factories.values(),
+            factories)
+        self._spec_cache = (self.generation, factories, spec)
+        return spec
+
+    def install_registry_spec(self, spec):
+        """
+        See module-level install_registry_spec() function
+        for full documentation
+        """
+        with self.lock:
+            if (spec.digest == self.installed_spec_digest
+                    and self.generation == self.installed_spec_generation):
+                return False
+        entries = spec.create_entries(self)
+        with self.lock:
+            self._journal_attrs("_fake_factories")
+            self._fake_factories = {entry.name: entry for entry in entries}
+            self.registry_changed()
+            self.installed_spec_digest = spec.digest
+            self.installed_spec_generation = self.generation
+        return True
+
+    def use_control_block(self, control_block, stand_ins):
+        """
+        See module-level use_control_block() function for full documentation
+        """
+        with self.lock:
+            if self.control_block is not None:
+                for name in self._control_table:
+                    self.unset(name)
+            self._control_table = {}
+            self.control_stand_ins = dict(stand_ins or {})
+            self.control_generation = None
+            self.control_block = control_block
+            if control_block is not None:
+                self.sync_control_block()
+
+    def sync_control_block(self):
+        """
+        Applies the table of the control block in use to the registered
+        fakes.  This is invoked by the :class:`~fakeable.Fakeable` metaclass
+        when it notices that the generation of the control block has changed.
+        """
+        with self.lock:
+            control_block = self.control_block
+            if control_block is None:
+                return
+            (generation, table) = control_block.read()
+            if generation == self.control_generation:
+                # another thread got here first
+                return
+            previous = self._control_table
+            for name in previous:
+                if name not in table:
+                    self.unset(name)
+            for (name, entry_id) in table.items():
+                if previous.get(name) == entry_id:
+                    continue
+                if entry_id == 0:
+                    self.unset(name)
+                else:
+                    try:
+                        stand_in = self.control_stand_ins[entry_id]
+                    except KeyError:
+                        # an unknown entry id must not make the construction
+                        # of objects fail; use the real class instead
+                        self.unset(name)
+                    else:
+                        self.set_stand_in(name, stand_in)
+            self._control_table = table
+            self.control_generation = generation
+
+    def unset(self, name):
+        """
+        See module-level unset() function for full documentation
+        """
+        with self.lock:
+            if name not in self._fake_factories:
+                return False
+            self._journal_entry(name)
+            entry = self._fake_factories.pop(name)
+            self.registry_changed()
+            dropped = self._dropped_entries([entry])
+        self._close_entries(dropped)
+        return True
+
+    def clear(self):
+        """
+        See module-level clear() function for full documentation
+        """
+        with self.lock:
+            # the containers are replaced rather than cleared so that a
+            # snapshot can restore them in constant time
+            self._journal_attrs("_fake_factories", "fakeable_created_callbacks",
+                "fakeable_destroyed_callbacks", "watches")
+            fake_factories = self._fake_factories
+            self._fake_factories = {}
+            self.fakeable_created_callbacks = []
+            self.fakeable_destroyed_callbacks = []
+            watches = self.watches
+            self.watches = {}
+            self.registry_changed()
+            dropped = self._dropped_entries(fake_factories.values())
+        self._close_entries(dropped)
+        for name_watches in watches.values():
+            for watch in name_watches:
+                watch.close()
+
+    def add_created_callback(self, callback):
+        """
+        See module-level add_created_callback() function
+        for full documentation
+        """
+        with self.lock:
+            self._journal_attrs("fakeable_created_callbacks")
+            self.fakeable_created_callbacks = (
+                self.fakeable_created_callbacks + [callback])
+            self.registry_changed()
+
+    def remove_created_callback(self, callback):
+        """
+        See module-level remove_created_callback() function
+        for full documentation
+        """
+        with self.lock:
+            callbacks = list(self.fakeable_created_callbacks)
+            try:
+                callbacks.remove(callback)
+            except ValueError:
+                return False
+            else:
+                self._journal_attrs("fakeable_created_callbacks")
+                self.fakeable_created_callbacks = callbacks
+                self.registry_changed()
+                return True
+
+    def watch(self, name, maxsize=1024, overflow="drop_oldest"):
+        """
+        See module-level watch() function for full documentation
+        """
+        if isinstance(name, Fakeable):
+            name = name.__FAKE_NAME__
+        watch = Watch(self, name, maxsize, overflow)
+        with self.lock:
+            watches = dict(self.watches)
+            watches[name] = watches.get(name, ()) + (watch,)
+            self._journal_attrs("watches")
+            self.watches = watches
+            self.registry_changed()
+        return watch
+
+    def unwatch(self, watch):
+        """
+        Unsubscribes the given :class:`~fakeable.Watch`; invoked by its
+        close() method.
+        """
+        with self.lock:
+            name_watches = self.watches.get(watch.name, ())
+            if watch not in name_watches:
+                return
+            watches = dict(self.watches)
+            name_watches = tuple(x for x in name_watches if x is not watch)
+            if name_watches:
+                watches[watch.name] = name_watches
+            else:
+                del watches[watch.name]
+            self._journal_attrs("watches")
+            self.watches = watches
+            self.registry_changed()
+
+    def add_destroyed_callback(self, callback):
+        """
+        See module-level add_destroyed_callback() function
+        for full documentation
+        """
+        with self.lock:
+            # the list is replaced rather than modified because it may be
+            # iterated over by a finalizer at any time
+            self._journal_attrs("fakeable_destroyed_callbacks")
+            self.fakeable_destroyed_callbacks = (
+                self.fakeable_destroyed_callbacks + [callback])
+            self.registry_changed()
+
+    def remove_destroyed_callback(self, callback):
+        """
+        See module-level remove_destroyed_callback() function
+        for full documentation
+        """
+        with self.lock:
+            callbacks = list(self.fakeable_destroyed_callbacks)
+            try:
+                callbacks.remove(callback)
+            except ValueError:
+                return False
+            self._journal_attrs("fakeable_destroyed_callbacks")
+            self.fakeable_destroyed_callbacks = callbacks
+            self.registry_changed()
+            return True
+
+    def after_fork_in_child(self, clear_caches):
+        """
+        Restores this fake factory to a consistent state in the child process
+        after a fork; invoked automatically, see
+        :func:`~fakeable.set_fork_policy`.
+        """
+        self.lock = threading.RLock()
+        # the tasks belong to event loops that are not running in the child,
+        # including the private event loop, whose thread does not exist
+        self.callback_tasks = set()
+        self.callback_futures = set()
+        self._callback_loop = None
+        if clear_caches:
+            self._spec_cache = None
+
+    def notify_fakeable_created(self, name, obj, obj_type):
+        """
+        Notifies all callbacks about an instance of a fakeable class being
+        created.  This method is not normally invoked directly, but rather is
+        invoked by the :class:`~fakeable.Fakeable` metaclass when it is
+        requested to create a new object.
+
+        The arguments are exactly those to specify to the callbacks registered
+        via :meth:`add_created_callback` so see the documentation for that
+        method for details.
+        """
+        for callback in self.fakeable_created_callbacks:
+            result = callback(name, obj, obj_type)
+            if result is not None and _isawaitable(result):
+                self.schedule_callback(result)
+        if self.fakeable_destroyed_callbacks:
+            self.track_destruction(name, obj, obj_type)
+        watches = self.watches.get(name)
+        if watches:
+            creation = Creation(name, obj, obj_type)
+            for watch in watches:
+                watch.put(creation)
+
+    def track_destruction(self, name, obj, obj_type):
+        """
+        Arranges for the destroyed callbacks to be notified when the given
+        object, which was just created, is garbage collected.  Objects that
+        do not support weak references are silently ignored, as are objects
+        that are already tracked, such as fake objects that are returned
+        each time an instance is created.
+        """
+        key = id(obj)
+        finalizer = self._destroy_finalizers.get(key)
+        if finalizer is not None and finalizer.alive:
+            return
+        try:
+            finalizer = weakref.finalize(obj, self.notify_fakeable_destroyed,
+                name, obj_type, key, time.perf_counter())
+        except TypeError:
+            return
+        # finalizers are only needed while there are subscribers, and must
+        # not delay the exit of the interpreter
+        finalizer.atexit = False
+        self._destroy_finalizers[key] = finalizer
+
+    def notify_fakeable_destroyed(self, name, obj_type, key, created):
+        """
+        Notifies all destroyed callbacks about an instance of a fakeable class
+        having been garbage collected; invoked by the finalizers attached by
+        track_destruction().
+        """
+        self._destroy_finalizers.pop(key, None)
+        lifetime = time.perf_counter() - created
+        for callback in self.fakeable_destroyed_callbacks:
+            callback(name, obj_type, lifetime)
+
+    def schedule_callback(self, awaitable):
+        """
+        Schedules the awaitable returned by a created callback to run on the
+        running event loop without waiting for it.  If there is no running
+        event loop then it is run on a private event loop, in a background
+        thread that is started when first needed, rather than blocking the
+        creation of the object or replacing the event loop of the thread.
+        Exceptions raised by a scheduled awaitable are passed to the exception
+        handler of the event loop, which logs them by default.
+        """
+        import asyncio
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = self._start_callback_loop()
+            future = asyncio.run_coroutine_threadsafe(_await(awaitable),
+                loop)
+            self.callback_futures.add(future)
+            future.add_done_callback(
+                functools.partial(self._callback_future_done, loop))
+            return
+        task = loop.create_task(_await(awaitable))
+        self.callback_tasks.add(task)
+        task.add_done_callback(self._callback_task_done)
+
+    def _start_callback_loop(self):
+        # returns the private event loop, starting it if necessary
+        with self.lock:
+            loop = self._callback_loop
+            if loop is None:
+                import asyncio
+                loop = asyncio.new_event_loop()
+                _background_thread(functools.partial(_run_callback_loop, loop),
+                    "fakeable-callbacks").start()
+                self._callback_loop = loop
+        return loop
+
+    def _callback_future_done(self, loop, future):
+        self.callback_futures.discard(future)
+        if future.cancelled():
+            return
+        exception = future.exception()
+        if exception is not None:
+            loop.call_exception_handler({
+                "message": "exception in a fakeable created callback",
+                "exception": exception,
+                "future": future,
+            })
+
+    def _callback_task_done(self, task):
+        self.callback_tasks.discard(task)
+        if task.cancelled():
+            return
+        exception = task.exception()
+        if exception is not None:
+            task.get_loop().call_exception_handler({
+                "message": "exception in a fakeable created callback",
+                "exception": exception,
+                "task": task,
+            })
+
+    async def join_created_callbacks(self):
+        """
+        See module-level join_created_callbacks() function
+        for full documentation
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            tasks = [task for task in list(self.callback_tasks)
+                if task.get_loop() is loop]
+            tasks.extend(asyncio.wrap_future(future)
+                for future in list(self.callback_futures))
+            if not tasks:
+                break
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get(self, name, *args, **kwargs):
+        """
+        Gets or creates the fake object for a class.
+
+        This method is equivalent to :meth:`create` except that the entry is
+        not given the real class.  It should not normally be invoked directly.
+
+        Arguments:
+            *name* (string or :class:`fakeable.Fakeable` instance)
+                the name of the class, or the class itself, whose fake object
+                to get or create; if a string, this will be the name of the
+                class or, if the class defines __FAKE_NAME__, the value of that
+                class' __FAKE_NAME__ attribute.
+
+        Returns the fake object for the class with the given name.
+        Raises self.FakeNotFound if no fake was registered with the given name.
+        """
+        try:
+            entry = self._fake_factories[name]
+        except KeyError:
+            raise self.FakeNotFound()
+        else:
+            instance = entry.get(*args, **kwargs)
+            return instance
+
+    def create(self, name, cls, args, kwargs):
+        """
+        Creates the object to return in place of a new instance of a
+        :class:`~fakeable.Fakeable` class.
+
+        This method is the one used by the :class:`fakeable.Fakeable` metaclass
+        to create the fake instances.  It should not normally be invoked
+        directly.  It differs from :meth:`get` in that the entry is also given
+        the real class, which allows entries to create real instances.
+
+        Arguments:
+            *name* (string or :class:`fakeable.Fakeable` instance)
+                the name of the class, or the class itself, whose fake object
+                to get or create; see :meth:`get` for details.
+            *cls* (:class:`fakeable.Fakeable` instance)
+                the real class whose instance was requested.
+            *args* (tuple) and *kwargs* (dict)
+                the arguments that were specified to the class constructor.
+
+        Returns the fake object for the class with the given name.
+        Raises self.FakeNotFound if no fake was registered with the given name.
+        """
+        try:
+            entry = self._fake_factories[name]
+        except KeyError:
+            raise self.FakeNotFound()
+        else:
+            instance = entry.create(cls, args, kwargs)
+            return instance
+
+    async def acreate(self, name, cls, args, kwargs):
+        """
+        The asynchronous version of :meth:`create`, which is used by
+        :meth:`fakeable.Fakeable.acreate`.
+        """
+        try:
+            entry = self._fake_factories[name]
+        except KeyError:
+            raise self.FakeNotFound()
+        else:
+            instance = await entry.acreate(cls, args, kwargs)
+            return instance
+
+    class FakeNotFound(Exception):
+        """
+        Exception raised by get() if a fake is not found to be registered with
+        the name that it is given.
+        """
+        pass
+
+
+Span = collections.namedtuple("Span",
+    ["name", "cls", "faked", "start", "duration", "thread", "error"])
+Span.__doc__ = """
+The construction of an instance of a Fakeable class, as recorded by a
+:class:`~fakeable.SpanCollector`: the fake name of the class, the class,
+whether a fake was registered for it, the value of
+:func:`time.perf_counter` when the construction began, its duration in
+seconds, the identifier of the thread that performed it, and the exception
+that it raised, if any.
+"""
+
+
+class SpanCollector(object):
+    """
+    A tracer, for use with :func:`~fakeable.set_tracer`, that keeps the
+    spans of the most recent *capacity* constructions in memory as
+    :class:`~fakeable.Span` objects.  Recording a span only appends it to a
+    bounded :class:`collections.deque`, without locking; the oldest spans
+    are discarded once it is full.
+    """
+
+    def __init__(self, capacity=65536):
+        if capacity < 1:
+            raise ValueError("invalid capacity: {} (must be at least 1)"
+                .format(capacity))
+        self.capacity = capacity
+        self._spans = collections.deque(maxlen=capacity)
+
+    def begin(self, name, cls, faked):
+        return time.perf_counter()
+
+    def end(self, span, name, cls, faked, duration, error):
+        self._spans.append(Span(name, cls, faked, span, duration,
+            threading.get_ident(), error))
+
+    def spans(self):
+        """
+        Returns a list of the recorded spans, oldest first.
+        """
+        # copy() does not run Python code, so it is atomic
+        return list(self._spans.copy())
+
+    def drain(self):
+        """
+        Removes the recorded spans and returns them, oldest first, such as
+        to export them periodically.  Spans recorded concurrently are either
+        returned or kept for the next call.
+        """
+        spans = []
+        popleft = self._spans.popleft
+        while True:
+            try:
+                spans.append(popleft())
+            except IndexError:
+                return spans
+
+    def clear(self):
+        """
+        Discards the recorded spans.
+        """
+        self._spans.clear()
+
+    def __len__(self):
+        return len(self._spans)
+
+
+RegistrySwap = collections.namedtuple("RegistrySwap",
+    ["generation", "entries", "swap_seconds", "replaced"])
+RegistrySwap.__doc__ = """
+The result of :func:`~fakeable.swap_registry`: the generation of the
+registry after the swap, the number of entries swapped in, the time in
+seconds for which the registry was locked to swap them in, and the list of
+the replaced entries that are left for the caller to close.
+"""
+
+
+class RegistrySnapshot(object):
+    """
+    A snapshot of the registered fakes and callbacks, as returned from
+    :func:`~fakeable.snapshot_registry`.  It only records the position in
+    the journal of changes from which the registry is restored.
+    """
+
+    __slots__ = ("position",)
+
+    def __init__(self, position):
+        self.position = position
+
+
+ConstructionCost = collections.namedtuple("ConstructionCost",
+    ["name", "count", "total_seconds", "max_seconds"])
+ConstructionCost.__doc__ = """
+The instances of a Fakeable class that were created while a
+:class:`~fakeable.ConstructionProfile` was in use: the fake name of the class,
+the number of instances, and the total and maximum time taken to create them,
+including the time taken by the created callbacks.
+"""
+
+
+class ConstructionProfile(object):
+    """
+    Counts the uses of the registered fakes and times the construction of
+    the instances of Fakeable classes; see
+    :func:`~fakeable.set_construction_profile`.
+
+    The fakes are identified by ``(name, entry_type)`` tuples of strings:
+    the fake name with which the fake was registered and the name of the
+    class of its entry, such as ``"FakeClassEntry"``.  A profile can be
+    converted to a dict of JSON-compatible values with :meth:`to_dict` and
+    the profiles of several processes combined with :meth:`merge`.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.registered = set()
+        self.hits = collections.Counter()
+        # maps fake names to [count, total_seconds, max_seconds] lists
+        self.constructions = {}
+        _FORK_HANDLERS.add(self)
+
+    def after_fork_in_child(self, clear_caches):
+        """
+        Invoked in the child process after a fork: the lock may have been
+        held by a thread that does not exist in the child.
+        """
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def fake_key(entry):
+        """
+        Returns the ``(name, entry_type)`` tuple identifying the given entry.
+        """
+        name = entry.name
+        if isinstance(name, Fakeable):
+            name = name.__FAKE_NAME__
+        return (str(name), type(entry).__name__)
+
+    def add_registration(self, entry):
+        """
+        Records the registration of the given entry; invoked by the fake
+        factory.
+        """
+        with self.lock:
+            self.registered.add(self.fake_key(entry))
+
+    def wrap(self, fake_name, entry, create):
+        """
+        Returns a construction function that invokes the given one, which
+        creates the instances of the class with the given fake name using
+        the given entry (None for real instances), and records its use;
+        invoked by the fake factory when building construction stubs.
+        """
+        key = None if entry is None else self.fake_key(entry)
+        add = self._add
+        perf_counter = time.perf_counter
+
+        def profiled_create(cls, args, kwargs):
+            start = perf_counter()
+            try:
+                return create(cls, args, kwargs)
+            finally:
+                add(fake_name, key, perf_counter() - start)
+
+        return profiled_create
+
+    def record(self, fake_name, entry, seconds):
+        """
+        Records that an instance of the class with the given fake name was
+        created using the given entry (None for real instances) in the given
+        number of seconds; invoked by :meth:`fakeable.Fakeable.acreate`,
+        whose constructions cannot be wrapped by :meth:`wrap`.
+        """
+        self._add(fake_name, None if entry is None else self.fake_key(entry),
+            seconds)
+
+    def _add(self, fake_name, key, seconds):
+        with self.lock:
+            if key is not None:
+                self.hits[key] += 1
+            try:
+                cost = self.constructions[fake_name]
+            except KeyError:
+                self.constructions[fake_name] = [1, seconds, seconds]
+            else:
+                cost[0] += 1
+                cost[1] += seconds
+                if seconds > cost[2]:
+                    cost[2] = seconds
+
+    def never_hit(self):
+        """
+        Returns the sorted list of the fakes that were registered but never
+        used to create an instance.
+        """
+        with self.lock:
+            return sorted(key for key in self.registered if not self.hits[key])
+
+    def most_expensive(self, count=10):
+        """
+        Returns a list of :class:`~fakeable.ConstructionCost` objects for at
+        most *count* classes, those whose instances took the most time to
+        create in total, most expensive first.
+        """
+        with self.lock:
+            costs = [ConstructionCost(name, *cost)
+                for (name, cost) in self.constructions.items()]
+        costs.sort(key=operator.attrgetter("total_seconds"), reverse=True)
+        return costs[:count]
+
+    def to_dict(self):
+        """
+        Returns the contents of this profile as a dict containing only lists,
+        strings and numbers, such as to send it to another process.
+        """
+        with self.lock:
+            return {
+                "registered": sorted(list(key) for key in self.registered),
+                "hits": sorted([name, entry_type, count]
+                    for ((name, entry_type), count) in self.hits.items()),
+                "constructions": sorted([name] + cost
+                    for (name, cost) in self.constructions.items()),
+            }
+
+    def merge(self, data):
+        """
+        Adds the contents of a profile, as returned from :meth:`to_dict`, to
+        this profile.
+        """
+        with self.lock:
+            for (name, entry_type) in data["registered"]:
+                self.registered.add((name, entry_type))
+            for (name, entry_type, count) in data["hits"]:
+                self.hits[(name, entry_type)] += count
+            for (name, count, total_seconds, max_seconds) in (
+                    data["constructions"]):
+                cost = self.constructions.setdefault(name, [0, 0.0, 0.0])
+                cost[0] += count
+                cost[1] += total_seconds
+                cost[2] = max(cost[2], max_seconds)
+
+
+class LifetimeHistogram(object):
+    """
+    A histogram of the lifetimes of the instances of one class, as collected
+    by :class:`~fakeable.LifetimeHistograms`.  Lifetimes are counted in
+    buckets whose bounds are powers of two microseconds: bucket 0 counts
+    lifetimes of up to 1 microsecond and bucket *i* counts lifetimes greater
+    than ``2 ** (i - 1)`` and up to ``2 ** i`` microseconds.
+    """
+
+    BUCKET_COUNT = 48
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * self.BUCKET_COUNT
+
+    def add(self, seconds):
+        """
+        Adds a lifetime, in seconds, to this histogram.
+        """
+        if seconds > 1e-6:
+            index = min(math.frexp(seconds * 1e6 * (1 - 1e-12))[1],
+                self.BUCKET_COUNT - 1)
+        else:
+            index = 0
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+
+    @property
+    def mean(self):
+        """
+        The mean lifetime, in seconds, or 0.0 if there are no lifetimes.
+        """
+        return self.total_seconds / self.count if self.count else 0.0
+
+    @staticmethod
+    def bucket_bound(index):
+        """
+        Returns the upper bound, in seconds, of the bucket with the given
+        index.
+        """
+        return 2.0 ** index / 1e6
+
+    def percentile(self, percent):
+        """
+        Returns the upper bound, in seconds, of the bucket containing the
+        given percentile of the lifetimes (such as 50 for the median),
+        or 0.0 if there are no lifetimes.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(round(self.count * percent / 100.0, 9)))
+        seen = 0
+        for (index, count) in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(self.bucket_bound(index), self.max_seconds)
+        return self.max_seconds
+
+    def __repr__(self):
+        return ("<LifetimeHistogram count={} mean={:.6f}s p50={:.6f}s "
+            "p99={:.6f}s max={:.6f}s>".format(self.count, self.mean,
+            self.percentile(50), self.percentile(99), self.max_seconds))
+
+
+class LifetimeHistograms(object):
+    """
+    A destroyed callback that aggregates the lifetimes of the instances of
+    each class into a :class:`~fakeable.LifetimeHistogram`, keyed by the
+    fake name of the class, which is useful to find classes whose instances
+    are created and destroyed at a high rate and that may be worth pooling.
+
+    *Example*::
+
+        histograms = fakeable.LifetimeHistograms()
+        fakeable.add_destroyed_callback(histograms)
+        ...
+        for (name, histogram) in sorted(histograms.snapshot().items()):
+            print(name, histogram)
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        # reentrant, because finalizers run at arbitrary points, possibly
+        # while this lock is held by the same thread
+        self._lock = threading.RLock()
+        _FORK_HANDLERS.add(self)
+
+    def after_fork_in_child(self, clear_caches):
+        """
+        Invoked in the child process after a fork: the lock may have been
+        held by a thread that does not exist in the child.
+        """
+        self._lock = threading.RLock()
+
+    def __call__(self, name, obj_type, lifetime):
+        with self._lock:
+            try:
+                histogram = self.histograms[name]
+            except KeyError:
+                histogram = self.histograms[name] = LifetimeHistogram()
+            histogram.add(lifetime)
+
+    def __getitem__(self, name):
+        """
+        Returns a copy of the histogram of the class with the given name,
+        raising :exc:`KeyError` if no instance of it was destroyed.
+        """
+        import copy
+        with self._lock:
+            return copy.deepcopy(self.histograms[name])
+
+    def snapshot(self):
+        """
+        Returns a dict that maps names to copies of their histograms.
+        """
+        import copy
+        with self._lock:
+            return copy.deepcopy(self.histograms)
+
+    def clear(self):
+        """
+        Discards all collected lifetimes.
+        """
+        with self._lock:
+            self.histograms = {}
+
+
+CreationEvent = collections.namedtuple("CreationEvent",
+    ["timestamp", "name", "cls", "thread", "id"])
+
+
+class CreationLog(object):
+    """
+    A created callback that appends a record of each creation of an
+    instance of a :class:`~fakeable.Fakeable` class to a binary log file,
+    for post-mortem analysis of object churn; read it back with
+    :func:`~fakeable.read_creation_log`.
+
+    Each record holds the time (as returned by ``time.time()``), the
+    ``__FAKE_NAME__`` and the ``"module:QualifiedName"`` of the class, the
+    identifier of the creating thread (as returned by
+    ``threading.get_ident()``) and, if *record_ids* is True, the ``id()`` of
+    the created object.  Records are buffered in memory and written once
+    *buffer_size* bytes are buffered, when :meth:`flush` is invoked, when
+    the log is closed and when the interpreter exits.  When writing a batch
+    of records would make the file larger than *max_bytes*, the file is
+    first renamed by appending ``.1`` to its name, existing backups are
+    renamed from ``.1`` to ``.2`` and so on, and backups beyond *backups*
+    are deleted.
+
+    *Example*::
+
+        log = fakeable.CreationLog("/var/log/myapp/creations.log")
+        fakeable.add_created_callback(log)
+        ...
+        fakeable.remove_created_callback(log)
+        log.close()
+
+    In a child process created by ``os.fork()``, the log stops writing
+    records, and discards those buffered by the parent, so that the file is
+    not corrupted by two processes writing to it.
+    """
+
+    MAGIC = b"FAKELOG1"
+    # record length, timestamp, thread, id, length of name, length of class
+    HEADER = struct.Struct("<IdQQHH")
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, backups=5,
+            record_ids=False, buffer_size=64 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.record_ids = record_ids
+        self.buffer_size = buffer_size
+        self._buffer = bytearray()
+        self._class_names = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self._closed = False
+        self._open()
+        # the buffered records are written when the interpreter exits; the
+        # finalizer must not keep the log alive, so it only has a weakref
+        self._finalizer = weakref.finalize(self, _flush_creation_log,
+            weakref.ref(self))
+        _FORK_HANDLERS.add(self)
+
+    def after_fork_in_child(self, clear_caches):
+        self._lock = threading.Lock()
+        self._closed = True
+        self._buffer = bytearray()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open(self):
+        self._file = io.FileIO(self.path, "ab")
+        self._size = os.fstat(self._file.fileno()).st_size
+        if self._size == 0:
+            self._file.write(self.MAGIC)
+            self._size = len(self.MAGIC)
+
+    def __call__(self, name, obj, obj_type):
+        try:
+            class_name = self._class_names[obj_type]
+        except (KeyError, TypeError):
+            class_name = "{}:{}".format(obj_type.__module__,
+                obj_type.__qualname__).encode("utf8")[:0xffff]
+            try:
+                self._class_names[obj_type] = class_name
+            except TypeError:
+                pass
+        name = (name if isinstance(name, str) else repr(name)).encode(
+            "utf8")[:0xffff]
+        header = self.HEADER.pack(
+            self.HEADER.size + len(name) + len(class_name), time.time(),
+            threading.get_ident(), id(obj) if self.record_ids else 0,
+            len(name), len(class_name))
+        with self._lock:
+            if self._closed:
+                return
+            buffer = self._buffer
+            buffer += header
+            buffer += name
+            buffer += class_name
+            if len(buffer) >= self.buffer_size:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        buffer = self._buffer
+        if not buffer:
+            return
+        if self._size + len(buffer) > self.max_bytes and self._size > len(
+                self.MAGIC):
+            self._rotate_locked()
+        self._file.write(buffer)
+        self._size += len(buffer)
+        self._buffer = bytearray()
+
+    def _rotate_locked(self):
+        self._file.close()
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                source = "{}.{}".format(self.path, i)
+                if os.path.exists(source):
+                    os.replace(source, "{}.{}".format(self.path, i + 1))
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def flush(self):
+        """
+        Writes the buffered records to the file.
+        """
+        with self._lock:
+            if not self._closed:
+                self._flush_locked()
+
+    def close(self):
+        """
+        Writes the buffered records and closes the file; records of
+        creations after this method is invoked are discarded.
+        """
+        self._finalizer.detach()
+        with self._lock:
+            if self._closed:
+                return
+            self._flush_locked()
+            self._closed = True
+            self._file.close()
+            self._file = None
+
+
+def _flush_creation_log(log_ref):
+    # the finalizer of a CreationLog, which is invoked when the interpreter
+    # exits; the log is already gone if it was garbage collected
+    log = log_ref()
+    if log is not None:
+        log.flush()
+
+
+def read_creation_log(path, rotated=False):
+    """
+    Iterates over the records of a log written by
+    :class:`~fakeable.CreationLog`, yielding a
+    :class:`~fakeable.CreationEvent` for each, whose ``cls`` is the
+    ``"module:QualifiedName"`` of the class and whose ``id`` is None unless
+    ids were recorded.  The file is memory-mapped, so large logs are read
+    without loading them into memory.  A truncated last record, such as one
+    left by a crash, is ignored.  If *rotated* is True then the records of
+    the backups created by rotation are yielded first, oldest first.
+    """
+    paths = [path]
+    if rotated:
+        i = 1
+        while os.path.exists("{}.{}".format(path, i)):
+            paths.insert(0, "{}.{}".format(path, i))
+            i += 1
+    for log_path in paths:
+        for event in _read_creation_log_file(log_path):
+            yield event
+
+
+def _read_creation_log_file(path):
+    import mmap
+    header = CreationLog.HEADER
+    with io.open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= len(CreationLog.MAGIC):
+            return
+        with contextlib.closing(mmap.mmap(f.fileno(), 0,
+                access=mmap.ACCESS_READ)) as data:
+            if data[:len(CreationLog.MAGIC)] != CreationLog.MAGIC:
+                raise ValueError("not a creation log: {}".format(path))
+            offset = len(CreationLog.MAGIC)
+            names = {}
+            while offset + header.size <= size:
+                (length, timestamp, thread, object_id, name_length,
+                    class_length) = header.unpack_from(data, offset)
+                # a truncated record, or a corrupted or zero-filled tail,
+                # such as after a crash, ends the log
+                if (length < header.size + name_length + class_length
+                        or offset + length > size):
+                    break
+                start = offset + header.size
+                name = data[start:start + name_length]
+                class_name = data[start + name_length:
+                    start + name_length + class_length]
+                # share the decoded strings between the records
+                try:
+                    name = names[name]
+                except KeyError:
+                    name = names[name] = name.decode("utf8", "replace")
+                try:
+                    class_name = names[class_name]
+                except KeyError:
+                    class_name = names[class_name] = class_name.decode(
+                        "utf8", "replace")
+                yield CreationEvent(timestamp, name, class_name, thread,
+                    object_id or None)
+                offset += length
+
+
+Creation = collections.namedtuple("Creation", ["name", "obj", "obj_type"])
+
+
+class WatchClosedError(Exception):
+    """
+    Raised by :meth:`Watch.get` and :meth:`Watch.aget` when the watch is
+    closed and all of the queued creations have been consumed.
+    """
+
+
+class Watch(object):
+    """
+    A subscription to the creations of the instances of one Fakeable class,
+    as returned from :func:`~fakeable.watch`, which can be iterated over
+    both synchronously and asynchronously.  Each creation is reported as a
+    :class:`~fakeable.Creation` with the fake name, the created object and
+    the class.
+    """
+
+    def __init__(self, fake_factory, name, maxsize=1024,
+            overflow="drop_oldest"):
+        if overflow not in ("drop_oldest", "drop", "block"):
+            raise ValueError("invalid overflow: {!r} (expected "
+                "\"drop_oldest\", \"drop\" or \"block\")".format(overflow))
+        if maxsize < 1:
+            raise ValueError("invalid maxsize: {!r}".format(maxsize))
+        self.fake_factory = fake_factory
+        self.name = name
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropped = 0
+        self.closed = False
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        # (loop, future) pairs of the coroutines waiting for a creation
+        self._async_waiters = []
+        _FORK_HANDLERS.add(self)
+
+    def after_fork_in_child(self, clear_caches):
+        """
+        Invoked in the child process after a fork: the condition may have
+        been held by a thread that does not exist in the child, and neither
+        do the event loops of the waiting coroutines.
+        """
+        self._condition = threading.Condition()
+        self._async_waiters = []
+
+    def put(self, creation):
+        """
+        Adds a creation to the queue; invoked by the fake factory.
+        """
+        with self._condition:
+            if self.closed:
+                return
+            if len(self._queue) >= self.maxsize:
+                if self.overflow == "drop_oldest":
+                    self._queue.popleft()
+                    self.dropped += 1
+                # blocking the thread of an event loop could deadlock with a
+                # consumer running on that loop, so creations are dropped
+                elif self.overflow == "drop" or _running_loop() is not None:
+                    self.dropped += 1
+                    return
+                while len(self._queue) >= self.maxsize and not self.closed:
+                    self._condition.wait()
+                if self.closed:
+                    return
+            self._queue.append(creation)
+            self._condition.notify_all()
+            self._wake_async_waiters()
+
+    def _wake_async_waiters(self):
+        # must be invoked with self._condition held
+        for (loop, future) in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(_set_future_result, future)
+            except RuntimeError:
+                pass  # the loop was closed
+        self._async_waiters = []
+
+    def _pop(self):
+        # must be invoked with self._condition held and the queue non-empty
+        creation = self._queue.popleft()
+        self._condition.notify_all()
+        return creation
+
+    def get(self, timeout=None):
+        """
+        Returns the next :class:`~fakeable.Creation`, waiting for it if
+        necessary.  Raises :exc:`TimeoutError` if the timeout, in seconds,
+        expires, and :exc:`~fakeable.WatchClosedError` if the watch is
+        closed; iterating over the watch stops instead.
+        """
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: self._queue or self.closed, timeout):
+                raise TimeoutError("timed out waiting for an instance of {!r} "
+                    "to be created".format(self.name))
+            if not self._queue:
+                raise WatchClosedError("the watch of {!r} is closed".format(
+                    self.name))
+            return self._pop()
+
+    async def aget(self, timeout=None):
+        """
+        The asynchronous version of :meth:`get`, which waits without blocking
+        the event loop.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            with self._condition:
+                if self._queue:
+                    return self._pop()
+                if self.closed:
+                    raise WatchClosedError("the watch of {!r} is closed"
+                        .format(self.name))
+                future = loop.create_future()
+                waiter = (loop, future)
+                self._async_waiters.append(waiter)
+            remaining = None if deadline is None else deadline - loop.time()
+            try:
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                with self._condition:
+                    if self._queue:
+                        return self._pop()
+                raise TimeoutError("timed out waiting for an instance of {!r} "
+                    "to be created".format(self.name))
+            finally:
+                # a waiter that timed out or was cancelled must not pile up
+                # until the next creation
+                with self._condition:
+                    try:
+                        self._async_waiters.remove(waiter)
+                    except ValueError:
+                        pass
+
+    def wait_for(self, count, timeout=None):
+        """
+        Waits for *count* instances to be created and returns the list of
+        the created objects.  Raises :exc:`TimeoutError` if they are not all
+        created within *timeout* seconds in total, or if the watch is closed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        objects = []
+        while len(objects) < count:
+            remaining = (None if deadline is None
+                else max(0.0, deadline - time.monotonic()))
+            try:
+                objects.append(self.get(remaining).obj)
+            except WatchClosedError:
+                raise TimeoutError("the watch was closed")
+        return objects
+
+    async def await_count(self, count, timeout=None):
+        """
+        The asynchronous version of :meth:`wait_for`.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        objects = []
+        while len(objects) < count:
+            remaining = (None if deadline is None
+                else max(0.0, deadline - loop.time()))
+            try:
+                objects.append((await self.aget(remaining)).obj)
+            except WatchClosedError:
+                raise TimeoutError("the watch was closed")
+        return objects
+
+    def close(self):
+        """
+        Unsubscribes from the creations; iteration stops once the creations
+        already queued have been consumed.
+        """
+        self.fake_factory.unwatch(self)
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+            self._wake_async_waiters()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return self.get()
+        except WatchClosedError:
+            raise StopIteration
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.aget()
+        except WatchClosedError:
+            raise StopAsyncIteration
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class FakeEntry(object):
+    """
+    An entry in the fake factory.
+    This is an abstract base class, and must be subclassed and the get()
+    method overridden to be meaningful.
+
+    The simple entries, which may be registered by the tens of thousands,
+    use ``__slots__`` to keep them small; subclasses that do not declare
+    ``__slots__`` themselves get an instance ``__dict__`` as usual.
+    """
+
+    __slots__ = ("fake_factory", "name")
+
+    def __init__(self, fake_factory, name):
+        self.fake_factory = fake_factory
+        self.name = name
+
+    def unregister(self):
+        """
+        Invokes self.fake_factory.unset(self.name).
+        """
+        self.fake_factory.unset(self.name)
+
+    def get(self, *args, **kwargs):
+        """
+        Must be implemented by subclasses to get or create the fake object.
+        The given arguments are those that were specified to the class
+        constructor.
+        """
+        raise NotImplementedError("must be implemented by a subclass")
+
+    def spec_args(self):
+        """
+        Returns the arguments, after the fake factory and the name, with
+        which to create an equivalent entry in another process; see
+        :func:`~fakeable.registry_spec`.  The default implementation raises
+        :exc:`TypeError` and must be overridden by entries that support it.
+        """
+        raise TypeError("{} entries cannot be sent to other processes".format(
+            type(self).__name__))
+
+    def produces_fakes(self):
+        """
+        Returns whether the objects created by this entry are fakes, rather
+        than real instances of the class, possibly wrapped in a proxy; reported
+        to the tracer (see :func:`~fakeable.set_tracer`).  The default
+        implementation returns True.
+        """
+        return True
+
+    def close(self):
+        """
+        Releases the resources held by this entry, such as background threads
+        and files; invoked by the fake factory when the entry is unregistered
+        or replaced, unless a snapshot may still restore it.  The default
+        implementation does nothing.
+        """
+        pass
+
+    def create(self, cls, args, kwargs):
+        """
+        Creates the object to return in place of a new instance of the given
+        real class *cls*, whose constructor was given *args* and *kwargs*.
+        The default implementation simply returns ``self.get(*args, **kwargs)``
+        and only needs to be overridden by entries that need the real class.
+        """
+        return self.get(*args, **kwargs)
+
+    async def acreate(self, cls, args, kwargs):
+        """
+        The asynchronous version of create(), which is invoked when an
+        instance is created by :meth:`fakeable.Fakeable.acreate`.
+        The default implementation simply returns the result of create().
+        """
+        return self.create(cls, args, kwargs)
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.unregister()
+
+
+class FakeObjectEntry(FakeEntry):
+    """
+    An entry in the fake factory where a predefined object is returned when
+    instances of the class are created.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, fake_factory, name, value):
+        super(FakeObjectEntry, self).__init__(fake_factory, name)
+        self.value = value
+
+    def get(self, *args, **kwargs):
+        return self.value
+
+    def spec_args(self):
+        return (self.value,)
+
+
+class FakeClassEntry(FakeEntry):
+    """
+    An entry in the fake factory where instances of a different class are to be
+    created and returned when instances of the class are created.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, fake_factory, name, value):
+        super(FakeClassEntry, self).__init__(fake_factory, name)
+        self.value = value
+
+    def get(self, *args, **kwargs):
+        instance = self.value(*args, **kwargs)
+        return instance
+
+    def spec_args(self):
+        return (self.value,)
+
+
+class FakeFactoryEntry(FakeEntry):
+    """
+    An entry in the fake factory where a function is invoked to create the
+    object to return when instances of the class are created.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, fake_factory, name, value):
+        super(FakeFactoryEntry, self).__init__(fake_factory, name)
+        self.value = value
+
+    def get(self, *args, **kwargs):
+        instance = self.value(*args, **kwargs)
+        if _isawaitable(instance):
+            if isinstance(instance, types.CoroutineType):
+                instance.close()
+            raise TypeError("the factory for {!r} is asynchronous; create "
+                "instances with acreate() instead".format(self.name))
+        return instance
+
+    async def acreate(self, cls, args, kwargs):
+        instance = self.value(*args, **kwargs)
+        if _isawaitable(instance):
+            instance = await instance
+        return instance
+
+    def spec_args(self):
+        return (self.value,)
+
+
+class SequenceExhaustedError(AssertionError):
+    """
+    Raised when an instance of a class registered with
+    :func:`~fakeable.set_fake_sequence` is created after all of the items of
+    the sequence were handed out.
+    """
+
+
+class FakeSequenceEntry(FakeEntry):
+    """
+    An entry in the fake factory that hands out the items of a sequence, one
+    per created instance, as returned from
+    :func:`~fakeable.set_fake_sequence`.
+    """
+
+    EXHAUSTED_POLICIES = ("raise", "last", "real")
+
+    def __init__(self, fake_factory, name, items, cycle=False,
+            exhausted="raise"):
+        super(FakeSequenceEntry, self).__init__(fake_factory, name)
+        if exhausted not in self.EXHAUSTED_POLICIES:
+            raise ValueError("invalid exhausted: {!r} (expected one of {})"
+                .format(exhausted, ", ".join(self.EXHAUSTED_POLICIES)))
+        self.cycle = cycle
+        self.exhausted = exhausted
+        # the number of items handed out; next() of itertools.count() is
+        # atomic, so sequences are handed out without locking
+        self._counter = itertools.count()
+        if isinstance(items, collections.abc.Sequence):
+            self.items = items
+            self._iterator = None
+            self._lock = None
+        else:
+            # other iterables, such as generators, are consumed lazily and
+            # must be protected by a lock because generators cannot be
+            # resumed by two threads at once; the items are only kept if
+            # they are needed to cycle over them
+            self.items = [] if cycle else None
+            self._iterator = iter(items)
+            self._lock = threading.Lock()
+            self._end = None
+            _FORK_HANDLERS.add(self)
+        self._last = _NO_ITEM
+
+    def after_fork_in_child(self, clear_caches):
+        self._lock = threading.Lock()
+
+    def create(self, cls, args, kwargs):
+        if self._lock is None:
+            item = self._next_from_sequence()
+        else:
+            item = self._next_from_iterator()
+        if item is _NO_ITEM:
+            if self.exhausted == "real" and cls is not None:
+                return type.__call__(cls, *args, **kwargs)
+            raise SequenceExhaustedError("all of the items of the sequence of "
+                "fakes for {!r} were handed out".format(self.name))
+        if isinstance(item, BaseException) or (isinstance(item, type)
+                and issubclass(item, BaseException)):
+            raise item
+        return item
+
+    def get(self, *args, **kwargs):
+        return self.create(None, args, kwargs)
+
+    def _next_from_sequence(self):
+        items = self.items
+        index = next(self._counter)
+        count = len(items)
+        if index < count:
+            return items[index]
+        elif count == 0:
+            return _NO_ITEM
+        elif self.cycle:
+            return items[index % count]
+        elif self.exhausted == "last":
+            return items[-1]
+        return _NO_ITEM
+
+    def _next_from_iterator(self):
+        with self._lock:
+            index = next(self._counter)
+            if self._iterator is not None:
+                try:
+                    item = next(self._iterator)
+                except StopIteration:
+                    self._iterator = None
+                else:
+                    if self.cycle:
+                        self.items.append(item)
+                    self._last = item
+                    return item
+                # the first index past the end of the iterable
+                self._end = index
+            if self.cycle and self.items:
+                return self.items[(index - self._end) % len(self.items)]
+            elif self.exhausted == "last":
+                return self._last
+            return _NO_ITEM
+
+    def spec_args(self):
+        if self._lock is not None:
+            raise TypeError("sequence entries of iterators that are not "
+                "sequences cannot be sent to other processes")
+        return (self.items, self.cycle, self.exhausted)
+
+
+# marks the end of the items of a FakeSequenceEntry
+_NO_ITEM = object()
+
+
+class FakeSingletonEntry(FakeEntry):
+    """
+    An entry in the fake factory that lazily creates one fake object per
+    thread, asyncio task or context and returns it whenever an instance is
+    created in that scope, as returned from
+    :func:`~fakeable.set_fake_singleton`.
+
+    The ``created`` attribute counts the fake objects that were created.
+    """
+
+    SCOPES = ("thread", "task", "context")
+
+    def __init__(self, fake_factory, name, value, scope="thread"):
+        super(FakeSingletonEntry, self).__init__(fake_factory, name)
+        if scope not in self.SCOPES:
+            raise ValueError("invalid scope: {!r} (expected one of {})"
+                .format(scope, ", ".join(self.SCOPES)))
+        self.value = value
+        self.scope = scope
+        self.created = 0
+        # the fakes of the threads, and of code running outside of a task
+        # when scope is "task", live in a threading.local, which drops them
+        # when their thread ends; the fakes of the tasks are removed by a
+        # done callback when their task ends
+        self._local = threading.local()
+        self._tasks = {}
+        self._lock = threading.Lock()
+        if scope == "context":
+            import contextvars
+            self._var = contextvars.ContextVar(
+                "fakeable-singleton-{}".format(name))
+        _FORK_HANDLERS.add(self)
+
+    def after_fork_in_child(self, clear_caches):
+        self._lock = threading.Lock()
+        if clear_caches:
+            self._local = threading.local()
+            self._tasks.clear()
+            if self.scope == "context":
+                self._var = type(self._var)(self._var.name)
+
+    def get(self, *args, **kwargs):
+        return self._get(args, kwargs, False)
+
+    async def acreate(self, cls, args, kwargs):
+        instance = self._get(args, kwargs, True)
+        if _isawaitable(instance):
+            instance = await instance
+            self._set(instance)
+        return instance
+
+    def _get(self, args, kwargs, awaitable_ok):
+        if self.scope == "context":
+            instance = self._var.get(_NO_ITEM)
+        else:
+            task = self._current_task() if self.scope == "task" else None
+            if task is not None:
+                instance = self._tasks.get(task, _NO_ITEM)
+            else:
+                instance = getattr(self._local, "instance", _NO_ITEM)
+        if instance is not _NO_ITEM:
+            return instance
+        instance = self.value(*args, **kwargs)
+        if _isawaitable(instance):
+            if not awaitable_ok:
+                if isinstance(instance, types.CoroutineType):
+                    instance.close()
+                raise TypeError("the factory for {!r} is asynchronous; "
+                    "create instances with acreate() instead".format(
+                    self.name))
+            # acreate() stores the fake once the awaitable has completed
+            return instance
+        self._set(instance)
+        return instance
+
+    def _set(self, instance):
+        with self._lock:
+            self.created += 1
+        if self.scope == "context":
+            self._var.set(instance)
+            return
+        task = self._current_task() if self.scope == "task" else None
+        if task is None:
+            self._local.instance = instance
+        elif task not in self._tasks:
+            self._tasks[task] = instance
+            task.add_done_callback(self._task_done)
+
+    def _task_done(self, task):
+        self._tasks.pop(task, None)
+
+    @staticmethod
+    def _current_task():
+        # there cannot be a running task if asyncio was never imported
+        asyncio = sys.modules.get("asyncio")
+        if asyncio is None:
+            return None
+        try:
+            return asyncio.current_task()
+        except RuntimeError:
+            return None
+
+    def spec_args(self):
+        return (self.value, self.scope)
+
+
+# the code flag of generators decorated with types.coroutine()
+_CO_ITERABLE_COROUTINE = 0x100
+
+
+def _isawaitable(value):
+    # equivalent to inspect.isawaitable(), which is needed on every
+    # construction, without importing the slow inspect module
+    return (isinstance(value, collections.abc.Awaitable)
+        or (isinstance(value, types.GeneratorType)
+            and bool(value.gi_code.co_flags & _CO_ITERABLE_COROUTINE)))
+
+
+def _running_loop():
+    # returns the running event loop of this thread, or None; there cannot be
+    # one if asyncio was never imported, which avoids importing it
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is None:
+        return None
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+async def _await(awaitable):
+    return await awaitable
+
+
+class FakeWrapperEntry(FakeEntry):
+    """
+    An entry in the fake factory that creates an instance of either the real
+    class or a given fake class and then wraps it in a proxy object.
+    This is an abstract base class, and must be subclassed and the wrap()
+    method overridden to be meaningful.
+    """
+
+    def __init__(self, fake_factory, name, wrapped=None):
+        super(FakeWrapperEntry, self).__init__(fake_factory, name)
+        self.wrapped = wrapped
+
+    def get(self, *args, **kwargs):
+        if self.wrapped is None:
+            raise TypeError("{!r} wraps the real class, which is only known "
+                "when invoked via create()".format(self.name))
+        (wrap_args, wrap_kwargs) = self.wrap_args(args, kwargs)
+        instance = self.wrapped(*args, **kwargs)
+        return self.wrap(instance, wrap_args, wrap_kwargs)
+
+    def create(self, cls, args, kwargs):
+        (wrap_args, wrap_kwargs) = self.wrap_args(args, kwargs)
+        if self.wrapped is None:
+            instance = type.__call__(cls, *args, **kwargs)
+        else:
+            instance = self.wrapped(*args, **kwargs)
+        return self.wrap(instance, wrap_args, wrap_kwargs)
+
+    async def acreate(self, cls, args, kwargs):
+        # the instance completes its asynchronous setup before it is wrapped,
+        # so that the calls made by __ainit__() are not intercepted
+        (wrap_args, wrap_kwargs) = self.wrap_args(args, kwargs)
+        if self.wrapped is None:
+            instance = type.__call__(cls, *args, **kwargs)
+        else:
+            instance = self.wrapped(*args, **kwargs)
+        await _ainit(instance)
+        return self.wrap(instance, wrap_args, wrap_kwargs)
+
+    def produces_fakes(self):
+        return self.wrapped is not None
+
+    def wrap_args(self, args, kwargs):
+        """
+        Returns the ``(args, kwargs)`` tuple of constructor arguments to give
+        to wrap(), which is captured before the instance is created because
+        the constructor may modify them.  The default implementation returns
+        them unchanged.
+        """
+        return (args, kwargs)
+
+    def wrap(self, instance, args, kwargs):
+        """
+        Must be implemented by subclasses to return the object to use in
+        place of the given newly-created *instance*, which was created with
+        the given constructor arguments.
+        """
+        raise NotImplementedError("must be implemented by a subclass")
+
+
+class InstanceProxy(object):
+    """
+    A proxy for an instance created by a :class:`FakeWrapperEntry`.
+
+    Attribute reads and writes are forwarded to the wrapped instance, except
+    that public methods are first passed to wrap_method() so that subclasses
+    can intercept calls to them.  The ``__class__`` attribute reports that of
+    the wrapped instance so that ``isinstance()`` checks keep working.  Note
+    that special methods (such as ``__len__()``) are *not* forwarded because
+    Python looks them up on the type rather than on the instance.
+    """
+
+    def __init__(self, instance):
+        object.__setattr__(self, "_fakeable_instance", instance)
+
+    def wrap_method(self, name, method):
+        """
+        Returns the callable to return in place of the method of the wrapped
+        instance with the given name; this implementation returns the method
+        unmodified and may be overridden by subclasses.
+        """
+        return method
+
+    @property
+    def __class__(self):
+        return self._fakeable_instance.__class__
+
+    def __getattr__(self, name):
+        value = getattr(self._fakeable_instance, name)
+        if callable(value) and not name.startswith("_"):
+            value = self.wrap_method(name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        setattr(self._fakeable_instance, name, value)
+
+    def __delattr__(self, name):
+        delattr(self._fakeable_instance, name)
+
+    def __repr__(self):
+        return "<{} for {!r}>".format(
+            type(self).__name__, self._fakeable_instance)
+
+
+ShadowMismatch = collections.namedtuple(
+    "ShadowMismatch", ["method", "args", "kwargs", "real", "candidate"])
+
+
+class ShadowStats(object):
+    """
+    The statistics gathered by a :class:`FakeShadowEntry` for one method.
+
+    Attributes:
+        *calls* (int)
+            the number of calls that have been compared.
+        *mismatches* (int)
+            the number of calls whose candidate result differed from the real
+            result, or that raised an exception of a different type.
+        *candidate_errors* (int)
+            the number of calls where the candidate raised an exception that
+            the real instance did not.
+        *real_seconds* and *candidate_seconds* (float)
+            the total time spent in the real and candidate methods.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.mismatches = 0
+        self.candidate_errors = 0
+        self.real_seconds = 0.0
+        self.candidate_seconds = 0.0
+
+    @property
+    def speedup(self):
+        """
+        The ratio of the time spent in the real method to the time spent in
+        the candidate method; values greater than 1 mean that the candidate
+        is faster.  None if the candidate has not yet been timed.
+        """
+        if not self.candidate_seconds:
+            return None
+        return self.real_seconds / self.candidate_seconds
+
+    def __repr__(self):
+        return ("ShadowStats(calls={}, mismatches={}, candidate_errors={}, "
+            "real_seconds={:.6f}, candidate_seconds={:.6f})").format(
+            self.calls, self.mismatches, self.candidate_errors,
+            self.real_seconds, self.candidate_seconds)
+
+
+class FakeShadowEntry(FakeWrapperEntry):
+    """
+    An entry in the fake factory where real instances are returned but every
+    public method call is mirrored, on a background executor, to a "shadow"
+    instance of a candidate class created from the same constructor arguments.
+    See the module-level set_shadow_class() function for details.
+    """
+
+    MAX_MISMATCHES = 100
+
+    def __init__(self, fake_factory, name, candidate, executor=None,
+            compare=None, deep_copy=False):
+        super(FakeShadowEntry, self).__init__(fake_factory, name)
+        self.candidate = candidate
+        self.compare = operator.eq if compare is None else compare
+        self.deep_copy = deep_copy
+        self.stats = {}
+        self.mismatches = collections.deque(maxlen=self.MAX_MISMATCHES)
+        self.executor = executor
+        self._own_executor = executor is None
+        self._pending = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        _FORK_HANDLERS.add(self)
+
+    def after_fork_in_child(self, clear_caches):
+        """
+        Invoked in the child process after a fork: the worker threads of the
+        executor created by this entry do not exist in the child, so a new
+        executor is created when needed, and calls that were pending in the
+        parent are forgotten.
+        """
+        self._condition = threading.Condition()
+        self._pending = 0
+        if self._own_executor:
+            self.executor = None
+        if clear_caches:
+            self.stats = {}
+            self.mismatches.clear()
+
+    def wrap_args(self, args, kwargs):
+        if self.deep_copy:
+            return self.copy_args(args, kwargs)
+        return (args, kwargs)
+
+    @staticmethod
+    def copy_args(args, kwargs):
+        """
+        Returns a deep copy of the given ``(args, kwargs)``, so that the
+        candidate receives the arguments as they were before the real call
+        modified them; arguments that cannot be copied are returned as is.
+        """
+        import copy
+        try:
+            return copy.deepcopy((args, kwargs))
+        except Exception:
+            return (args, kwargs)
+
+    def wrap(self, instance, args, kwargs):
+        candidate_future = self._submit(self.candidate, *args, **kwargs)
+        if candidate_future is None:
+            return instance
+        return _ShadowProxy(instance, self, candidate_future)
+
+    def join(self, timeout=None):
+        """
+        Waits for all mirrored calls that have been submitted so far to
+        complete.  Returns True if they all completed or False if the given
+        timeout, in seconds, elapsed first.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._pending == 0, timeout)
+
+    def close(self, wait=True):
+        """
+        Stops mirroring calls and shuts down the executor, if it was created
+        by this entry.  Instances created afterwards are not shadowed, and
+        the calls to the methods of existing instances are no longer
+        mirrored.
+        """
+        with self._condition:
+            self._closed = True
+            executor = self.executor if self._own_executor else None
+            self.executor = None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            super(FakeShadowEntry, self).__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            self.close()
+
+    def _submit(self, func, *args, **kwargs):
+        # returns None, without submitting, once the entry is closed
+        with self._condition:
+            if self._closed:
+                return None
+            if self.executor is None:
+                # created on first use, and again in the child after a fork
+                import concurrent.futures
+                self.executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="fakeable-shadow")
+            executor = self.executor
+            self._pending += 1
+        try:
+            future = executor.submit(func, *args, **kwargs)
+        except BaseException:
+            self._task_done(None)
+            raise
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, _future):
+        with self._condition:
+            self._pending -= 1
+            if self._pending == 0:
+                self._condition.notify_all()
+
+    def _mirror(self, candidate_future, name, args, kwargs, real_result,
+            real_error, real_seconds):
+        try:
+            candidate = candidate_future.result()
+            method = getattr(candidate, name)
+            start = time.perf_counter()
+            try:
+                candidate_result = method(*args, **kwargs)
+            finally:
+                candidate_seconds = time.perf_counter() - start
+        except Exception as e:
+            candidate_result = None
+            candidate_error = e
+            candidate_seconds = 0.0
+        else:
+            candidate_error = None
+
+        if real_error is not None or candidate_error is not None:
+            mismatch = type(real_error) is not type(candidate_error)
+        else:
+            try:
+                mismatch = not self.compare(real_result, candidate_result)
+            except Exception as e:
+                candidate_error = e
+                mismatch = True
+
+        with self._condition:
+            try:
+                stats = self.stats[name]
+            except KeyError:
+                stats = self.stats[name] = ShadowStats()
+            stats.calls += 1
+            stats.real_seconds += real_seconds
+            stats.candidate_seconds += candidate_seconds
+            if candidate_error is not None and real_error is None:
+                stats.candidate_errors += 1
+            if mismatch:
+                stats.mismatches += 1
+                self.mismatches.append(ShadowMismatch(
+                    name, args, kwargs,
+                    real_result if real_error is None else real_error,
+                    candidate_result if candidate_error is None
+                    else candidate_error))
+
+
+class _ShadowProxy(InstanceProxy):
+    """
+    The proxy returned by FakeShadowEntry; it invokes the real methods and
+    mirrors each call to the shadow candidate instance.
+    """
+
+    def __init__(self, instance, entry, candidate_future):
+        super(_ShadowProxy, self).__init__(instance)
+        object.__setattr__(self, "_fakeable_entry", entry)
+        object.__setattr__(self, "_fakeable_candidate", candidate_future)
+
+    def wrap_method(self, name, method):
+        entry = self._fakeable_entry
+        candidate_future = self._fakeable_candidate
+
+        @functools.wraps(method)
+        def shadow_method(*args, **kwargs):
+            if entry._closed:
+                return method(*args, **kwargs)
+            if entry.deep_copy:
+                (mirror_args, mirror_kwargs) = entry.copy_args(args, kwargs)
+            else:
+                (mirror_args, mirror_kwargs) = (args, kwargs)
+            result = error = None
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except Exception as e:
+                error = e
+            real_seconds = time.perf_counter() - start
+            entry._submit(entry._mirror, candidate_future, name, mirror_args,
+                mirror_kwargs, result, error, real_seconds)
+            if error is not None:
+                raise error
+            return result
+
+        return shadow_method
+
+
+class FixedLatency(object):
+    """
+    A latency distribution for :func:`~fakeable.set_fake_latency` that always
+    produces the same number of seconds.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def sample(self, random):
+        """
+        Returns the latency, in seconds, to use for a call.
+        """
+        return self.seconds
+
+    def __repr__(self):
+        return "FixedLatency({!r})".format(self.seconds)
+
+
+class UniformLatency(object):
+    """
+    A latency distribution for :func:`~fakeable.set_fake_latency` that
+    produces a number of seconds uniformly distributed between *low* and
+    *high*.
+    """
+
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def sample(self, random):
+        """
+        Returns the latency, in seconds, to use for a call.
+        """
+        return random.uniform(self.low, self.high)
+
+    def __repr__(self):
+        return "UniformLatency({!r}, {!r})".format(self.low, self.high)
+
+
+class LognormalLatency(object):
+    """
+    A latency distribution for :func:`~fakeable.set_fake_latency` that
+    produces a log-normally distributed number of seconds, which is typical
+    of the latency of network services: most calls take about *median*
+    seconds but some calls take much longer.  The larger *sigma* is, the
+    longer the tail of the distribution.
+    """
+
+    def __init__(self, median, sigma):
+        self.median = median
+        self.sigma = sigma
+
+    def sample(self, random):
+        """
+        Returns the latency, in seconds, to use for a call.
+        """
+        return random.lognormvariate(math.log(self.median), self.sigma)
+
+    def __repr__(self):
+        return "LognormalLatency({!r}, {!r})".format(self.median, self.sigma)
+
+
+class FakeLatencyEntry(FakeWrapperEntry):
+    """
+    An entry in the fake factory that wraps instances of the real class, or a
+    fake class, such that their methods are delayed and sometimes fail.
+    See the module-level set_fake_latency() function for details.
+    """
+
+    def __init__(self, fake_factory, name, wrapped=None, latency=0.0,
+            error_rate=0.0, error=None, timeout=None, methods=None,
+            seed=None):
+        super(FakeLatencyEntry, self).__init__(fake_factory, name, wrapped)
+        if not hasattr(latency, "sample"):
+            latency = FixedLatency(latency)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error = ConnectionError if error is None else error
+        self.timeout = timeout
+        self.methods = None if methods is None else frozenset(methods)
+        self.seed = seed
+        import random
+        self.random = random.Random(seed)
+
+    def wrap(self, instance, args, kwargs):
+        return _LatencyProxy(instance, self)
+
+    def spec_args(self):
+        return (self.wrapped, self.latency, self.error_rate, self.error,
+            self.timeout, self.methods, self.seed)
+
+    def plan_call(self):
+        """
+        Decides the fate of the next call: returns a tuple (seconds, error)
+        where *seconds* is how long to delay the call and *error* is None if
+        the call is to proceed or the exception to raise after the delay.
+        """
+        seconds = self.latency.sample(self.random)
+        if self.timeout is not None and seconds >= self.timeout:
+            error = TimeoutError("injected timeout after {} seconds".format(
+                self.timeout))
+            return (self.timeout, error)
+        if self.error_rate and self.random.random() < self.error_rate:
+            error = self.error
+            if isinstance(error, type) and issubclass(error, BaseException):
+                error = error("injected fault")
+            elif not isinstance(error, BaseException):
+                error = error()
+            return (seconds, error)
+        return (seconds, None)
+
+
+class _LatencyProxy(InstanceProxy):
+    """
+    The proxy returned by FakeLatencyEntry; it delays each method call and
+    raises the injected faults.
+    """
+
+    def __init__(self, instance, entry):
+        super(_LatencyProxy, self).__init__(instance)
+        object.__setattr__(self, "_fakeable_entry", entry)
+
+    def wrap_method(self, name, method):
+        entry = self._fakeable_entry
+        if entry.methods is not None and name not in entry.methods:
+            return method
+
+        import inspect
+        if inspect.iscoroutinefunction(method):
+            import asyncio
+            @functools.wraps(method)
+            async def async_latency_method(*args, **kwargs):
+                (seconds, error) = entry.plan_call()
+                await asyncio.sleep(seconds)
+                if error is not None:
+                    raise error
+                return await method(*args, **kwargs)
+            return async_latency_method
+
+        @functools.wraps(method)
+        def latency_method(*args, **kwargs):
+            (seconds, error) = entry.plan_call()
+            time.sleep(seconds)
+            if error is not None:
+                raise error
+            return method(*args, **kwargs)
+        return latency_method
+
+
+def _hash_bytes(data):
+    import hashlib
+    digest = hashlib.blake2b(data, digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _hash_call(method, args, kwargs):
+    """
+    Returns a 64-bit hash of a method call that is stable between processes,
+    which is used to match up calls with those in cassettes and spies.
+    Equal arguments hash the same way; see _canonical_bytes().
+    """
+    import hashlib
+    hasher = hashlib.blake2b(digest_size=8)
+    _canonical_bytes(method, hasher.update, set())
+    _canonical_bytes(args, hasher.update, set())
+    _canonical_bytes(kwargs, hasher.update, set())
+    return int.from_bytes(hasher.digest(), "little")
+
+
+# matches the memory addresses in default repr() strings
+_ADDRESS = re.compile(r"\b0x[0-9a-fA-F]+\b")
+
+
+def _canonical_bytes(value, write, active):
+    """
+    Writes an encoding of the given value that does not depend on the
+    process: the items of sets and dicts are sorted by their encodings,
+    numbers that are equal, including bools, encode the same way, objects
+    whose repr() is the default are encoded by their class and attributes,
+    and memory addresses are removed from other reprs.  *active* holds the
+    ids of the containers being encoded, so that recursive containers
+    terminate.
+    """
+    value_type = type(value)
+    if value is None:
+        write(b"c" + repr(value).encode("ascii") + b";")
+    # True == 1 and 1 == 1.0, so bools and integral floats encode as ints
+    elif (value_type is int or value_type is bool
+            or (value_type is float and value.is_integer())):
+        write(b"i" + str(int(value)).encode("ascii") + b";")
+    elif value_type is float:
+        write(b"f" + repr(value).encode("ascii") + b";")
+    elif value_type is str:
+        data = value.encode("utf8", "surrogatepass")
+        write(b"s" + str(len(data)).encode("ascii") + b":" + data)
+    elif value_type is bytes or value_type is bytearray:
+        write(b"b" + str(len(value)).encode("ascii") + b":" + bytes(value))
+    elif id(value) in active:
+        write(b"r;")
+    elif isinstance(value, (tuple, list, dict, set, frozenset)):
+        active.add(id(value))
+        try:
+            if isinstance(value, (set, frozenset)):
+                items = sorted(_canonical_item(item, active)
+                    for item in value)
+                tag = b"S"
+            elif isinstance(value, dict):
+                items = sorted(_canonical_item(key, active)
+                    + _canonical_item(item, active)
+                    for (key, item) in value.items())
+                tag = b"D"
+            else:
+                items = [_canonical_item(item, active) for item in value]
+                tag = b"T" if isinstance(value, tuple) else b"L"
+        finally:
+            active.discard(id(value))
+        write(tag + str(len(items)).encode("ascii") + b":")
+        for item in items:
+            write(item)
+    else:
+        name = "{}.{}".format(value_type.__module__,
+            value_type.__qualname__).encode("utf8")
+        write(b"o" + str(len(name)).encode("ascii") + b":" + name)
+        attrs = getattr(value, "__dict__", None)
+        if value_type.__repr__ is object.__repr__ and attrs is not None:
+            active.add(id(value))
+            try:
+                _canonical_bytes(attrs, write, active)
+            finally:
+                active.discard(id(value))
+        else:
+            _canonical_bytes(_ADDRESS.sub("0x", repr(value)), write, active)
+
+
+def _canonical_item(value, active):
+    chunks = []
+    _canonical_bytes(value, chunks.append, active)
+    return b"".join(chunks)
+
+
+class ReplayError(AssertionError):
+    """
+    Exception raised by the objects created by a
+    :class:`~fakeable.FakeReplayEntry` when a call cannot be answered from
+    the cassette, such as if a call was not recorded or was made out of order.
+    """
+    pass
+
+
+class _Unpicklable(object):
+    """
+    Stored in a cassette in place of a result or exception that could not be
+    pickled when it was recorded.
+    """
+
+    def __init__(self, value):
+        self.description = repr(value)
+
+
+class _Cassette(object):
+    """
+    The on-disk format of cassettes, which consists of three files:
+
+    *path*
+        the magic bytes followed by the records, each of which is a 4-byte
+        length followed by a pickled tuple
+        (instance, method, args, kwargs, kind, value).
+    *path*.idx
+        one fixed-size record per cassette record, in the order recorded:
+        (offset, length, instance, method hash, call hash).
+    *path*.keys
+        the (call hash, record number) pairs, sorted, which is written when
+        recording is closed and is used to look up calls by their arguments.
+    """
+
+    MAGIC = b"FAKECAS2"
+    LENGTH = struct.Struct("<I")
+    INDEX_RECORD = struct.Struct("<QIIQQ")
+    KEY_RECORD = struct.Struct("<QI")
+
+    KIND_INIT = "init"
+    KIND_RETURN = "return"
+    KIND_RAISE = "raise"
+    KIND_ASYNC_RETURN = "async-return"
+    KIND_ASYNC_RAISE = "async-raise"
+
+    @staticmethod
+    def index_path(path):
+        return path + ".idx"
+
+    @staticmethod
+    def keys_path(path):
+        return path + ".keys"
+
+
+class FakeRecordingEntry(FakeWrapperEntry):
+    """
+    An entry in the fake factory that wraps instances of the real class, or a
+    fake class, and records every public method call and its result to a
+    cassette file.  See the module-level set_recording() function for
+    details.
+    """
+
+    def __init__(self, fake_factory, name, path, wrapped=None):
+        super(FakeRecordingEntry, self).__init__(fake_factory, name, wrapped)
+        self.path = os.fspath(path)
+        self._lock = threading.Lock()
+        self._data_file = None
+        self._index_file = None
+        self._keys = []
+        self._instance_count = 0
+        self._closed = False
+        self._forked = False
+        _FORK_HANDLERS.add(self)
+
+    def after_fork_in_child(self, clear_caches):
+        """
+        Invoked in the child process after a fork: recording stops in the
+        child so that it does not interleave records with the parent in the
+        same files, and objects created in the child are real objects.
+        """
+        self._lock = threading.Lock()
+        self._closed = True
+        self._forked = True
+        self._data_file = self._index_file = None
+
+    def wrap(self, instance, args, kwargs):
+        with self._lock:
+            if self._forked:
+                # a child process of the recording process; use real
+                # objects, without recording the calls made to them
+                return instance
+            if self._closed:
+                raise ValueError("recording to {} has been closed".format(
+                    self.path))
+            if self._data_file is None:
+                self._data_file = io.open(self.path, "wb")
+                self._data_file.write(_Cassette.MAGIC)
+                self._index_file = io.open(
+                    _Cassette.index_path(self.path), "wb")
+            number = self._instance_count
+            self._instance_count += 1
+        self.record(number, "__init__", args, kwargs, _Cassette.KIND_INIT,
+            None)
+        return _RecordingProxy(instance, self, number)
+
+    def record(self, instance, method, args, kwargs, kind, value):
+        """
+        Appends a record of a method call to the cassette.
+        """
+        import pickle
+        try:
+            data = pickle.dumps((instance, method, args, kwargs, kind, value),
+                protocol=4)
+        except Exception:
+            value = _Unpicklable(value)
+            try:
+                data = pickle.dumps((instance, method, args, kwargs, kind,
+                    value), protocol=4)
+            except Exception:
+                data = pickle.dumps((instance, method, _Unpicklable(args),
+                    _Unpicklable(kwargs), kind, value), protocol=4)
+        method_hash = _hash_bytes(method.encode("utf8"))
+        call_hash = _hash_call(method, args, kwargs)
+        with self._lock:
+            if self._closed:
+                return
+            offset = self._data_file.tell()
+            self._data_file.write(_Cassette.LENGTH.pack(len(data)))
+            self._data_file.write(data)
+            self._data_file.flush()
+            self._index_file.write(_Cassette.INDEX_RECORD.pack(
+                offset, len(data), instance, method_hash, call_hash))
+            self._index_file.flush()
+            self._keys.append((call_hash, len(self._keys)))
+
+    def close(self):
+        """
+        Finishes the cassette: writes the lookup table used to match calls
+        by their arguments and closes the files.  Calls made after this
+        method is invoked are not recorded.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._data_file is None:
+                return
+            self._data_file.close()
+            self._index_file.close()
+            self._keys.sort()
+            with io.open(_Cassette.keys_path(self.path), "wb") as f:
+                for key in self._keys:
+                    f.write(_Cassette.KEY_RECORD.pack(*key))
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            super(FakeRecordingEntry, self).__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            self.close()
+
+
+class _RecordingProxy(InstanceProxy):
+    """
+    The proxy returned by FakeRecordingEntry; it records each method call.
+    """
+
+    def __init__(self, instance, entry, number):
+        super(_RecordingProxy, self).__init__(instance)
+        object.__setattr__(self, "_fakeable_entry", entry)
+        object.__setattr__(self, "_fakeable_number", number)
+
+    def wrap_method(self, name, method):
+        entry = self._fakeable_entry
+        number = self._fakeable_number
+
+        import inspect
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_recording_method(*args, **kwargs):
+                try:
+                    result = await method(*args, **kwargs)
+                except Exception as e:
+                    entry.record(number, name, args, kwargs,
+                        _Cassette.KIND_ASYNC_RAISE, e)
+                    raise
+                entry.record(number, name, args, kwargs,
+                    _Cassette.KIND_ASYNC_RETURN, result)
+                return result
+            return async_recording_method
+
+        @functools.wraps(method)
+        def recording_method(*args, **kwargs):
+            try:
+                result = method(*args, **kwargs)
+            except Exception as e:
+                entry.record(number, name, args, kwargs,
+                    _Cassette.KIND_RAISE, e)
+                raise
+            entry.record(number, name, args, kwargs, _Cassette.KIND_RETURN,
+                result)
+            return result
+        return recording_method
+
+
+class FakeReplayEntry(FakeEntry):
+    """
+    An entry in the fake factory that creates objects that answer method
+    calls from a cassette written by a :class:`~fakeable.FakeRecordingEntry`.
+    See the module-level set_replay() function for details.
+    """
+
+    MATCH_MODES = ("strict", "ordered", "keyed")
+
+    def __init__(self, fake_factory, name, path, match="strict"):
+        super(FakeReplayEntry, self).__init__(fake_factory, name)
+        if match not in self.MATCH_MODES:
+            raise ValueError("invalid match: {!r} (expected one of {})".format(
+                match, ", ".join(self.MATCH_MODES)))
+        self.path = os.fspath(path)
+        self.match = match
+        self._lock = threading.Lock()
+        self._data = self._map(self.path)
+        if self._data[:len(_Cassette.MAGIC)] != _Cassette.MAGIC:
+            if self._data[:len(_Cassette.MAGIC) - 1] == _Cassette.MAGIC[:-1]:
+                raise ValueError("the cassette {} was recorded by an older "
+                    "version and must be recorded again".format(self.path))
+            raise ValueError("not a cassette: {}".format(self.path))
+        self._index = self._map(_Cassette.index_path(self.path))
+        self._count = len(self._index) // _Cassette.INDEX_RECORD.size
+        try:
+            self._keys = self._map(_Cassette.keys_path(self.path))
+        except (IOError, OSError):
+            # the recording was not closed; look up calls by their arguments
+            # using a table built by scanning the index instead
+            self._keys = None
+        self._keys_by_hash = None
+        # maps (instance, method hash) to the numbers of the records of the
+        # calls to that method of that instance; built on first use
+        self._calls_by_method = None
+        self._instance_count = 0
+        self._cursor = 0
+        self._cursors = {}
+        self._key_uses = {}
+        _FORK_HANDLERS.add(self)
+
+    def after_fork_in_child(self, clear_caches):
+        """
+        Invoked in the child process after a fork; the child continues to
+        replay from where the parent was at the time of the fork.
+        """
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _map(path):
+        import mmap
+        with io.open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self._count
+
+    def spec_args(self):
+        return (self.path, self.match)
+
+    def close(self):
+        """
+        Unmaps the cassette files; the objects created by this entry must not
+        be used afterwards.
+        """
+        for mapped in (self._data, self._index, self._keys):
+            # empty files are not mapped, and the keys may not exist
+            if mapped is not None and not isinstance(mapped, bytes):
+                mapped.close()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            super(FakeReplayEntry, self).__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            self.close()
+
+    def index_record(self, number):
+        """
+        Returns the index record of the record with the given number, a tuple
+        (offset, length, instance, method hash, call hash).
+        """
+        return _Cassette.INDEX_RECORD.unpack_from(
+            self._index, number * _Cassette.INDEX_RECORD.size)
+
+    def load(self, number):
+        """
+        Returns the record with the given number, a tuple
+        (instance, method, args, kwargs, kind, value).
+        """
+        (offset, length) = self.index_record(number)[:2]
+        start = offset + _Cassette.LENGTH.size
+        import pickle
+        return pickle.loads(self._data[start:start + length])
+
+    def get(self, *args, **kwargs):
+        return self.create(None, args, kwargs)
+
+    def create(self, cls, args, kwargs):
+        with self._lock:
+            number = self._instance_count
+            self._instance_count += 1
+            if self.match == "strict":
+                self._next_strict(number, "__init__", args, kwargs)
+        return _ReplayProxy(self, number, cls)
+
+    def replay(self, instance, method, args, kwargs):
+        """
+        Answers a call to the method with the given name of the replay object
+        with the given number.  Returns the recorded result or raises the
+        recorded exception.
+        """
+        with self._lock:
+            if self.match == "strict":
+                number = self._next_strict(instance, method, args, kwargs)
+            elif self.match == "ordered":
+                number = self._next_ordered(instance, method)
+            else:
+                number = self._next_keyed(method, args, kwargs)
+            record = self.load(number)
+
+        (kind, value) = record[4:]
+        if isinstance(value, _Unpicklable):
+            raise ReplayError("the outcome of {}() was not picklable when it "
+                "was recorded: {}".format(method, value.description))
+        if kind == _Cassette.KIND_RAISE:
+            raise value
+        elif kind == _Cassette.KIND_ASYNC_RETURN:
+            return self._async_outcome(value, None)
+        elif kind == _Cassette.KIND_ASYNC_RAISE:
+            return self._async_outcome(None, value)
+        return value
+
+    @staticmethod
+    async def _async_outcome(result, error):
+        if error is not None:
+            raise error
+        return result
+
+    def _next_strict(self, instance, method, args, kwargs):
+        number = self._cursor
+        if number >= self._count:
+            raise ReplayError("unexpected call to {}(): the cassette {} has "
+                "been exhausted".format(method, self.path))
+        (recorded_instance, _, recorded_call) = self.index_record(number)[2:]
+        if (recorded_instance != instance
+                or recorded_call != _hash_call(method, args, kwargs)):
+            record = self.load(number)
+            raise ReplayError("unexpected call to {}() of instance {} with "
+                "args={!r} kwargs={!r}; the cassette expected a call to {}() "
+                "of instance {} with args={!r} kwargs={!r}".format(
+                method, instance, args, kwargs, record[1], record[0],
+                record[2], record[3]))
+        self._cursor += 1
+        return number
+
+    def _next_ordered(self, instance, method):
+        if self._calls_by_method is None:
+            # a single pass over the fixed-size index records, without
+            # unpickling any records
+            self._calls_by_method = {}
+            for number in range(self._count):
+                key = tuple(self.index_record(number)[2:4])
+                self._calls_by_method.setdefault(key, []).append(number)
+        numbers = self._calls_by_method.get(
+            (instance, _hash_bytes(method.encode("utf8"))), ())
+        position = self._cursors.get((instance, method), 0)
+        while position < len(numbers):
+            number = numbers[position]
+            position += 1
+            # skip the calls to other methods whose names hash the same way
+            if self.load(number)[1] == method:
+                self._cursors[(instance, method)] = position
+                return number
+        raise ReplayError("unexpected call to {}() of instance {}: no more "
+            "calls to it were recorded in {}".format(
+            method, instance, self.path))
+
+    def _next_keyed(self, method, args, kwargs):
+        call_hash = _hash_call(method, args, kwargs)
+        numbers = [number for number in self._numbers_with_hash(call_hash)
+            if self.load(number)[1] == method]
+        if not numbers:
+            raise ReplayError("unexpected call to {}() with args={!r} "
+                "kwargs={!r}: no such call was recorded in {}".format(
+                method, args, kwargs, self.path))
+        uses = self._key_uses.get(call_hash, 0)
+        self._key_uses[call_hash] = uses + 1
+        return numbers[min(uses, len(numbers) - 1)]
+
+    def _numbers_with_hash(self, call_hash):
+        if self._keys is None:
+            if self._keys_by_hash is None:
+                self._keys_by_hash = {}
+                for number in range(self._count):
+                    key = self.index_record(number)[4]
+                    self._keys_by_hash.setdefault(key, []).append(number)
+            return self._keys_by_hash.get(call_hash, [])
+
+        # binary search for the first key record with the given hash in the
+        # sorted, memory-mapped keys file
+        size = _Cassette.KEY_RECORD.size
+        unpack_from = _Cassette.KEY_RECORD.unpack_from
+        low = 0
+        high = len(self._keys) // size
+        while low < high:
+            middle = (low + high) // 2
+            if unpack_from(self._keys, middle * size)[0] < call_hash:
+                low = middle + 1
+            else:
+                high = middle
+        numbers = []
+        while low < len(self._keys) // size:
+            (key, number) = unpack_from(self._keys, low * size)
+            if key != call_hash:
+                break
+            numbers.append(number)
+            low += 1
+        return numbers
+
+
+class _ReplayProxy(object):
+    """
+    The object created by FakeReplayEntry; every public attribute is a
+    function that answers calls from the cassette.
+    """
+
+    def __init__(self, entry, number, cls):
+        object.__setattr__(self, "_fakeable_entry", entry)
+        object.__setattr__(self, "_fakeable_number", number)
+        object.__setattr__(self, "_fakeable_class", cls)
+
+    @property
+    def __class__(self):
+        cls = self._fakeable_class
+        return type(self) if cls is None else cls
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        entry = self._fakeable_entry
+        number = self._fakeable_number
+
+        def replay_method(*args, **kwargs):
+            return entry.replay(number, name, args, kwargs)
+        replay_method.__name__ = str(name)
+        return replay_method
+
+    def __repr__(self):
+        return "<_ReplayProxy {} of {}>".format(
+            self._fakeable_number, self._fakeable_entry.path)
+
+
+SpyCall = collections.namedtuple("SpyCall", ["instance", "method",
+    "args_hash", "timestamp", "duration", "raised", "args", "kwargs"])
+
+
+class FakeSpyEntry(FakeWrapperEntry):
+    """
+    An entry in the fake factory that wraps instances of the real class, or a
+    fake class, and records a compact summary of each public method call in
+    fixed-size columnar buffers.  See the module-level set_spy() function
+    for details.
+    """
+
+    # the number of bytes used by the buffers per call, and the additional
+    # bytes used for the hash of the arguments if they are captured
+    ROW_SIZE = 8 + 4 + 8 + 8 + 1
+    ARGS_ROW_SIZE = 8
+
+    def __init__(self, fake_factory, name, wrapped=None, capacity=65536,
+            capture_args=False):
+        super(FakeSpyEntry, self).__init__(fake_factory, name, wrapped)
+        if capacity < 1:
+            raise ValueError("invalid capacity: {!r}".format(capacity))
+        self.capacity = capacity
+        self.capture_args = capture_args
+        self._lock = threading.Lock()
+        self._method_names = []
+        self._method_ids = {}
+        self._instance_count = 0
+        self.clear()
+        _FORK_HANDLERS.add(self)
+
+    def after_fork_in_child(self, clear_caches):
+        """
+        Invoked in the child process after a fork; the calls recorded in the
+        parent are discarded if *clear_caches* is True.
+        """
+        self._lock = threading.Lock()
+        if clear_caches:
+            self.clear()
+
+    def clear(self):
+        """
+        Discards all recorded calls.
+        """
+        import array
+        capacity = self.capacity
+        with self._lock:
+            self._instances = array.array("Q", [0]) * capacity
+            self._methods = array.array("I", [0]) * capacity
+            self._timestamps = array.array("d", [0.0]) * capacity
+            self._durations = array.array("d", [0.0]) * capacity
+            self._raised = array.array("B", [0]) * capacity
+            if self.capture_args:
+                self._args_hashes = array.array("Q", [0]) * capacity
+                self._args = [None] * capacity
+            else:
+                self._args_hashes = self._args = None
+            self._total = 0
+
+    @property
+    def total(self):
+        """
+        The number of calls recorded, including those that have since been
+        discarded to stay within the capacity.
+        """
+        return self._total
+
+    @property
+    def dropped(self):
+        """
+        The number of calls that have been discarded to stay within the
+        capacity.
+        """
+        return max(self._total - self.capacity, 0)
+
+    def __len__(self):
+        return min(self._total, self.capacity)
+
+    def wrap(self, instance, args, kwargs):
+        with self._lock:
+            number = self._instance_count
+            self._instance_count += 1
+        return _SpyProxy(instance, self, number)
+
+    def record(self, instance, method, args, kwargs, timestamp, duration,
+            raised):
+        """
+        Records a call to a method of one of the objects created by this
+        entry, overwriting the oldest call if the buffers are full.
+        """
+        # hashing the arguments is by far the most expensive part of
+        # recording a call, so it is only done if they are captured
+        if self.capture_args:
+            args_hash = _hash_call(method, args, kwargs)
+        with self._lock:
+            try:
+                method_id = self._method_ids[method]
+            except KeyError:
+                method_id = self._method_ids[method] = len(self._method_names)
+                self._method_names.append(method)
+            slot = self._total % self.capacity
+            self._total += 1
+            self._instances[slot] = instance
+            self._methods[slot] = method_id
+            self._timestamps[slot] = timestamp
+            self._durations[slot] = duration
+            self._raised[slot] = raised
+            if self._args is not None:
+                self._args_hashes[slot] = args_hash
+                self._args[slot] = (args, kwargs)
+
+    def filter(self, method=None, args=None, kwargs=None, instance=None):
+        """
+        Returns a list of :class:`~fakeable.SpyCall` objects, oldest first,
+        for the recorded calls that match all of the given criteria, each of
+        which is ignored if None.
+
+        Arguments:
+            *method* (string)
+                the name of the method that was called.
+            *args* (tuple) and *kwargs* (dict)
+                the arguments of the call, which are compared using the hash
+                that was recorded; at least one of them must be specified to
+                compare arguments, in which case the other defaults to being
+                empty, and *method* must also be specified.  Arguments can
+                only be compared if they are captured; see
+                :func:`~fakeable.set_spy`.
+            *instance* (int)
+                the number of the object whose method was called, where the
+                objects are numbered in the order that they were created.
+        """
+        args_hash = self._args_hash(method, args, kwargs)
+        with self._lock:
+            return [self._make_call(slot) for slot in self._find_slots(
+                method, args_hash, instance)]
+
+    def count(self, method=None, args=None, kwargs=None, instance=None):
+        """
+        Returns the number of recorded calls that match all of the given
+        criteria; see filter() for details.
+        """
+        args_hash = self._args_hash(method, args, kwargs)
+        with self._lock:
+            return len(self._find_slots(method, args_hash, instance))
+
+    def first(self, method=None, args=None, kwargs=None, instance=None):
+        """
+        Returns the :class:`~fakeable.SpyCall` for the oldest recorded call
+        that matches all of the given criteria, or None if there is no such
+        call; see filter() for details.
+        """
+        args_hash = self._args_hash(method, args, kwargs)
+        with self._lock:
+            for slot in self._find_slots(method, args_hash, instance, 1):
+                return self._make_call(slot)
+        return None
+
+    def _args_hash(self, method, args, kwargs):
+        if args is None and kwargs is None:
+            return None
+        if method is None:
+            raise TypeError("method must be specified to match arguments")
+        if not self.capture_args:
+            raise TypeError("arguments can only be matched if they are "
+                "captured; specify capture_args=True to set_spy()")
+        return _hash_call(method, tuple(args or ()), kwargs or {})
+
+    def _find_slots(self, method, args_hash, instance, limit=None):
+        # must be invoked with self._lock held
+        method_id = None
+        if method is not None:
+            method_id = self._method_ids.get(method)
+            if method_id is None:
+                return []
+        slots = []
+        total = self._total
+        for number in range(max(total - self.capacity, 0), total):
+            slot = number % self.capacity
+            if method_id is not None and self._methods[slot] != method_id:
+                continue
+            if args_hash is not None and self._args_hashes[slot] != args_hash:
+                continue
+            if instance is not None and self._instances[slot] != instance:
+                continue
+            slots.append(slot)
+            if len(slots) == limit:
+                break
+        return slots
+
+    def _make_call(self, slot):
+        if self._args is None:
+            (args_hash, args, kwargs) = (None, None, None)
+        else:
+            args_hash = self._args_hashes[slot]
+            (args, kwargs) = self._args[slot]
+        return SpyCall(self._instances[slot],
+            self._method_names[self._methods[slot]], args_hash,
+            self._timestamps[slot], self._durations[slot],
+            bool(self._raised[slot]), args, kwargs)
+
+
+class _SpyProxy(InstanceProxy):
+    """
+    The proxy returned by FakeSpyEntry; it records each method call.
+    """
+
+    def __init__(self, instance, entry, number):
+        super(_SpyProxy, self).__init__(instance)
+        object.__setattr__(self, "_fakeable_entry", entry)
+        object.__setattr__(self, "_fakeable_number", number)
+
+    def wrap_method(self, name, method):
+        entry = self._fakeable_entry
+        number = self._fakeable_number
+
+        import inspect
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_spy_method(*args, **kwargs):
+                timestamp = time.time()
+                start = time.perf_counter()
+                raised = True
+                try:
+                    result = await method(*args, **kwargs)
+                    raised = False
+                finally:
+                    entry.record(number, name, args, kwargs, timestamp,
+                        time.perf_counter() - start, raised)
+                return result
+            return async_spy_method
+
+        @functools.wraps(method)
+        def spy_method(*args, **kwargs):
+            timestamp = time.time()
+            start = time.perf_counter()
+            raised = True
+            try:
+                result = method(*args, **kwargs)
+                raised = False
+            finally:
+                entry.record(number, name, args, kwargs, timestamp,
+                    time.perf_counter() - start, raised)
+            return result
+        return spy_method
+
+
+def _run_callback_loop(loop):
+    # the target of the thread that runs the private event loop of the
+    # created callbacks; see FakeFactory.schedule_callback()
+    if not threading.current_thread().daemon:
+        def stop_once_main_thread_ended():
+            if _main_thread_ended():
+                loop.stop()
+            else:
+                loop.call_later(0.25, stop_once_main_thread_ended)
+        loop.call_soon(stop_once_main_thread_ended)
+    loop.run_forever()
+
+
+def _background_thread(target, name):
+    # returns a daemon thread, or a regular thread in subinterpreters that
+    # do not allow daemon threads; the target of a regular thread must
+    # return once the main thread has ended, see _main_thread_ended()
+    try:
+        return threading.Thread(target=target, name=name, daemon=True)
+    except RuntimeError:
+        return threading.Thread(target=target, name=name)
+
+
+def _main_thread_ended():
+    return not threading.main_thread().is_alive()
+
+
+class FakeWarmPoolEntry(FakeEntry):
+    """
+    An entry in the fake factory that hands out real instances of the class
+    *cls* that were created ahead of time by a background thread, as
+    returned from :func:`~fakeable.set_warm_pool`.
+
+    The ``hits`` and ``misses`` attributes count the instances that were
+    taken from the pool and those that had to be created on demand,
+    respectively.  If the background thread fails to create an instance then
+    the exception is stored in the ``error`` attribute and the pool is not
+    refilled until an instance is successfully created on demand.
+    """
+
+    def __init__(self, fake_factory, name, cls, size=4, args=(),
+            kwargs=None):
+        super(FakeWarmPoolEntry, self).__init__(fake_factory, name)
+        if size < 1:
+            raise ValueError("invalid size: {} (must be at least 1)".format(
+                size))
+        self.cls = cls
+        self.size = size
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs or {})
+        self.instances = collections.deque()
+        self.hits = 0
+        self.misses = 0
+        self.error = None
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = None
+        _FORK_HANDLERS.add(self)
+        self._start()
+
+    def after_fork_in_child(self, clear_caches):
+        """
+        Invoked in the child process after a fork: the background thread does
+        not exist in the child, so a new one is started when the pool is
+        first used.
+        """
+        self._condition = threading.Condition()
+        self._thread = None
+        if clear_caches:
+            self.instances.clear()
+
+    def _start(self):
+        # must be called with the condition held, or from __init__()
+        self._thread = _background_thread(self._refill,
+            "fakeable-pool-{}".format(self.cls.__name__))
+        self._thread.start()
+
+    def _refill(self):
+        condition = self._condition
+        # a thread that is not a daemon thread must notice that the main
+        # thread has ended, or the interpreter would wait for it forever
+        timeout = None if threading.current_thread().daemon else 0.25
+        while True:
+            with condition:
+                while not self._closed and (self.error is not None
+                        or len(self.instances) >= self.size):
+                    if not condition.wait(timeout) and _main_thread_ended():
+                        return
+                if self._closed:
+                    return
+            try:
+                instance = type.__call__(self.cls, *self.args, **self.kwargs)
+            except Exception as e:
+                with condition:
+                    self.error = e
+                    condition.notify_all()
+            else:
+                with condition:
+                    self.instances.append(instance)
+                    condition.notify_all()
+
+    def create(self, cls, args, kwargs):
+        if (cls is self.cls and self.args == args and self.kwargs == kwargs
+                and not self._closed):
+            with self._condition:
+                if self._thread is None:
+                    self._start()
+                try:
+                    instance = self.instances.popleft()
+                except IndexError:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    self._condition.notify_all()
+                    return instance
+            instance = type.__call__(cls, *args, **kwargs)
+            if self.error is not None:
+                with self._condition:
+                    self.error = None
+                    self._condition.notify_all()
+            return instance
+        return type.__call__(cls, *args, **kwargs)
+
+    async def acreate(self, cls, args, kwargs):
+        instance = self.create(cls, args, kwargs)
+        await _ainit(instance)
+        return instance
+
+    def get(self, *args, **kwargs):
+        return self.create(self.cls, args, kwargs)
+
+    def produces_fakes(self):
+        return False
+
+    def spec_args(self):
+        return (self.cls, self.size, self.args, self.kwargs)
+
+    def wait_until_full(self, timeout=None):
+        """
+        Waits for the pool to be filled, such as at startup before accepting
+        requests.  Returns True if the pool is full, or False if the timeout
+        expired or the background thread failed to create an instance.
+        """
+        def done():
+            return (self.error is not None or self._closed
+                or len(self.instances) >= self.size)
+        with self._condition:
+            self._condition.wait_for(done, timeout)
+            return len(self.instances) >= self.size and self.error is None
+
+    def close(self):
+        """
+        Stops the background thread and discards the pooled instances;
+        instances are created on demand afterwards.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.instances.clear()
+
+
+class InstanceLimitError(TimeoutError):
+    """
+    Raised when an instance of a class whose number of live instances is
+    limited by :func:`~fakeable.set_instance_limit` cannot be created
+    before the timeout expires.
+    """
+
+
+InstanceLimitStats = collections.namedtuple("InstanceLimitStats", [
+    "limit", "live", "peak", "acquired", "contended", "timeouts",
+    "wait_seconds", "max_wait_seconds"])
+
+
+class _LimitWaiter(object):
+    """
+    A thread or task waiting in _InstanceLimiter for an instance to be
+    released; wake() is invoked, with the limiter's lock held, once the
+    released slot has been handed over to it.
+    """
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+
+
+class _InstanceLimiter(object):
+    """
+    A counting semaphore that also supports acquisition from coroutines and
+    keeps contention statistics.  Released slots are handed directly to the
+    longest-waiting thread or task.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.live = 0
+        self.peak = 0
+        self.acquired = 0
+        self.contended = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        # reentrant, because a slot may be released by a weakref.finalize()
+        # callback at any time, such as while this lock is held
+        self._lock = threading.RLock()
+        self._waiters = collections.deque()
+
+    def _try_acquire_locked(self):
+        if self.live < self.limit and not self._waiters:
+            self.live += 1
+            self.acquired += 1
+            self.peak = max(self.peak, self.live)
+            return True
+        return False
+
+    def _acquired_after_wait_locked(self, start):
+        seconds = time.perf_counter() - start
+        self.acquired += 1
+        self.wait_seconds += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def _timed_out_locked(self, waiter):
+        self._waiters.remove(waiter)
+        self.timeouts += 1
+        return InstanceLimitError("timed out waiting for one of the {} "
+            "instances to be released".format(self.limit))
+
+    def acquire(self, timeout=None):
+        with self._lock:
+            if self._try_acquire_locked():
+                return
+            if timeout is not None and timeout <= 0:
+                self.contended += 1
+                self.timeouts += 1
+                raise InstanceLimitError("all {} instances are in use".format(
+                    self.limit))
+            event = threading.Event()
+            waiter = _LimitWaiter(event.set)
+            self._waiters.append(waiter)
+            self.contended += 1
+        start = time.perf_counter()
+        event.wait(timeout)
+        with self._lock:
+            if not waiter.granted:
+                raise self._timed_out_locked(waiter)
+            self._acquired_after_wait_locked(start)
+
+    async def acquire_async(self, timeout=None):
+        with self._lock:
+            if self._try_acquire_locked():
+                return
+            if timeout is not None and timeout <= 0:
+                self.contended += 1
+                self.timeouts += 1
+                raise InstanceLimitError("all {} instances are in use".format(
+                    self.limit))
+            import asyncio
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            def wake():
+                loop.call_soon_threadsafe(_set_future_result, future)
+            waiter = _LimitWaiter(wake)
+            self._waiters.append(waiter)
+            self.contended += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            # cancelled; give back the slot if it was handed over meanwhile
+            with self._lock:
+                if waiter.granted:
+                    self._release_locked()
+                else:
+                    self._waiters.remove(waiter)
+            raise
+        with self._lock:
+            if not waiter.granted:
+                raise self._timed_out_locked(waiter)
+            self._acquired_after_wait_locked(start)
+
+    def release(self):
+        with self._lock:
+            self._release_locked()
+
+    def _release_locked(self):
+        if self._waiters:
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            waiter.wake()
+        else:
+            self.live -= 1
+
+    def stats(self):
+        with self._lock:
+            return InstanceLimitStats(self.limit, self.live, self.peak,
+                self.acquired, self.contended, self.timeouts,
+                self.wait_seconds, self.max_wait_seconds)
+
+
+def _set_future_result(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _LimitPermit(object):
+    """
+    One slot of an _InstanceLimiter, which is released at most once: when
+    the instance is closed or when its proxy is garbage collected.
+    """
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.released = False
+
+    def release(self):
+        limiter = self.limiter
+        with limiter._lock:
+            if not self.released:
+                self.released = True
+                limiter._release_locked()
+
+
+class FakeLimitEntry(FakeWrapperEntry):
+    """
+    An entry in the fake factory that limits the number of live instances of
+    a class, as returned from :func:`~fakeable.set_instance_limit`.
+    """
+
+    def __init__(self, fake_factory, name, limit, wrapped=None, timeout=None):
+        super(FakeLimitEntry, self).__init__(fake_factory, name, wrapped)
+        if limit < 1:
+            raise ValueError("invalid limit: {} (must be at least 1)".format(
+                limit))
+        self.limit = limit
+        self.timeout = timeout
+        self.limiter = _InstanceLimiter(limit)
+        _FORK_HANDLERS.add(self)
+
+    def after_fork_in_child(self, clear_caches):
+        """
+        Invoked in the child process after a fork; the threads and tasks that
+        were waiting in the parent do not exist in the child.
+        """
+        self.limiter._lock = threading.RLock()
+        self.limiter._waiters.clear()
+
+    def get(self, *args, **kwargs):
+        if self.wrapped is None:
+            raise TypeError("{!r} wraps the real class, which is only known "
+                "when invoked via create()".format(self.name))
+        return self.create(None, args, kwargs)
+
+    def create(self, cls, args, kwargs):
+        self.limiter.acquire(self.timeout)
+        return self._create(cls, args, kwargs)
+
+    async def acreate(self, cls, args, kwargs):
+        await self.limiter.acquire_async(self.timeout)
+        proxy = self._create(cls, args, kwargs)
+        await _ainit(proxy)
+        return proxy
+
+    def _create(self, cls, args, kwargs):
+        # must be invoked with a slot acquired, which is released if the
+        # instance cannot be created
+        permit = _LimitPermit(self.limiter)
+        try:
+            if self.wrapped is None:
+                instance = type.__call__(cls, *args, **kwargs)
+            else:
+                instance = self.wrapped(*args, **kwargs)
+            proxy = _LimitProxy(instance, permit)
+            weakref.finalize(proxy, permit.release)
+        except BaseException:
+            permit.release()
+            raise
+        return proxy
+
+    def spec_args(self):
+        return (self.limit, self.wrapped, self.timeout)
+
+    def stats(self):
+        """
+        Returns an :class:`~fakeable.InstanceLimitStats` with the current
+        number of live instances and contention statistics.
+        """
+        return self.limiter.stats()
+
+
+class _LimitProxy(InstanceProxy):
+    """
+    The proxy returned by FakeLimitEntry; it releases its slot when the
+    instance is closed.
+    """
+
+    def __init__(self, instance, permit):
+        super(_LimitProxy, self).__init__(instance)
+        object.__setattr__(self, "_fakeable_permit", permit)
+
+    def wrap_method(self, name, method):
+        if name != "close":
+            return method
+        permit = self._fakeable_permit
+
+        import inspect
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_close(*args, **kwargs):
+                try:
+                    return await method(*args, **kwargs)
+                finally:
+                    permit.release()
+            return async_close
+
+        @functools.wraps(method)
+        def close(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            finally:
+                permit.release()
+        return close
+
+    def __enter__(self):
+        instance = self._fakeable_instance
+        result = type(instance).__enter__(instance)
+        return self if result is instance else result
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        instance = self._fakeable_instance
+        try:
+            return type(instance).__exit__(instance, exc_type, exc_val,
+                exc_tb)
+        finally:
+            self._fakeable_permit.release()
+
+    async def __aenter__(self):
+        instance = self._fakeable_instance
+        result = await type(instance).__aenter__(instance)
+        return self if result is instance else result
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        instance = self._fakeable_instance
+        try:
+            return await type(instance).__aexit__(instance, exc_type,
+                exc_val, exc_tb)
+        finally:
+            self._fakeable_permit.release()
+
+
+class _ImportRef(object):
+    """
+    A reference to a module-level object by its import path, of the form
+    ``"package.module:QualifiedName"``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def resolve(self):
+        return _resolve_import_path(self.path)
+
+    def __repr__(self):
+        return "_ImportRef({!r})".format(self.path)
+
+
+def _resolve_import_path(path):
+    """
+    Returns the object with the given import path, of the form
+    ``"package.module:QualifiedName"``, importing its module if necessary.
+    """
+    (module_name, _, qualname) = path.partition(":")
+    obj = importlib.import_module(module_name)
+    if qualname:
+        for attr in qualname.split("."):
+            obj = getattr(obj, attr)
+    return obj
+
+
+def _import_path(obj):
+    """
+    Returns the import path of the given class or function, or None if it
+    does not have one, such as classes defined inside functions.
+    """
+    module = getattr(obj, "__module__", None)
+    qualname = getattr(obj, "__qualname__", None)
+    if not module or not qualname or "<locals>" in qualname:
+        return None
+    path = "{}:{}".format(module, qualname)
+    try:
+        if _resolve_import_path(path) is obj:
+            return path
+    except Exception:
+        pass
+    return None
+
+
+def _to_spec_value(value):
+    import inspect
+    if isinstance(value, type) or inspect.isroutine(value):
+        path = _import_path(value)
+        if path is not None:
+            return _ImportRef(path)
+    return value
+
+
+def _from_spec_value(value):
+    if isinstance(value, _ImportRef):
+        return value.resolve()
+    return value
+
+
+class RegistrySpec(object):
+    """
+    A picklable description of the fakes registered in a
+    :class:`FakeFactory`, as returned from :func:`~fakeable.registry_spec`.
+
+    The entries are pickled only once, when the spec is created, and the
+    resulting bytes are reused each time that the spec itself is pickled.
+    """
+
+    def __init__(self, payload):
+        import hashlib
+        self.payload = payload
+        self.digest = hashlib.sha1(payload).hexdigest()
+
+    def __reduce__(self):
+        return (RegistrySpec, (self.payload,))
+
+    @classmethod
+    def from_entries(cls, entries, factories=None):
+        """
+        Creates a spec describing the given entries.  *factories* optionally
+        maps names to functions that create the fake objects of object
+        entries in the other processes, instead of pickling them.
+        """
+        import pickle
+        items = []
+        for entry in entries:
+            name = _to_spec_value(entry.name)
+            if factories is not None and entry.name in factories:
+                entry_type = _to_spec_value(FakeObjectEntry)
+                factory = _to_spec_value(factories[entry.name])
+                args = (_RebuildRef(factory),)
+            else:
+                entry_type = _to_spec_value(type(entry))
+                args = tuple(_to_spec_value(x) for x in entry.spec_args())
+            try:
+                data = pickle.dumps((name, entry_type, args), protocol=4)
+            except Exception as e:
+                raise TypeError("the fake registered for {!r} cannot be sent "
+                    "to other processes: {}".format(entry.name, e))
+            items.append(data)
+        return cls(pickle.dumps(items, protocol=4))
+
+    def create_entries(self, fake_factory):
+        """
+        Creates and returns the entries described by this spec for the given
+        fake factory, importing the classes and functions that they refer to.
+        """
+        import pickle
+        entries = []
+        for data in pickle.loads(self.payload):
+            (name, entry_type, args) = pickle.loads(data)
+            name = _from_spec_value(name)
+            entry_type = _from_spec_value(entry_type)
+            args = [_from_spec_value(x) for x in args]
+            if args and isinstance(args[0], _RebuildRef):
+                args[0] = _from_spec_value(args[0].factory)()
+            entries.append(entry_type(fake_factory, name, *args))
+        return entries
+
+
+class _RebuildRef(object):
+    """
+    Used in a RegistrySpec in place of a fake object that is to be created
+    by invoking a factory in the other process.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+
+
+def _install_registry_spec(spec, initializer=None, initargs=()):
+    """
+    The initializer of the worker processes configured by
+    process_pool_kwargs().
+    """
+    install_registry_spec(spec)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+class FakeLazyEntry(FakeEntry):
+    """
+    An entry in the fake factory loaded by :func:`~fakeable.load_config`.
+    The object at the import path *target* is imported, and the entry of type
+    *entry_type* (such as ``"class"`` or ``"spy"``) that it describes is
+    created, only when the first instance of the class is created.
+    Attributes not found on this entry, such as :meth:`FakeSpyEntry.count`,
+    are looked up on that entry.
+    """
+
+    def __init__(self, fake_factory, name, entry_type, target, options):
+        super(FakeLazyEntry, self).__init__(fake_factory, name)
+        self.entry_type = entry_type
+        self.target = target
+        self.options = options
+        self.entry = None
+        self._lock = threading.Lock()
+        _FORK_HANDLERS.add(self)
+
+    def after_fork_in_child(self, clear_caches):
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        """
+        Imports the target and creates the entry, if not already done, and
+        returns it.
+        """
+        entry = self.entry
+        if entry is None:
+            with self._lock:
+                entry = self.entry
+                if entry is None:
+                    (entry_class, target_arg) = \
+                        _CONFIG_ENTRY_TYPES[self.entry_type]
+                    kwargs = dict(self.options)
+                    if self.target is not None:
+                        kwargs[target_arg] = _resolve_import_path(self.target)
+                    entry = entry_class(self.fake_factory, self.name,
+                        **kwargs)
+                    self.entry = entry
+        return entry
+
+    def get(self, *args, **kwargs):
+        return self.resolve().get(*args, **kwargs)
+
+    def create(self, cls, args, kwargs):
+        return self.resolve().create(cls, args, kwargs)
+
+    async def acreate(self, cls, args, kwargs):
+        return await self.resolve().acreate(cls, args, kwargs)
+
+    def produces_fakes(self):
+        return self.resolve().produces_fakes()
+
+    def spec_args(self):
+        # sent unresolved, so that worker processes import lazily too
+        return (self.entry_type, self.target, self.options)
+
+    def close(self):
+        """
+        Closes the created entry if it has a close() method, such as that of
+        a recording; does nothing if the entry was not created yet, and does
+        not import the target.
+        """
+        entry = self.entry
+        if entry is not None and hasattr(entry, "close"):
+            entry.close()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            super(FakeLazyEntry, self).__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            self.close()
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
+
+
+# maps the entry types of configuration files to the entry class and the name
+# of its argument that is given the object imported from the target
+_CONFIG_ENTRY_TYPES = {
+    "class": (FakeClassEntry, "value"),
+    "object": (FakeObjectEntry, "value"),
+    "factory": (FakeFactoryEntry, "value"),
+    "sequence": (FakeSequenceEntry, "items"),
+    "singleton": (FakeSingletonEntry, "value"),
+    "shadow": (FakeShadowEntry, "candidate"),
+    "latency": (FakeLatencyEntry, "wrapped"),
+    "recording": (FakeRecordingEntry, "wrapped"),
+    "replay": (FakeReplayEntry, None),
+    "spy": (FakeSpyEntry, "wrapped"),
+    "pool": (FakeWarmPoolEntry, "cls"),
+    "limit": (FakeLimitEntry, "wrapped"),
+}
+
+
+class _ConfigCache(object):
+    """
+    The file in which load_config() caches the validated contents of a
+    configuration file: a magic number, the fingerprint of the configuration
+    file and the pickled entries.
+    """
+
+    MAGIC = b"FAKECFG1"
+    FINGERPRINT_SIZE = 32
+
+    @staticmethod
+    def fingerprint(data):
+        import hashlib
+        digest = hashlib.blake2b(digest_size=_ConfigCache.FINGERPRINT_SIZE)
+        digest.update(__version__.encode("utf8"))
+        digest.update(b"\0")
+        digest.update(data)
+        return digest.digest()
+
+    @staticmethod
+    def read(path, fingerprint):
+        import pickle
+        try:
+            with io.open(path, "rb") as f:
+                header = f.read(len(_ConfigCache.MAGIC)
+                    + _ConfigCache.FINGERPRINT_SIZE)
+                if header != _ConfigCache.MAGIC + fingerprint:
+                    return None
+                return pickle.load(f)
+        except Exception:
+            # a missing, stale or corrupted cache is simply rebuilt
+            return None
+
+    @staticmethod
+    def write(path, fingerprint, items):
+        import pickle
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with io.open(temp_path, "wb") as f:
+                f.write(_ConfigCache.MAGIC)
+                f.write(fingerprint)
+                pickle.dump(items, f, protocol=4)
+            os.replace(temp_path, path)
+        except OSError:
+            # the cache is only an optimization; a read-only directory must
+            # not prevent the configuration from being loaded
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+def _load_config_items(path, cache_path=None):
+    """
+    Returns the validated entries of the given configuration file as a list
+    of (name, entry_type, target, options) tuples, from the given cache file
+    if one is given and it is up to date.
+    """
+    with io.open(path, "rb") as f:
+        data = f.read()
+    if cache_path is None:
+        return _parse_config(path, data)
+    fingerprint = _ConfigCache.fingerprint(data)
+    items = _ConfigCache.read(cache_path, fingerprint)
+    if items is None:
+        items = _parse_config(path, data)
+        _ConfigCache.write(cache_path, fingerprint, items)
+    return items
+
+
+def _import_tomllib():
+    # returns the TOML parser, which is only imported when a TOML
+    # configuration file is read, or None if none is available
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            return None
+    return tomllib
+
+
+def _parse_config(path, data):
+    """
+    Parses and validates the contents of a configuration file, without
+    importing any of the targets, and returns its entries as a list of
+    (name, entry_type, target, options) tuples.
+    """
+    if path.endswith(".toml"):
+        tomllib = _import_tomllib()
+        if tomllib is None:
+            raise ImportError("reading {} requires Python 3.11 or the tomli "
+                "package".format(path))
+        try:
+            config = tomllib.loads(data.decode("utf8"))
+        except (UnicodeDecodeError, tomllib.TOMLDecodeError) as e:
+            raise ValueError("invalid configuration file {}: {}".format(
+                path, e))
+    else:
+        import json
+        try:
+            config = json.loads(data.decode("utf8"))
+        except ValueError as e:
+            raise ValueError("invalid configuration file {}: {}".format(
+                path, e))
+
+    fakes = config.get("fakes", {}) if isinstance(config, dict) else None
+    if not isinstance(fakes, dict):
+        raise ValueError("invalid configuration file {}: \"fakes\" must be "
+            "a table".format(path))
+
+    items = []
+    for (name, value) in fakes.items():
+        def invalid(message, *args):
+            return ValueError("invalid fake {!r} in {}: {}".format(
+                name, path, message.format(*args)))
+        if isinstance(value, str):
+            value = {"target": value}
+        elif not isinstance(value, dict):
+            raise invalid("must be an import path or a table")
+        options = dict(value)
+        entry_type = options.pop("type", "class")
+        target = options.pop("target", None)
+        try:
+            (entry_class, target_arg) = _CONFIG_ENTRY_TYPES[entry_type]
+        except (KeyError, TypeError):
+            raise invalid("unknown type {!r}; expected one of: {}",
+                entry_type, ", ".join(sorted(_CONFIG_ENTRY_TYPES)))
+        if target is not None:
+            if target_arg is None:
+                raise invalid("entries of type {!r} do not have a target",
+                    entry_type)
+            if (not isinstance(target, str) or target.startswith(":")
+                    or ":" not in target):
+                raise invalid("target must be an import path of the form "
+                    "\"package.module:Name\", not {!r}", target)
+
+        import inspect
+        parameters = inspect.signature(entry_class).parameters
+        accepted = [x for x in parameters
+            if x not in ("fake_factory", "name", target_arg)]
+        for option in options:
+            if option not in accepted:
+                raise invalid("unknown option {!r}", option)
+        required = [x for (x, parameter) in parameters.items()
+            if parameter.default is parameter.empty
+            and x not in ("fake_factory", "name")]
+        for argument in required:
+            if argument == target_arg:
+                if target is None:
+                    raise invalid("a target is required")
+            elif argument not in options:
+                raise invalid("the {!r} option is required", argument)
+        items.append((name, entry_type, target, options))
+    return items
+
+
+ConfigReload = collections.namedtuple("ConfigReload",
+    ["path", "generation", "entries", "load_seconds", "swap_seconds",
+    "error"])
+ConfigReload.__doc__ = """
+The result of a reload of the configuration file by a
+:class:`~fakeable.ConfigWatcher`: the path of the file, the generation of
+the registry after the swap, the number of entries swapped in, the time in
+seconds taken to load and validate the file, the time in seconds for which
+the registry was locked to swap the entries in, and the exception that
+prevented the reload, if any, in which case the other fields are None and
+the registered fakes are unchanged.
+"""
+
+
+class ConfigWatcher(object):
+    """
+    Reloads the fakes from a configuration file into a fake factory when
+    the file changes, as returned from :func:`~fakeable.watch_config`.
+    A background thread checks the modification time, size and inode of the
+    file every *interval* seconds.  The result of the last reload is stored
+    in the ``last_reload`` attribute, and the number of reloads in the
+    ``reloads`` attribute.
+
+    The callback is invoked by whichever thread performs the reload: the
+    thread that creates the watcher for the initial load, the background
+    thread for the reloads that it detects, and the caller of
+    :meth:`check` or :meth:`reload` when they are invoked directly.
+    """
+
+    def __init__(self, fake_factory, path, interval=1.0, callback=None,
+            cache_path=None):
+        if interval <= 0:
+            raise ValueError("invalid interval: {} (must be positive)"
+                .format(interval))
+        self.fake_factory = fake_factory
+        self.path = path
+        self.interval = interval
+        self.callback = callback
+        self.cache_path = cache_path
+        self.reloads = 0
+        self.last_reload = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._stat = None
+        # the initial load raises, rather than reports, its errors
+        reload = self.reload()
+        if reload.error is not None:
+            raise reload.error
+        self._start()
+        _FORK_HANDLERS.add(self)
+
+    def after_fork_in_child(self, clear_caches):
+        """
+        Invoked in the child process after a fork: the background thread does
+        not exist in the child, so a new one is started.
+        """
+        self._lock = threading.Lock()
+        if not self._stopped.is_set():
+            self._stopped = threading.Event()
+            self._start()
+
+    def _start(self):
+        self._thread = _background_thread(self._poll,
+            "fakeable-config-{}".format(os.path.basename(self.path)))
+        self._thread.start()
+
+    def _poll(self):
+        stopped = self._stopped
+        while not stopped.wait(self.interval):
+            if (not threading.current_thread().daemon
+                    and _main_thread_ended()):
+                return
+            self.check()
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            # the file may be in the middle of being replaced
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def check(self):
+        """
+        Reloads the configuration file if it changed since it was last
+        loaded, and returns the :class:`~fakeable.ConfigReload`; returns None
+        if it did not change.  This is invoked periodically by the background
+        thread, but may also be invoked directly.
+        """
+        stat = self._file_stat()
+        if stat is None or stat == self._stat:
+            return None
+        return self.reload()
+
+    def reload(self):
+        """
+        Loads the configuration file into a new registry and swaps it into
+        the fake factory, and returns the :class:`~fakeable.ConfigReload`.
+        If the file is invalid then the registered fakes are left unchanged
+        and the exception is reported in the result.  The callback, if any,
+        is invoked with the result.
+        """
+        with self._lock:
+            stat = self._file_stat()
+            start = time.perf_counter()
+            staging = FakeFactory()
+            try:
+                staging.load_config(self.path, self.cache_path)
+            except Exception as e:
+                reload = ConfigReload(self.path, None, None, None, None, e)
+            else:
+                load_seconds = time.perf_counter() - start
+                swap = self.fake_factory.swap(staging)
+                reload = ConfigReload(self.path, swap.generation,
+                    swap.entries, load_seconds, swap.swap_seconds, None)
+                self.reloads += 1
+            # a file that cannot be loaded is not retried until it changes
+            self._stat = stat
+            self.last_reload = reload
+        if self.callback is not None:
+            self.callback(reload)
+        return reload
+
+    def close(self):
+        """
+        Stops watching the configuration file; the fakes that were loaded
+        from it remain registered.
+        """
+        self._stopped.set()
+        thread = self._thread
+        if thread is not threading.current_thread():
+            thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ControlBlock(object):
+    """
+    A small memory-mapped file that selects, by number, which stand-in each
+    :class:`~fakeable.Fakeable` class uses in every process that shares it;
+    see :func:`~fakeable.use_control_block`.
+
+    The file consists of a header of three 64-bit words (the magic bytes, the
+    generation and the number of slots) followed by the slots, each of which
+    is a NUL-padded UTF-8 name of up to 64 bytes followed by a 32-bit entry
+    id.  Writers make the generation odd while they modify the slots and
+    readers retry until they read the same even generation before and after
+    reading the slots, so readers never take a lock.
+    """
+
+    MAGIC = b"FAKECTL1"
+    HEADER = struct.Struct("<8sQQ")
+    SLOT = struct.Struct("<64si4x")
+    NAME_SIZE = 64
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        import mmap
+        self._file = io.open(self.path, "r+b")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0)
+        except Exception:
+            self._file.close()
+            raise
+        (magic, _, self.slot_count) = self.HEADER.unpack_from(self._mmap, 0)
+        if (magic != self.MAGIC or len(self._mmap) !=
+                self.HEADER.size + self.slot_count * self.SLOT.size):
+            self.close()
+            raise ValueError("not a control block: {}".format(self.path))
+        # the generation is read as words[1] by Fakeable.__call__(), which
+        # is the "single integer check" done on each object creation
+        self.words = memoryview(self._mmap)[:self.HEADER.size].cast("Q")
+
+    @classmethod
+    def create(cls, path, slots=64):
+        """
+        Creates a new control block file with the given number of slots,
+        overwriting any existing file, and returns it opened.
+        """
+        with io.open(path, "wb") as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, 0, slots))
+            f.write(b"\0" * (cls.SLOT.size * slots))
+        return cls(path)
+
+    @property
+    def generation(self):
+        """
+        The number of times that the control block has been modified, times
+        two.
+        """
+        return self.words[1]
+
+    def read(self):
+        """
+        Returns a tuple (generation, table) where table is a dict that maps
+        each name in the control block to its entry id.
+        """
+        while True:
+            generation = self.words[1]
+            if generation % 2 == 0:
+                table = {}
+                for index in range(self.slot_count):
+                    (name, entry_id) = self._read_slot(index)
+                    if name:
+                        table[name] = entry_id
+                if self.words[1] == generation:
+                    return (generation, table)
+            time.sleep(0)
+
+    def table(self):
+        """
+        Returns a dict that maps each name in the control block to its entry
+        id.
+        """
+        return self.read()[1]
+
+    def set(self, name, entry_id):
+        """
+        Sets the entry id of the given name; 0 means to use the real class.
+        Raises :exc:`ValueError` if the name is too long or if there are no
+        free slots.
+        """
+        encoded = name.encode("utf8")
+        if not encoded or len(encoded) > self.NAME_SIZE or b"\0" in encoded:
+            raise ValueError("invalid name for a control block: {!r}".format(
+                name))
+        with self._write_lock():
+            free = None
+            for index in range(self.slot_count):
+                slot_name = self._read_slot(index)[0]
+                if slot_name == name:
+                    break
+                elif not slot_name and free is None:
+                    free = index
+            else:
+                if free is None:
+                    raise ValueError("no free slots in control block: "
+                        "{}".format(self.path))
+                index = free
+            self._write_slot(index, encoded, entry_id)
+
+    def remove(self, name):
+        """
+        Removes the given name from the control block, which unregisters the
+        fake that the control block registered for it in each process;
+        returns True if the name was found or False if it was not.
+        """
+        with self._write_lock():
+            for index in range(self.slot_count):
+                if self._read_slot(index)[0] == name:
+                    self._write_slot(index, b"", 0)
+                    return True
+        return False
+
+    def close(self):
+        """
+        Unmaps and closes the control block file.  If the fakes of this
+        process follow this control block then they stop following it, as if
+        ``use_control_block(None)`` was invoked.
+        """
+        words = getattr(self, "words", None)
+        if words is not None:
+            if FAKE_FACTORY.control_block is self:
+                FAKE_FACTORY.use_control_block(None, None)
+            words.release()
+        self._mmap.close()
+        self._file.close()
+
+    def _read_slot(self, index):
+        offset = self.HEADER.size + index * self.SLOT.size
+        (name, entry_id) = self.SLOT.unpack_from(self._mmap, offset)
+        return (name.rstrip(b"\0").decode("utf8", "replace"), entry_id)
+
+    def _write_slot(self, index, encoded_name, entry_id):
+        offset = self.HEADER.size + index * self.SLOT.size
+        self.words[1] += 1
+        self.SLOT.pack_into(self._mmap, offset, encoded_name, entry_id)
+        self.words[1] += 1
+
+    @contextlib.contextmanager
+    def _write_lock(self):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+
+# the global FakeFactory instance
+FAKE_FACTORY = FakeFactory()
+
+# the global index of Fakeable classes
+FAKEABLE_INDEX = FakeableIndex()
+
+
+# objects with an after_fork_in_child() method to invoke in the child process
+# after a fork, such as entries that own locks or threads
+_FORK_HANDLERS = weakref.WeakSet()
+
+_FORK_POLICY = {"clear_caches": False}
+
+
+def _before_fork():
+    # make sure that the registry is not being modified while forking, so
+    # that the child gets a consistent copy of it
+    FAKE_FACTORY.lock.acquire()
+
+
+def _after_fork_in_parent():
+    FAKE_FACTORY.lock.release()
+
+
+def _after_fork_in_child():
+    clear_caches = _FORK_POLICY["clear_caches"]
+    FAKE_FACTORY.after_fork_in_child(clear_caches)
+    FAKEABLE_INDEX.after_fork_in_child(clear_caches)
+    for handler in list(_FORK_HANDLERS):
+        handler.after_fork_in_child(clear_caches)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_before_fork,
+        after_in_parent=_after_fork_in_parent,
+        after_in_child=_after_fork_in_child)
+
+
+def set_fake_class(name, value):
+    """
+    Configures the class with the given name to create fake objects instead
+    of real objects when created.  When an instance of the class of the
+    given name is created a new instance of the given type will be created
+    instead.
+
+    Arguments:
+        *name* (string or :class:`fakeable.Fakeable`)
+            the name of the class, or the class itself, that will have fake
+            instances created instead of real instances; if a string, this
+            will be the name of the class or, if the class defines
+            __FAKE_NAME__, the value of that class' __FAKE_NAME__ attribute.
+        *value* (class)
+            the class whose instances will be created in place of the real
+            class; whatever arguments were given to the __init__() method
+            of the real class will be passed on to the __init__() method of
+            the created instance of this class.
+
+    Returns a context manager that can be used as the target of a "with"
+    statement; when the context of the "with" statement is exited the fake
+    class will be automatically unregistered by a call to self.unset(name).
+    """
+    FAKE_FACTORY.set_fake_class(name, value)
+
+
+def set_fake_object(name, value):
+    """
+    Configures the class with the given name to always use a fake object
+    instead of real objects when created.  When an instance of the class of
+    the given name is created the given value will be returned instead.
+
+    Arguments:
+        *name* (string or :class:`fakeable.Fakeable`)
+            the name of the class, or the class itself, that will have fake
+            instances created instead of real instances; if a string, this
+            will be the name of the class or, if the class defines
+            __FAKE_NAME__, the value of that class' __FAKE_NAME__ attribute.
+        *value* (object)
+            the object to be returned in place of a new instance of the real
+            class; whatever arguments were given to the __init__() method
+            of the real class will be discarded.
+
+    Returns a context manager that can be used as the target of a "with"
+    statement; when the context of the "with" statement is exited the fake
+    object will be automatically unregistered by a call to self.unset(name).
+    """
+    FAKE_FACTORY.set_fake_object(name, value)
+
+
+def set_fake_factory(name, value):
+    """
+    Configures the class with the given name to create fake objects by
+    invoking a function instead of creating real objects.  When an instance
+    of the class of the given name is created the given function is invoked
+    with the arguments that were given to the constructor and its return
+    value is used instead.
+
+    The function may also be a coroutine function, or otherwise return an
+    awaitable, in order to perform asynchronous setup; in that case instances
+    must be created with :meth:`fakeable.Fakeable.acreate`, which awaits the
+    result, and creating them normally raises :exc:`TypeError`.
+
+    Arguments:
+        *name* (string or :class:`fakeable.Fakeable`)
+            the name of the class, or the class itself, that will have fake
+            instances created instead of real instances; if a string, this
+            will be the name of the class or, if the class defines
+            __FAKE_NAME__, the value of that class' __FAKE_NAME__ attribute.
+        *value* (function)
+            the function to invoke to create the fake objects.
+
+    Returns the entry that was registered, which can be used as the target of
+    a "with" statement to automatically unregister it.
+    """
+    return FAKE_FACTORY.set_fake_factory(name, value)
+
+
+def set_fake_sequence(name, items, cycle=False, exhausted="raise"):
+    """
+    Configures the class with the given name to hand out the given items in
+    order, one each time that an instance is created, such as to make the
+    first construction return one object, the second another object and the
+    third raise an exception.  Items that are exceptions, or exception
+    classes, are raised rather than returned.
+
+    *Example*::
+
+        fakeable.set_fake_sequence("Connection",
+            [flaky_connection, ConnectionError("refused"), good_connection])
+
+    The items are handed out atomically, so each item is handed out exactly
+    once even when instances are created concurrently by many threads or
+    tasks.  Sequences, such as lists and tuples, are indexed without
+    locking.  Other iterables, such as generators, are consumed lazily, one
+    item per created instance, so that huge generated sequences are never
+    materialized; since a generator cannot run in two threads at once, they
+    are consumed while holding a lock.
+
+    Arguments:
+        *name* (string or :class:`fakeable.Fakeable`)
+            the name of the class, or the class itself; see
+            :func:`~fakeable.set_fake_class`.
+        *items* (iterable)
+            the objects (and exceptions) to hand out.
+        *cycle* (bool)
+            if True then the items are handed out again from the start once
+            they have all been handed out; when cycling over an iterable that
+            is not a sequence, its items are kept as they are produced.
+        *exhausted* (string)
+            what to do once all of the items have been handed out, if not
+            cycling: "raise" to raise :exc:`~fakeable.SequenceExhaustedError`
+            (the default), "last" to keep handing out the last item or "real"
+            to create real instances.
+
+    Returns the entry that was registered, which can be used as the target of
+    a "with" statement to automatically unregister it.
+    """
+    return FAKE_FACTORY.set_fake_sequence(name, items, cycle, exhausted)
+
+
+def set_fake_singleton(name, value, scope="thread"):
+    """
+    Configures the class with the given name to return one fake object per
+    thread, asyncio task or context: the first time that an instance of the
+    class is created in a scope, the given class or function is invoked with
+    the constructor arguments to create the fake object, which is then
+    returned by every construction in that scope, regardless of their
+    arguments.  This isolates concurrent tests from each other without
+    sharing a fake object, and its locks, between them, and without creating
+    a fake object per construction.
+
+    *Example*::
+
+        fakeable.set_fake_singleton("Database", FakeDatabase, scope="task")
+
+    The fake object of a thread or task is released when it ends.
+
+    Arguments:
+        *name* (string or :class:`fakeable.Fakeable`)
+            the name of the class, or the class itself; see
+            :func:`~fakeable.set_fake_class`.
+        *value* (class or function)
+            the class or function to invoke to create the fake objects; as
+            with :func:`~fakeable.set_fake_factory`, it may be a coroutine
+            function if instances are created with
+            :meth:`fakeable.Fakeable.acreate`.
+        *scope* (string)
+            "thread" (the default) for one fake object per thread, "task" for
+            one per asyncio task, falling back to one per thread for code that
+            does not run in a task, or "context" for one per
+            :mod:`contextvars` context; asyncio tasks run in a copy of the
+            context in which they were created, so they share the fake object
+            if one was created in it before they were.
+
+    Returns the entry that was registered, which can be used as the target of
+    a "with" statement to automatically unregister it.
+    """
+    return FAKE_FACTORY.set_fake_singleton(name, value, scope)
+
+
+def set_shadow_class(name, candidate, executor=None, compare=None,
+        deep_copy=False):
+    """
+    Configures the class with the given name to run a "shadow" candidate
+    implementation alongside each real instance, in order to compare the
+    correctness and performance of the candidate against the real class under
+    real traffic before swapping one for the other.
+
+    When an instance of the class of the given name is created a real
+    instance is created and returned, wrapped in a proxy.  An instance of the
+    candidate class is also created from the same constructor arguments, but
+    on a background executor so that it does not slow down the caller.
+    Each call to a public method of the proxy invokes the real method and
+    returns its result as usual, and then the same call is submitted to the
+    executor to be invoked on the candidate instance.  The results of the two
+    calls are compared and the outcome is recorded in the returned entry.
+    By default the candidate is given the same argument objects as the real
+    method, so it sees any changes that the real method, or the caller after
+    it returns, makes to them; see *deep_copy*.
+
+    Arguments:
+        *name* (string or :class:`fakeable.Fakeable`)
+            the name of the class, or the class itself, whose instances are to
+            be shadowed; if a string, this will be the name of the class or,
+            if the class defines __FAKE_NAME__, the value of that class'
+            __FAKE_NAME__ attribute.
+        *candidate* (class)
+            the candidate class to compare against the real class; whatever
+            arguments were given to the __init__() method of the real class
+            will be passed on to the __init__() method of the candidate.
+        *executor* (:class:`concurrent.futures.Executor`)
+            the executor on which to create and invoke the candidate
+            instances; if None (the default) then a single-threaded executor
+            is created, which guarantees that the mirrored calls are invoked
+            in the same order as the real calls.
+        *compare* (function)
+            a function that accepts the real result and the candidate result
+            of a method call and returns True if they are considered equal;
+            if None (the default) then the ``==`` operator is used.  If the
+            real method raises an exception then the candidate method is
+            expected to raise an exception of the same type.
+        *deep_copy* (bool)
+            if True then the candidate is given deep copies of the
+            arguments, taken before the real call, so that it sees them as
+            the real method did even if they are modified; the copies are
+            made in the calling thread, which adds latency to every call, so
+            this is False by default.
+
+    Returns the :class:`~fakeable.FakeShadowEntry` that was registered.
+    Its ``stats`` attribute is a dict that maps each method name to a
+    :class:`~fakeable.ShadowStats` object and its ``mismatches`` attribute
+    holds the most recent mismatching calls.  Its ``join()`` method waits for
+    all submitted calls to be compared.  The entry can also be used as the
+    target of a "with" statement; when the context of the "with" statement is
+    exited the entry will be unregistered and its executor shut down, after
+    which the calls to the instances that it created are no longer mirrored.
+    """
+    return FAKE_FACTORY.set_shadow_class(name, candidate, executor, compare,
+        deep_copy)
+
+
+def set_fake_latency(name, wrapped=None, latency=0.0, error_rate=0.0,
+        error=None, timeout=None, methods=None, seed=None):
+    """
+    Configures the class with the given name to create objects whose methods
+    are delayed and occasionally fail, in order to simulate realistic
+    downstream behaviour, such as that of a network service, during load
+    tests.  When an instance of the class of the given name is created then
+    an instance of the real class, or of the given fake class, is created and
+    returned wrapped in a proxy object.  Each call to a public method of the
+    proxy first sleeps for a duration chosen from the given latency
+    distribution and then either raises an injected error or invokes the
+    method of the wrapped instance.  Methods defined with ``async def`` are
+    delayed with :func:`asyncio.sleep` instead of :func:`time.sleep` so that
+    they do not block the event loop.
+
+    Arguments:
+        *name* (string or :class:`fakeable.Fakeable`)
+            the name of the class, or the class itself, whose instances are to
+            be slowed down; if a string, this will be the name of the class
+            or, if the class defines __FAKE_NAME__, the value of that class'
+            __FAKE_NAME__ attribute.
+        *wrapped* (class)
+            the fake class whose instances to wrap; if None (the default) then
+            instances of the real class are wrapped.
+        *latency* (number or latency distribution)
+            the delay of each call; either a number of seconds or an object
+            with a ``sample(random)`` method that returns a number of seconds,
+            such as :class:`~fakeable.FixedLatency`,
+            :class:`~fakeable.UniformLatency` or
+            :class:`~fakeable.LognormalLatency`.
+        *error_rate* (float)
+            the probability, between 0 and 1, that a call fails.
+        *error* (exception class, exception, or function)
+            the error to raise for failed calls; either an exception class,
+            which is instantiated for each failure, an exception object, or a
+            function that returns a new exception object; if None (the
+            default) then :exc:`ConnectionError` is raised.
+        *timeout* (number)
+            if not None, calls whose delay would be at least this many seconds
+            instead sleep this many seconds and raise :exc:`TimeoutError`.
+        *methods* (iterable of strings)
+            the names of the methods to affect; if None (the default) then all
+            public methods are affected.
+        *seed* (object)
+            the seed of the random number generator, for reproducible runs.
+
+    Returns the :class:`~fakeable.FakeLatencyEntry` that was registered,
+    which can also be used as the target of a "with" statement to
+    automatically unregister it.
+    """
+    return FAKE_FACTORY.set_fake_latency(name, wrapped, latency=latency,
+        error_rate=error_rate, error=error, timeout=timeout, methods=methods,
+        seed=seed)
+
+
+def set_recording(name, path, wrapped=None):
+    """
+    Configures the class with the given name to record every interaction
+    with its instances to a "cassette" file, which can later be replayed by
+    :func:`~fakeable.set_replay` so that slow tests can run without the real
+    backend.  When an instance of the class of the given name is created an
+    instance of the real class, or of the given fake class, is created and
+    returned wrapped in a proxy object.  The constructor arguments and each
+    call to a public method of the proxy, along with its result or exception,
+    are appended to the cassette as they happen.
+
+    The arguments, results and exceptions must be picklable to be replayed;
+    an outcome that cannot be pickled is recorded as such, and replaying it
+    raises :exc:`~fakeable.ReplayError`.
+
+    Arguments:
+        *name* (string or :class:`fakeable.Fakeable`)
+            the name of the class, or the class itself, whose instances are to
+            be recorded; if a string, this will be the name of the class or,
+            if the class defines __FAKE_NAME__, the value of that class'
+            __FAKE_NAME__ attribute.
+        *path* (string)
+            the path of the cassette file to write, which is overwritten;
+            files with the same path plus the suffixes ".idx" and ".keys" are
+            also written.
+        *wrapped* (class)
+            the fake class whose instances to record; if None (the default)
+            then instances of the real class are recorded.
+
+    Returns the :class:`~fakeable.FakeRecordingEntry` that was registered.
+    Its ``close()`` method must be invoked once recording is complete, which
+    is done automatically if the entry is used as the target of a "with"
+    statement.
+    """
+    return FAKE_FACTORY.set_recording(name, path, wrapped)
+
+
+def set_replay(name, path, match="strict"):
+    """
+    Configures the class with the given name to create fake objects that
+    answer method calls with the results recorded in a cassette file written
+    by :func:`~fakeable.set_recording`.  Each public attribute of the fake
+    objects is a function that returns the recorded result of the matching
+    call, or raises the recorded exception.  The cassette is memory-mapped
+    and records are only read as they are needed, so even very large
+    cassettes are loaded instantly.
+
+    The fake objects are numbered in the order that they are created, just
+    as the recorded instances were, and the given *match* mode determines
+    how calls are matched up with the recorded calls:
+
+    ``"strict"``
+        construction and method calls must occur in exactly the order that
+        they were recorded, with equal arguments.
+    ``"ordered"``
+        the calls to each method of each object are answered with the results
+        recorded for that method of that object, in the order recorded,
+        regardless of the arguments and of calls to other methods.
+    ``"keyed"``
+        calls are answered with the result recorded for a call to the same
+        method with equal arguments, from any object; if the same call was
+        recorded more than once then the results are used in the order
+        recorded, and the last one is repeated once they are exhausted.
+
+    Arguments are considered equal if they are equal after being converted
+    to a canonical form that does not depend on the process, so cassettes
+    can be replayed by other processes: sets and dicts are compared
+    regardless of their order, ``1`` and ``1.0`` are equal, and objects that
+    do not define ``__repr__()`` are compared by their class and attributes,
+    while other objects are compared by their ``repr()``, ignoring memory
+    addresses.  A call that cannot be matched raises
+    :exc:`~fakeable.ReplayError`.
+
+    Arguments:
+        *name* (string or :class:`fakeable.Fakeable`)
+            the name of the class, or the class itself, that will have fake
+            instances created instead of real instances; if a string, this
+            will be the name of the class or, if the class defines
+            __FAKE_NAME__, the value of that class' __FAKE_NAME__ attribute.
+        *path* (string)
+            the path of the cassette file.
+        *match* (string)
+            one of the match modes described above.
+
+    Returns the :class:`~fakeable.FakeReplayEntry` that was registered, which
+    can also be used as the target of a "with" statement to automatically
+    unregister it.
+    """
+    return FAKE_FACTORY.set_replay(name, path, match)
+
+
+def set_spy(name, wrapped=None, capacity=65536, capture_args=False):
+    """
+    Configures the class with the given name to record the calls made to the
+    methods of its instances, in order to verify interactions in tests
+    without writing a custom recorder class.  When an instance of the class
+    of the given name is created an instance of the real class, or of the
+    given fake class, is created and returned wrapped in a proxy object.
+
+    For each call to a public method of the proxy the number of the object
+    (objects are numbered in the order that they are created), the method
+    name, the time of the call, its duration and whether it raised an
+    exception are recorded in fixed-size columnar buffers.  The buffers hold
+    the given number of calls and use ``FakeSpyEntry.ROW_SIZE`` (29) bytes
+    per call, so memory use is fixed no matter how many calls are made; once
+    they are full, each call overwrites the oldest one.
+
+    If *capture_args* is True then a hash of the arguments, which is used to
+    find calls by their arguments, and a reference to the arguments are also
+    kept for each call.  Hashing the arguments makes recording a call
+    considerably more expensive, so they are not captured by default, and
+    calls can then only be found by their method and object.
+
+    Arguments:
+        *name* (string or :class:`fakeable.Fakeable`)
+            the name of the class, or the class itself, whose instances are to
+            be spied on; if a string, this will be the name of the class or,
+            if the class defines __FAKE_NAME__, the value of that class'
+            __FAKE_NAME__ attribute.
+        *wrapped* (class)
+            the fake class whose instances to spy on; if None (the default)
+            then instances of the real class are spied on.
+        *capacity* (int)
+            the maximum number of calls to keep.
+        *capture_args* (bool)
+            whether to also keep the hash of, and references to, the
+            arguments of each call.
+
+    Returns the :class:`~fakeable.FakeSpyEntry` that was registered.  Its
+    ``count()``, ``filter()`` and ``first()`` methods query the recorded
+    calls, which are returned as :class:`~fakeable.SpyCall` tuples.  The
+    entry can also be used as the target of a "with" statement to
+    automatically unregister it.
+
+    *Example*::
+
+        spy = fakeable.set_spy("HttpDownloader", FakeHttpDownloader,
+            capture_args=True)
+        download_all(["a", "b"])
+        assert spy.count("download") == 2
+        assert spy.count("download", args=("a",)) == 1
+    """
+    return FAKE_FACTORY.set_spy(name, wrapped, capacity, capture_args)
+
+
+def set_warm_pool(name, size=4, args=(), kwargs=None):
+    """
+    Keeps a pool of real instances of the Fakeable class with the given name,
+    which are created ahead of time by a background thread, for classes whose
+    construction is expensive, such as parsers and model loaders.
+    Creating an instance with the given constructor arguments takes an
+    instance from the pool, and the background thread then creates a new one
+    to replace it.  Instances created with other arguments, and instances
+    requested when the pool is empty, are created on demand as usual.
+    Returns the :class:`~fakeable.FakeWarmPoolEntry` that was registered,
+    whose ``close()`` method stops the background thread.
+
+    Note that an instance taken from the pool may have been created long
+    before it is used, and that created callbacks are invoked when it is
+    taken, not when it is created.  The pooled instances are created by the
+    background thread, not by the thread that takes them, so classes whose
+    instances may only be used by the thread that created them, such as
+    those holding a ``sqlite3`` connection, must not be pooled.  The
+    background thread is stopped when the entry is unregistered.
+
+    *Example*::
+
+        pool = fakeable.set_warm_pool("Parser", size=8, args=(GRAMMAR,))
+        pool.wait_until_full()
+        parser = Parser(GRAMMAR)  # taken from the pool
+
+    Arguments:
+        *name*
+            the name of a Fakeable class, or the class itself.
+        *size* (int)
+            the number of instances to keep in the pool.
+        *args* (tuple) and *kwargs* (dict)
+            the constructor arguments of the pooled instances.
+    """
+    return FAKE_FACTORY.set_warm_pool(name, size, args, kwargs)
+
+
+def set_instance_limit(name, limit, wrapped=None, timeout=None):
+    """
+    Limits the number of live instances of the class with the given name to
+    *limit*, such as to bound the number of connections or memory-hungry
+    workers that exist at once.  Creating an instance when *limit* instances
+    are live waits for one of them to be released, in the order in which the
+    instances were requested; an instance is released when its ``close()``
+    method is invoked, when a ``with`` (or ``async with``) block using it
+    exits, or when it is garbage collected.
+    Returns the :class:`~fakeable.FakeLimitEntry` that was registered, whose
+    ``stats()`` method returns an :class:`~fakeable.InstanceLimitStats` with
+    contention metrics.
+
+    Instances created with :meth:`Fakeable.acreate()
+    <fakeable.Fakeable.acreate>` wait without blocking the event loop.
+    The created objects are proxies for the real (or *wrapped*) instances,
+    as with :func:`~fakeable.set_spy`.
+
+    *Example*::
+
+        fakeable.set_instance_limit("Connection", 10, timeout=5.0)
+        with Connection(url) as connection:  # waits if 10 are open
+            ...
+
+    Arguments:
+        *name*
+            the name of the class; see :func:`~fakeable.set_fake_class`.
+        *limit* (int)
+            the maximum number of live instances.
+        *wrapped* (callable)
+            the fake class of which to create instances; if None, then
+            instances of the real class are created.
+        *timeout* (float)
+            the number of seconds to wait for an instance to be released
+            before raising :exc:`~fakeable.InstanceLimitError`; None waits
+            forever and 0 raises immediately if *limit* instances are live.
+    """
+    return FAKE_FACTORY.set_instance_limit(name, limit, wrapped, timeout)
+
+
+def registry_spec(factories=None):
+    """
+    Returns a picklable :class:`~fakeable.RegistrySpec` describing the fakes
+    that are currently registered, which can be sent to other processes,
+    such as ``multiprocessing`` or ``concurrent.futures.ProcessPoolExecutor``
+    workers, and installed there with :func:`~fakeable.install_registry_spec`.
+    Usually, :func:`~fakeable.process_pool_kwargs` is more convenient.
+
+    Classes and functions, including the names of fakes that were registered
+    by class, are referred to by their import path and are imported when the
+    spec is installed.  Fake objects are pickled, unless a factory to create
+    them in the other processes is specified in *factories*.
+    Entries that cannot be sent to other processes, such as shadows, spies
+    and recordings, and objects that cannot be pickled cause
+    :exc:`TypeError` to be raised.  Created callbacks are *not* included.
+
+    The spec is created once and cached until the registered fakes change,
+    and the entries are pickled when the spec is created, so repeatedly
+    sending the same spec to worker processes is cheap.
+
+    Arguments:
+        *factories* (dict)
+            maps the names of fakes registered by set_fake_object() to
+            functions that take no arguments and create the fake object in the
+            other process, which is useful for objects that cannot be pickled,
+            such as those that hold locks or sockets; the functions must be
+            importable by the other processes.
+    """
+    return FAKE_FACTORY.registry_spec(factories)
+
+
+def install_registry_spec(spec):
+    """
+    Replaces the registered fakes with those described by the given
+    :class:`~fakeable.RegistrySpec`, which was created by
+    :func:`~fakeable.registry_spec`, usually in another process.
+    Created callbacks are not affected.
+
+    The digest of the installed spec is remembered; installing the same spec
+    again does nothing and returns False, unless the registered fakes were
+    changed in the meantime.  Otherwise, returns True.
+    """
+    return FAKE_FACTORY.install_registry_spec(spec)
+
+
+def process_pool_kwargs(initializer=None, initargs=(), factories=None):
+    """
+    Returns a dict with the ``initializer`` and ``initargs`` keyword
+    arguments for ``multiprocessing.Pool`` or
+    ``concurrent.futures.ProcessPoolExecutor`` that install the fakes
+    that are currently registered into each worker process when it starts.
+    The fakes are therefore sent to each worker once, rather than with every
+    task.  This is necessary when workers are started with the "spawn" or
+    "forkserver" start methods, which do not inherit the registered fakes.
+
+    *Example*::
+
+        fakeable.set_fake_class("Database", FakeDatabase)
+        with ProcessPoolExecutor(4, **fakeable.process_pool_kwargs()) as pool:
+            results = list(pool.map(process_record, records))
+
+    Arguments:
+        *initializer* (function) and *initargs* (tuple)
+            an additional initializer to invoke in each worker process, with
+            the given arguments, after the fakes are installed.
+        *factories* (dict)
+            see :func:`~fakeable.registry_spec`.
+    """
+    spec = registry_spec(factories)
+    return {
+        "initializer": _install_registry_spec,
+        "initargs": (spec, initializer, initargs),
+    }
+
+
+def use_control_block(control_block, stand_ins=None):
     """
+    Makes the registered fakes of this process follow the given
+    :class:`~fakeable.ControlBlock`, a small memory-mapped file shared by
+    several processes, such as the pre-forked workers of a web server.
+    Changing the control block, for example with the command-line interface,
+    switches classes between their real implementation and stand-ins in all
+    of the processes at once, without restarting them.
 
-    def __new__(mcs, name, bases, dict_):
-        # use the class name as the "name" of the fake, but allow the class
-        # to override this name by setting __FAKE_NAME__
-        try:
-            __FAKE_NAME__ = dict_["__FAKE_NAME__"]
-        except KeyError:
-            dict_["__FAKE_NAME__"] = name
-        else:
-            # ensure that the __FAKE_NAME__ attribute of the class is hashable
-            hash(__FAKE_NAME__)
+    The control block maps the ``__FAKE_NAME__`` of classes to entry ids,
+    which are looked up in *stand_ins*; entry id 0 means to use the real
+    class and unknown entry ids are treated the same way.  The control block
+    has a generation number that is incremented on each change; each time
+    that an instance of a :class:`~fakeable.Fakeable` class is created, the
+    generation is compared to the last one seen by this process and, only if
+    it differs, the table is read and applied with
+    :meth:`FakeFactory.set_stand_in` and :meth:`FakeFactory.unset`.
+    Only names in the control block are affected.
 
-        # create the type object with the possibly-slightly-modified dict
-        type_ = type.__new__(mcs, name, bases, dict_)
-        return type_
+    If the control block is opened before the worker processes are forked
+    then all of the workers share the same mapping.
 
-    def __call__(cls, *args, **kwargs):
-        fake_name = cls.__FAKE_NAME__
+    Arguments:
+        *control_block* (:class:`~fakeable.ControlBlock` or None)
+            the control block to follow, or None to stop following the
+            current one and unregister the fakes that it registered.
+        *stand_ins* (dict)
+            maps each entry id (a positive int) to a stand-in, such as a fake
+            class or fake object; see :meth:`FakeFactory.set_stand_in`.
 
-        # try looking up the fake object by the class first
-        try:
-            instance = FAKE_FACTORY.get(cls, *args, **kwargs)
-        except FAKE_FACTORY.FakeNotFound:
-            pass
-        else:
-            FAKE_FACTORY.notify_fakeable_created(fake_name, instance, cls)
-            return instance
+    *Example*::
 
-        # try looking up the fake object by name
-        try:
-            instance = FAKE_FACTORY.get(fake_name, *args, **kwargs)
-        except FAKE_FACTORY.FakeNotFound:
-            pass
-        else:
-            FAKE_FACTORY.notify_fakeable_created(fake_name, instance, cls)
-            return instance
+        control_block = fakeable.ControlBlock("/run/myapp/fakes")
+        fakeable.use_control_block(control_block, {
+            1: FakeDatabase,
+            2: fakeable_bench.stand_in("set_fake_latency", latency=0.01),
+        })
 
-        # no fake instance was registered; create a real instance
-        instance = type.__call__(cls, *args, **kwargs)
-        FAKE_FACTORY.notify_fakeable_created(fake_name, instance, cls)
-        return instance
+    The control block of the example can be created and modified with::
+
+        python -m fakeable control /run/myapp/fakes create
+        python -m fakeable control /run/myapp/fakes set Database 2
+        python -m fakeable control /run/myapp/fakes set Database 0
+        python -m fakeable control /run/myapp/fakes show
+    """
+    FAKE_FACTORY.use_control_block(control_block, stand_ins)
 
 
-class FakeFactory(object):
+def set_fork_policy(clear_caches=False):
     """
-    A database of fake objects.
+    Configures what happens in the child process when a process that uses
+    *fakeable* forks, such as the workers of a pre-forking server.
+
+    Regardless of the policy, *fakeable* always makes itself safe to use in
+    the child: the registry is not modified while the process forks, so the
+    child inherits a consistent copy of it, the locks of the registry and of
+    the entries are replaced by new ones, background threads (such as those
+    of :func:`~fakeable.set_shadow_class`) are restarted when needed,
+    recordings made by :func:`~fakeable.set_recording` stop in the child so
+    that the files are not corrupted, and pending asynchronous callbacks
+    are forgotten.
+
+    Arguments:
+        *clear_caches* (bool)
+            if True then per-process data inherited from the parent, such as
+            the calls recorded by spies and the statistics of shadows, is
+            discarded in the child.
     """
+    _FORK_POLICY["clear_caches"] = clear_caches
 
-    def __init__(self):
-        self.fake_factories = {}
-        self.fakeable_created_callbacks = []
 
-    def set_fake_class(self, name, value):
-        """
-        See module-level set_fake_class() function for full documentation
-        """
-        entry = FakeClassEntry(self, name, value)
-        self.fake_factories[name] = entry
-        return entry
+def load_config(path, cache_path=None):
+    """
+    Registers the fakes described in the given configuration file, which is
+    a TOML file if its name ends with ``.toml`` (which requires Python 3.11
+    or the ``tomli`` package) and a JSON file otherwise.  Returns the list
+    of registered entries.
 
-    def set_fake_object(self, name, value):
-        """
-        See module-level set_fake_object() function for full documentation
-        """
-        entry = FakeObjectEntry(self, name, value)
-        self.fake_factories[name] = entry
-        return entry
+    The file has a ``fakes`` table that maps the names of classes to either
+    the import path of the fake class to use in their place, or a table with
+    the ``type`` of the fake (one of ``class``, which is the default,
+    ``object``, ``factory``, ``sequence``, ``singleton``, ``shadow``,
+    ``latency``, ``recording``, ``replay``, ``spy``, ``pool`` or ``limit``),
+    its ``target``, which is the import path of the fake class, object or
+    function, and any options accepted by the corresponding ``set_*``
+    function.
 
-    def unset(self, name):
-        """
-        See module-level unset() function for full documentation
-        """
-        try:
-            del self.fake_factories[name]
-        except KeyError:
-            return False
-        else:
-            return True
+    *Example*::
 
-    def clear(self):
-        """
-        See module-level clear() function for full documentation
-        """
-        self.fake_factories.clear()
-        self.fakeable_created_callbacks = []
+        [fakes]
+        Database = "myapp.fakes:FakeDatabase"
+        Clock = { type = "object", target = "myapp.fakes:FROZEN_CLOCK" }
 
-    def add_created_callback(self, callback):
-        """
-        See module-level add_created_callback() function
-        for full documentation
-        """
-        self.fakeable_created_callbacks.append(callback)
+        [fakes.Client]
+        type = "latency"
+        latency = 0.05
+        error_rate = 0.01
 
-    def remove_created_callback(self, callback):
-        """
-        See module-level remove_created_callback() function
-        for full documentation
-        """
-        try:
-            self.fakeable_created_callbacks.remove(callback)
-        except ValueError:
-            return False
-        else:
-            return True
+    The file is validated when it is loaded, and an invalid file causes
+    :exc:`ValueError` to be raised, but the targets are only imported when
+    the first instance of the class is created.  If *cache_path* is given
+    then the validated contents are cached in that file, which should be
+    somewhere outside of the source tree such as a build or cache directory,
+    and used until the configuration file changes.
+    """
+    return FAKE_FACTORY.load_config(path, cache_path)
 
-    def notify_fakeable_created(self, name, obj, obj_type):
-        """
-        Notifies all callbacks about an instance of a fakeable class being
-        created.  This method is not normally invoked directly, but rather is
-        invoked by the :class:`~fakeable.Fakeable` metaclass when it is
-        requested to create a new object.
 
-        The arguments are exactly those to specify to the callbacks registered
-        via :meth:`add_created_callback` so see the documentation for that
-        method for details.
-        """
-        for callback in self.fakeable_created_callbacks:
-            callback(name, obj, obj_type)
+def swap_registry(source):
+    """
+    Replaces all of the registered fakes at once with those registered with
+    *source*, a :class:`~fakeable.FakeFactory` used to build the new
+    registry off to the side, or an iterable of entries, such as to change
+    the fakes of a long-running load test without pausing it.  Returns a
+    :class:`~fakeable.RegistrySwap` with the new generation and the time for
+    which the registry was locked, which does not depend on how long the new
+    registry took to build.
 
-    def get(self, name, *args, **kwargs):
-        """
-        Gets or creates the fake object for a class.
+    *Example*::
 
-        This method is the one used by the :class:`fakeable.Fakeable` metaclass
-        to create the fake instances.  It should not normally be invoked
-        directly.
+        staging = fakeable.FakeFactory()
+        staging.set_fake_latency("Client", latency=0.2)
+        staging.set_fake_class("Database", FakeDatabase)
+        fakeable.swap_registry(staging)
 
-        Arguments:
-            *name* (string or :class:`fakeable.Fakeable` instance)
-                the name of the class, or the class itself, whose fake object
-                to get or create; if a string, this will be the name of the
-                class or, if the class defines __FAKE_NAME__, the value of that
-                class' __FAKE_NAME__ attribute.
+    The swap replaces the dict of registered fakes with a new one in a
+    single step, so every construction uses either the old fakes or the new
+    ones, never a mix of both, and constructions that are in progress
+    finish with the fakes that they started with.  The entries are moved to
+    the fake factory, so unregistering them affects it rather than
+    *source*.  The created and destroyed callbacks and the watches are not
+    affected.
 
-        Returns the fake object for the class with the given name.
-        Raises self.FakeNotFound if no fake was registered with the given name.
-        """
-        try:
-            entry = self.fake_factories[name]
-        except KeyError:
-            raise self.FakeNotFound()
-        else:
-            instance = entry.get(*args, **kwargs)
-            return instance
+    Unlike the entries removed by :func:`~fakeable.unset`, the replaced
+    entries are not closed, since the instances that they created may still
+    be in use, such as replay proxies that read their cassette.  Those that
+    are not registered again by the swap and that no snapshot may restore
+    are returned in the ``replaced`` attribute of the result, to be closed by
+    the caller once the instances that they created are no longer used::
 
-    class FakeNotFound(Exception):
-        """
-        Exception raised by get() if a fake is not found to be registered with
-        the name that it is given.
-        """
-        pass
+        swap = fakeable.swap_registry(staging)
+        ...
+        for entry in swap.replaced:
+            entry.close()
+    """
+    return FAKE_FACTORY.swap(source)
 
 
-class FakeEntry(object):
+def watch_config(path, interval=1.0, callback=None, cache_path=None):
     """
-    An entry in the fake factory.
-    This is an abstract base class, and must be subclassed and the get()
-    method overridden to be meaningful.
+    Loads the fakes from the given configuration file, as described in
+    :func:`~fakeable.load_config`, in place of the registered fakes, and
+    starts watching the file, reloading it whenever it changes.  Returns the
+    :class:`~fakeable.ConfigWatcher`, whose close() method stops watching
+    and which can be used as the target of a "with" statement.
+
+    *Example*::
+
+        def report(reload):
+            if reload.error is not None:
+                logging.error("cannot reload fakes: %s", reload.error)
+            else:
+                logging.info("reloaded %d fakes, swapped in %.1f us",
+                    reload.entries, reload.swap_seconds * 1e6)
+
+        watcher = fakeable.watch_config("soak.toml", callback=report)
+
+    Each reload builds a new registry from the file and swaps it in with
+    :func:`~fakeable.swap_registry`; a reload of an invalid file leaves the
+    registered fakes unchanged.  The given *callback* is invoked with a
+    :class:`~fakeable.ConfigReload` after each reload.  Apart from the
+    initial load, it runs in the background thread that polls the file every
+    *interval* seconds, not in the thread that called this function, so it
+    must be thread-safe, and code running an asyncio event loop should hand
+    the result over with :meth:`asyncio.loop.call_soon_threadsafe`; a slow
+    callback delays the detection of the next change.  If the file cannot be
+    loaded initially then the exception is raised.  See
+    :func:`~fakeable.load_config` for *cache_path*.
     """
+    return FAKE_FACTORY.watch_config(path, interval, callback, cache_path)
 
-    def __init__(self, fake_factory, name):
-        self.fake_factory = fake_factory
-        self.name = name
 
-    def unregister(self):
-        """
-        Invokes self.fake_factory.unset(self.name).
-        """
-        self.fake_factory.unset(self.name)
+def snapshot_registry():
+    """
+    Takes a snapshot of the registered fakes and callbacks, and returns it to
+    be given to :func:`~fakeable.restore_registry` to undo the changes made
+    since, such as at the end of a test.  Unlike saving and clearing the
+    registry, taking a snapshot takes constant time regardless of the number
+    of registered fakes: while there are snapshots, each change is recorded
+    in a journal, and restoring a snapshot undoes the changes recorded since
+    it was taken.  Only the first change to each fake since the latest
+    snapshot is recorded, so the journal stays small even if a snapshot is
+    kept while the same fakes are changed over and over.
 
-    def get(self, *args, **kwargs):
-        """
-        Must be implemented by subclasses to get or create the fake object.
-        The given arguments are those that were specified to the class
-        constructor.
-        """
-        raise NotImplementedError("must be implemented by a subclass")
+    *Example*::
 
-    def __enter__(self):
-        pass
+        snapshot = fakeable.snapshot_registry()
+        try:
+            fakeable.set_fake_class("Database", FakeDatabase)
+            ...
+        finally:
+            fakeable.restore_registry(snapshot)
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.unregister()
+    Snapshots may be nested, and must be restored in the reverse order in
+    which they were taken; restoring a snapshot discards the snapshots that
+    were taken after it.
+    """
+    return FAKE_FACTORY.snapshot()
 
 
-class FakeObjectEntry(FakeEntry):
+def restore_registry(snapshot):
     """
-    An entry in the fake factory where a predefined object is returned when
-    instances of the class are created.
+    Restores the registered fakes and callbacks to their state when the given
+    snapshot was taken by :func:`~fakeable.snapshot_registry`, in time
+    proportional to the number of fakes changed since.  Raises
+    :exc:`ValueError` if the snapshot was already restored, or was taken
+    after a snapshot that was restored.  Watches closed by
+    :func:`~fakeable.clear` remain closed.
     """
+    FAKE_FACTORY.restore(snapshot)
 
-    def __init__(self, fake_factory, name, value):
-        super(FakeObjectEntry, self).__init__(fake_factory, name)
-        self.value = value
 
-    def get(self, *args, **kwargs):
-        return self.value
+def set_tracer(tracer):
+    """
+    Installs a tracer that is notified when each instance of a Fakeable class
+    is created, such as to report the constructions as spans of a
+    distributed trace, or uninstalls it if *tracer* is None.  Returns the
+    tracer that was previously installed, if any.
 
+    A tracer is any object with these two methods, which are invoked in the
+    thread creating the instance:
 
-class FakeClassEntry(FakeEntry):
-    """
-    An entry in the fake factory where instances of a different class are to be
-    created and returned when instances of the class are created.
-    """
+    ``begin(name, cls, faked)``
+        invoked before the instance is created, with the fake name of the
+        class, the class, and whether a fake is created in its place, as
+        opposed to a real instance, including the real instances handed out
+        by :func:`~fakeable.set_warm_pool` and those wrapped in a proxy such
+        as by :func:`~fakeable.set_instance_limit`; returns an
+        object representing the span, such as a span of a tracing library,
+        which is given to ``end()``.
+    ``end(span, name, cls, faked, duration, error)``
+        invoked after the instance is created, or its creation failed, with
+        the span returned from ``begin()``, the same arguments, the time
+        taken in seconds, measured with :func:`time.perf_counter`, and the
+        exception that was raised, or None.
 
-    def __init__(self, fake_factory, name, value):
-        super(FakeClassEntry, self).__init__(fake_factory, name)
-        self.value = value
+    *Example*::
 
-    def get(self, *args, **kwargs):
-        instance = self.value(*args, **kwargs)
-        return instance
+        collector = fakeable.SpanCollector()
+        fakeable.set_tracer(collector)
+        ...
+        for span in collector.drain():
+            print(span.name, span.duration * 1e6, "us")
+
+    The duration covers running the real constructor, or resolving and
+    invoking the fake, and the created callbacks.  For instances created by
+    :meth:`fakeable.Fakeable.acreate` it also covers the asynchronous setup,
+    including the time spent waiting for other tasks.  When no tracer is
+    installed, which is the default, constructions are not timed at all.
+    :class:`~fakeable.SpanCollector` is a tracer that keeps the spans in
+    memory.
+    """
+    return FAKE_FACTORY.set_tracer(tracer)
 
 
-# the global FakeFactory instance
-FAKE_FACTORY = FakeFactory()
+def set_construction_profile(profile):
+    """
+    Makes the given :class:`~fakeable.ConstructionProfile` count the uses of
+    the fakes that are registered from now on and time the construction of
+    the instances of Fakeable classes, or stops profiling if *profile* is
+    None.  Returns the profile that was previously in use, if any.
+    Instances created by :meth:`fakeable.Fakeable.acreate` are timed
+    including their asynchronous setup.  Profiling adds a small overhead to
+    each construction and is disabled by default; the
+    :mod:`fakeable_pytest` plugin uses it to report on the fakes used by a
+    test suite.
+    """
+    return FAKE_FACTORY.set_profile(profile)
 
 
-def set_fake_class(name, value):
+def find_fakeable_class(name):
     """
-    Configures the class with the given name to create fake objects instead
-    of real objects when created.  When an instance of the class of the
-    given name is created a new instance of the given type will be created
-    instead.
+    Returns the Fakeable class whose fake name (see
+    :class:`~fakeable.Fakeable`) is the given name, or None if no such class
+    exists, such as because its module has not been imported.  If several
+    classes have that name, the most recently created one is returned.
+    """
+    return FAKEABLE_INDEX.get(name)
 
-    Arguments:
-        *name* (string or :class:`fakeable.Fakeable`)
-            the name of the class, or the class itself, that will have fake
-            instances created instead of real instances; if a string, this
-            will be the name of the class or, if the class defines
-            __FAKE_NAME__, the value of that class' __FAKE_NAME__ attribute.
-        *value* (class)
-            the class whose instances will be created in place of the real
-            class; whatever arguments were given to the __init__() method
-            of the real class will be passed on to the __init__() method of
-            the created instance of this class.
 
-    Returns a context manager that can be used as the target of a "with"
-    statement; when the context of the "with" statement is exited the fake
-    class will be automatically unregistered by a call to self.unset(name).
+def fakeable_classes():
     """
-    FAKE_FACTORY.set_fake_class(name, value)
+    Returns a dict that maps the fake names of all existing Fakeable classes
+    to the classes.  Classes are tracked by weak references, so classes that
+    have been garbage collected are not included.
+    """
+    return FAKEABLE_INDEX.snapshot()
 
 
-def set_fake_object(name, value):
+def duplicate_fake_names():
     """
-    Configures the class with the given name to always use a fake object
-    instead of real objects when created.  When an instance of the class of
-    the given name is created the given value will be returned instead.
+    Returns a dict that maps each fake name that is shared by several
+    existing Fakeable classes, defined in different places, to a list of
+    those classes.  A :exc:`~fakeable.DuplicateFakeNameWarning` is also
+    issued when such a class is created.
+    """
+    return FAKEABLE_INDEX.get_duplicates()
 
-    Arguments:
-        *name* (string or :class:`fakeable.Fakeable`)
-            the name of the class, or the class itself, that will have fake
-            instances created instead of real instances; if a string, this
-            will be the name of the class or, if the class defines
-            __FAKE_NAME__, the value of that class' __FAKE_NAME__ attribute.
-        *value* (object)
-            the object to be returned in place of a new instance of the real
-            class; whatever arguments were given to the __init__() method
-            of the real class will be discarded.
 
-    Returns a context manager that can be used as the target of a "with"
-    statement; when the context of the "with" statement is exited the fake
-    object will be automatically unregistered by a call to self.unset(name).
+def set_strict(strict=True):
     """
-    FAKE_FACTORY.set_fake_object(name, value)
+    Enables or disables strict mode, which is disabled by default.
+    In strict mode, registering a fake, such as with
+    :func:`~fakeable.set_fake_class`, raises :exc:`ValueError` if the name is
+    neither a Fakeable class nor the fake name of an existing Fakeable class,
+    which catches misspelled names that would otherwise silently have no
+    effect.  The modules defining the Fakeable classes must therefore be
+    imported before their fakes are registered.
+    """
+    FAKE_FACTORY.strict = strict
 
 
 def unset(name):
@@ -353,6 +5862,11 @@ def unset(name):
     Returns True if a fake was indeed registered with the given name and
     was successfully unregistered.  Returns False if a fake was *not*
     registered with the given name and therefore this function did nothing.
+
+    The unregistered entry is closed, which stops the background threads of
+    warm pools and finishes recordings, for example, unless a snapshot taken
+    with :func:`~fakeable.snapshot_registry` may still restore it; in that
+    case it is closed when the snapshot is restored without it.
     """
     FAKE_FACTORY.unset(name)
 
@@ -371,7 +5885,17 @@ def add_created_callback(callback):
     time that an instance of a :class:`~fakeable.Fakeable` class is created.
 
     Callbacks are invoked synchronously, and in the order in which they are
-    added.  No exception handling is performed around the callbacks; therefore,
+    added.  If a callback returns an awaitable, such as when it is a coroutine
+    function, then the awaitable is scheduled to run on the running event
+    loop instead of being awaited, so that it does not block the creation of
+    the object.  If there is no running event loop, such as in synchronous
+    code, then the awaitable is run on a private event loop in a background
+    thread instead, so the object may be returned before it completes, and
+    the callback must be safe to run in that thread.
+    :func:`~fakeable.join_created_callbacks` waits for the scheduled
+    awaitables to complete.
+
+    No exception handling is performed around the callbacks; therefore,
     if a callback raises an exception it will trickle up the call stack until
     it is either caught or falls of the end, aborting the program.  This will
     also prevent the other callbacks from receiving the notification.
@@ -426,10 +5950,106 @@ def remove_created_callback(callback):
     return FAKE_FACTORY.remove_created_callback(callback)
 
 
+async def join_created_callbacks():
+    """
+    Waits for the awaitables returned by the callbacks registered with
+    :func:`~fakeable.add_created_callback` that were scheduled on the running
+    event loop, or on the private event loop because no event loop was
+    running, to complete, including those scheduled while waiting.
+    Exceptions raised by the awaitables are not propagated; they are passed to
+    the exception handler of the event loop instead.  Synchronous code can
+    wait with ``asyncio.run(fakeable.join_created_callbacks())``.
+    """
+    await FAKE_FACTORY.join_created_callbacks()
+
+
+def watch(name, maxsize=1024, overflow="drop_oldest"):
+    """
+    Subscribes to the creations of the instances of the Fakeable class with
+    the given name (or of the given class), whether real instances or fakes,
+    and returns a :class:`~fakeable.Watch` from which to consume them as a
+    stream.  Creations are queued from the moment this function returns
+    until the watch is closed, which is done when it is used as a context
+    manager and by :func:`~fakeable.clear`.
+
+    *Example*::
+
+        with fakeable.watch("Worker") as watch:
+            start_pool(size=4)
+            workers = watch.wait_for(4, timeout=5.0)
+
+    From a coroutine::
+
+        with fakeable.watch("Request") as watch:
+            async for creation in watch:
+                print(creation.obj)
+
+    The subscription is per class name: creating the instances of other
+    classes is not slowed down by watches.  At most *maxsize* creations are
+    queued; when the queue is full, a creation is handled according to
+    *overflow*: with "drop_oldest" (the default) the oldest queued creation
+    is discarded to make room for it, with "drop" the new creation is
+    discarded, and in both cases the discarded creations are counted in the
+    ``dropped`` attribute of the watch.  With "block" the creating thread
+    waits for the consumer to catch up, providing backpressure; since this
+    stalls the code under test if the consumer stops consuming, it must be
+    asked for explicitly.  Creations are dropped rather than waited for in
+    threads that are running an asyncio event loop, which could otherwise
+    deadlock.
+    """
+    return FAKE_FACTORY.watch(name, maxsize, overflow)
+
+
+def add_destroyed_callback(callback):
+    """
+    Registers a callback to be invoked each time an instance of a
+    :class:`~fakeable.Fakeable` class, or the fake object returned in its
+    place, is garbage collected; this complements
+    :func:`~fakeable.add_created_callback`, for example to compute the number
+    of live instances and their lifetimes.  A
+    :class:`~fakeable.LifetimeHistograms` object can be registered as a
+    callback to aggregate the lifetimes of the instances of each class.
+
+    Objects are tracked with ``weakref.finalize()``, which is only attached
+    to objects created while at least one destroyed callback is registered;
+    objects created before then, and objects that do not support weak
+    references, are not reported.  A fake object that is returned each time
+    that an instance is created is only reported once, when it is destroyed.
+
+    Callbacks are invoked by the garbage collector, at any point of the
+    execution of any thread, so they should be quick and must not acquire
+    non-reentrant locks that may be held by the same thread.  Exceptions
+    raised by callbacks are printed to ``sys.stderr`` and otherwise ignored.
+
+    Callbacks may be unregistered by
+    :func:`~fakeable.remove_destroyed_callback` or :func:`~fakeable.clear`.
+
+    The arguments of the callback function are:
+        *name* (string)
+            the ``__FAKE_NAME__`` of the :class:`~fakeable.Fakeable` class.
+        *obj_type* (class object)
+            the :class:`~fakeable.Fakeable` class.
+        *lifetime* (float)
+            the number of seconds for which the object was alive.
+    """
+    FAKE_FACTORY.add_destroyed_callback(callback)
+
+
+def remove_destroyed_callback(callback):
+    """
+    Unregisters a callback that was registered by a previous invocation of
+    :func:`~fakeable.add_destroyed_callback`.
+    Returns True if the callback was found and removed, or False otherwise.
+    """
+    return FAKE_FACTORY.remove_destroyed_callback(callback)
+
+
 def clear():
     """
     Unregisters all fake objects that have been previously registered
-    and all callbacks that have been registered via add_created_callback().
+    and all callbacks that have been registered via add_created_callback()
+    and add_destroyed_callback().  The entries are closed as described for
+    unset().
     """
     FAKE_FACTORY.clear()
 
@@ -532,3 +6152,55 @@ class FakeableCleanupMixin(object):
             clear()
         finally:
             super(FakeableCleanupMixin, self).tearDown()
+
+
+def main(argv=None):
+    """
+    The command-line interface, which is invoked by ``python -m fakeable``.
+    """
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m fakeable",
+        description="Tools for the fakeable module.")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    control = commands.add_parser("control",
+        help="create, inspect and modify a shared control block")
+    control.add_argument("path", help="the path of the control block file")
+    actions = control.add_subparsers(dest="action")
+    actions.required = True
+    create = actions.add_parser("create", help="create a new control block")
+    create.add_argument("--slots", type=int, default=64,
+        help="the maximum number of names (default: %(default)s)")
+    actions.add_parser("show", help="print the names and their entry ids")
+    set_ = actions.add_parser("set", help="set the entry id of a name; "
+        "0 means the real class")
+    set_.add_argument("name")
+    set_.add_argument("entry_id", type=int)
+    remove = actions.add_parser("remove", help="remove a name")
+    remove.add_argument("name")
+
+    args = parser.parse_args(argv)
+    if args.action == "create":
+        control_block = ControlBlock.create(args.path, args.slots)
+    else:
+        control_block = ControlBlock(args.path)
+    try:
+        if args.action == "set":
+            control_block.set(args.name, args.entry_id)
+        elif args.action == "remove":
+            if not control_block.remove(args.name):
+                print("not found: {}".format(args.name), file=sys.stderr)
+                return 1
+        elif args.action == "show":
+            (generation, table) = control_block.read()
+            print("generation {}".format(generation // 2))
+            for (name, entry_id) in sorted(table.items()):
+                print("{} {}".format(name, entry_id))
+    finally:
+        control_block.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
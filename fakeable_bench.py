@@ -0,0 +1,755 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Denver Coneybeare
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A load-test harness that drives code with :mod:`fakeable` stand-ins in place
+of its real backends and reports its throughput and latency.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import asyncio
+import concurrent.futures
+import gc
+import itertools
+import math
+import threading
+import time
+import tracemalloc
+
+import fakeable
+
+__all__ = [
+    "run",
+    "stand_in",
+    "install_fakes",
+    "BenchmarkReport",
+    "RegressionError",
+    "measure_allocations",
+    "AllocationReport",
+    "measure_registry",
+    "RegistryReport",
+]
+
+MODES = ("thread", "process", "asyncio")
+
+CONSTRUCTION_PATHS = ("real", "object", "class", "callbacks")
+
+
+class StandIn(object):
+    """
+    Describes a stand-in that is registered by invoking a method of the
+    :class:`fakeable.FakeFactory`; see :func:`stand_in`.
+    """
+
+    # marks the instances as stand-ins that register themselves; see
+    # fakeable.FakeFactory.set_stand_in()
+    __fakeable_stand_in__ = True
+
+    def __init__(self, method, args, kwargs):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+
+    def install(self, fake_factory, name):
+        """
+        Registers this stand-in with the given fake factory under the given
+        name and returns the registered entry.
+        """
+        method = getattr(fake_factory, self.method)
+        return method(name, *self.args, **self.kwargs)
+
+    def __repr__(self):
+        return "stand_in({!r}, *{!r}, **{!r})".format(
+            self.method, self.args, self.kwargs)
+
+
+def stand_in(method, *args, **kwargs):
+    """
+    Describes a stand-in for the *fakes* argument of :func:`run` that is not
+    simply a fake class or fake object.  *method* is the name of the
+    :class:`fakeable.FakeFactory` method to register the stand-in with and
+    the remaining arguments are given to that method after the name.
+
+    *Example*: use a real ``Database`` whose methods take about 5ms::
+
+        fakes = {
+            "Database": stand_in("set_fake_latency",
+                latency=fakeable.LognormalLatency(0.005, 0.5)),
+        }
+    """
+    return StandIn(method, args, kwargs)
+
+
+def install_fakes(fakes, fake_factory=None):
+    """
+    Registers the given mapping of ``__FAKE_NAME__`` to stand-in with the
+    given fake factory (by default, the global one).  Each stand-in is a
+    fake class, which is registered with ``set_fake_class()``, a
+    :class:`StandIn` returned from :func:`stand_in`, or any other object,
+    which is registered with ``set_fake_object()``; see
+    :meth:`fakeable.FakeFactory.set_stand_in`.
+    """
+    if fake_factory is None:
+        fake_factory = fakeable.FAKE_FACTORY
+    for (name, value) in fakes.items():
+        fake_factory.set_stand_in(name, value)
+
+
+class RegressionError(AssertionError):
+    """
+    Exception raised by :meth:`BenchmarkReport.check` if a benchmark does not
+    meet its thresholds.
+    """
+    pass
+
+
+class BenchmarkReport(object):
+    """
+    The results of a benchmark run by :func:`run`.
+
+    Attributes:
+        *latencies* (list of float)
+            the sorted duration, in seconds, of each successful invocation of
+            the workload.
+        *errors* (int)
+            the number of invocations of the workload that raised an
+            exception.
+        *first_error* (string)
+            the ``repr()`` of the first exception raised, or None.
+        *elapsed* (float)
+            the wall-clock time, in seconds, that the benchmark took.
+        *mode* (string) and *concurrency* (int)
+            how the benchmark was run.
+    """
+
+    def __init__(self, latencies, errors, first_error, elapsed, mode,
+            concurrency):
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.first_error = first_error
+        self.elapsed = elapsed
+        self.mode = mode
+        self.concurrency = concurrency
+
+    @property
+    def count(self):
+        """
+        The total number of invocations of the workload, including errors.
+        """
+        return len(self.latencies) + self.errors
+
+    @property
+    def throughput(self):
+        """
+        The number of invocations of the workload per second.
+        """
+        if self.elapsed <= 0:
+            return 0.0
+        return self.count / self.elapsed
+
+    @property
+    def error_rate(self):
+        """
+        The fraction of invocations of the workload that raised an exception.
+        """
+        if self.count == 0:
+            return 0.0
+        return self.errors / self.count
+
+    @property
+    def mean(self):
+        """
+        The mean latency, in seconds, of the successful invocations.
+        """
+        if not self.latencies:
+            return None
+        return math.fsum(self.latencies) / len(self.latencies)
+
+    def percentile(self, percent):
+        """
+        Returns the latency, in seconds, below which the given percentage of
+        the successful invocations fell, using the nearest-rank method.
+        Returns None if there were no successful invocations.
+        """
+        if not self.latencies:
+            return None
+        # round before taking the ceiling so that floating-point error does
+        # not bump the rank, such as 99.9% of 1000 giving 999.0000000000001
+        rank = int(math.ceil(round(percent / 100.0 * len(self.latencies), 9)))
+        return self.latencies[max(rank, 1) - 1]
+
+    @property
+    def p50(self):
+        """
+        The median latency, in seconds.
+        """
+        return self.percentile(50)
+
+    @property
+    def p99(self):
+        """
+        The 99th percentile latency, in seconds.
+        """
+        return self.percentile(99)
+
+    @property
+    def p999(self):
+        """
+        The 99.9th percentile latency, in seconds.
+        """
+        return self.percentile(99.9)
+
+    def check(self, max_p50=None, max_p99=None, max_p999=None,
+            min_throughput=None, max_error_rate=None):
+        """
+        Checks the results against the given thresholds, each of which is
+        ignored if None; latencies are in seconds and throughput is in
+        invocations per second.  Raises :exc:`RegressionError` describing
+        every threshold that was not met, which makes this method suitable
+        for use in continuous integration.
+        """
+        failures = []
+        for (label, actual, limit) in (
+                ("p50", self.p50, max_p50),
+                ("p99", self.p99, max_p99),
+                ("p999", self.p999, max_p999)):
+            if limit is not None and (actual is None or actual > limit):
+                failures.append("{} latency {} exceeds {:.6f}s".format(
+                    label, _format_seconds(actual), limit))
+        if min_throughput is not None and self.throughput < min_throughput:
+            failures.append("throughput {:.1f}/s is below {:.1f}/s".format(
+                self.throughput, min_throughput))
+        if max_error_rate is not None and self.error_rate > max_error_rate:
+            failures.append("error rate {:.4f} exceeds {:.4f}".format(
+                self.error_rate, max_error_rate))
+        if failures:
+            raise RegressionError("; ".join(failures))
+
+    def __str__(self):
+        return ("{} invocations in {:.3f}s ({} x {}): {:.1f}/s, "
+            "p50={} p99={} p999={}, {} errors").format(
+            self.count, self.elapsed, self.concurrency, self.mode,
+            self.throughput, _format_seconds(self.p50),
+            _format_seconds(self.p99), _format_seconds(self.p999),
+            self.errors)
+
+
+def _format_seconds(seconds):
+    if seconds is None:
+        return "n/a"
+    return "{:.6f}s".format(seconds)
+
+
+def run(workload, fakes=None, concurrency=1, mode="thread", iterations=None,
+        duration=None, warmup=0):
+    """
+    Runs a benchmark of the given workload with the given stand-ins
+    registered and returns a :class:`BenchmarkReport` with the results.
+
+    Arguments:
+        *workload* (function)
+            the function to benchmark, which is invoked with no arguments;
+            in "asyncio" mode this must be a coroutine function.
+        *fakes* (dict)
+            maps the ``__FAKE_NAME__`` (or class) of each
+            :class:`fakeable.Fakeable` class to its stand-in; see
+            :func:`install_fakes` for the accepted stand-ins.  The fakes are
+            registered for the duration of the benchmark only and any fakes
+            previously registered with the same names are restored afterwards.
+        *concurrency* (int)
+            the number of threads, processes or asyncio tasks that invoke the
+            workload concurrently.
+        *mode* (string)
+            "thread" to use threads, "process" to use processes, in which case
+            the workload and stand-ins must be picklable, or "asyncio" to use
+            asyncio tasks in a new event loop.
+        *iterations* (int)
+            the total number of times to invoke the workload.
+        *duration* (float)
+            the number of seconds for which to invoke the workload.
+            Exactly one of *iterations* and *duration* must be specified.
+        *warmup* (int)
+            the number of times that each thread, process or task invokes the
+            workload before measurements begin.
+    """
+    if mode not in MODES:
+        raise ValueError("invalid mode: {!r} (expected one of {})".format(
+            mode, ", ".join(MODES)))
+    if (iterations is None) == (duration is None):
+        raise ValueError("exactly one of iterations and duration must be "
+            "specified")
+    if concurrency < 1:
+        raise ValueError("invalid concurrency: {!r}".format(concurrency))
+    fakes = {} if fakes is None else dict(fakes)
+
+    fake_factory = fakeable.FAKE_FACTORY
+    # unlike saving and re-registering the replaced entries, a snapshot keeps
+    # them from being closed while they are replaced
+    snapshot = fake_factory.snapshot()
+    install_fakes(fakes, fake_factory)
+    try:
+        if mode == "thread":
+            results = _run_threads(workload, concurrency, iterations,
+                duration, warmup)
+        elif mode == "process":
+            results = _run_processes(workload, fakes, concurrency, iterations,
+                duration, warmup)
+        else:
+            results = asyncio.run(_run_tasks(workload, concurrency,
+                iterations, duration, warmup))
+    finally:
+        fake_factory.restore(snapshot)
+
+    (latencies, errors, first_error, elapsed) = results
+    return BenchmarkReport(latencies, errors, first_error, elapsed, mode,
+        concurrency)
+
+
+class _Worker(object):
+    """
+    Invokes a workload repeatedly and records the latency of each invocation.
+    Invocations are shared between the workers by a shared counter, if
+    running a fixed number of iterations, or a shared deadline.
+    """
+
+    def __init__(self, workload, counter, iterations, deadline):
+        self.workload = workload
+        self.counter = counter
+        self.iterations = iterations
+        self.deadline = deadline
+        self.latencies = []
+        self.errors = 0
+        self.first_error = None
+
+    def more(self):
+        if self.iterations is not None:
+            return next(self.counter) < self.iterations
+        return time.perf_counter() < self.deadline
+
+    def record(self, start, error):
+        if error is None:
+            self.latencies.append(time.perf_counter() - start)
+        else:
+            self.errors += 1
+            if self.first_error is None:
+                self.first_error = repr(error)
+
+    def run(self):
+        workload = self.workload
+        perf_counter = time.perf_counter
+        while self.more():
+            error = None
+            start = perf_counter()
+            try:
+                workload()
+            except Exception as e:
+                error = e
+            self.record(start, error)
+        return self
+
+    async def run_async(self):
+        workload = self.workload
+        perf_counter = time.perf_counter
+        while self.more():
+            error = None
+            start = perf_counter()
+            try:
+                await workload()
+            except Exception as e:
+                error = e
+            self.record(start, error)
+        return self
+
+
+def _warm_up(workload, warmup):
+    for _ in range(warmup):
+        try:
+            workload()
+        except Exception:
+            pass
+
+
+def _merge(workers, elapsed):
+    latencies = []
+    errors = 0
+    first_error = None
+    for worker in workers:
+        latencies.extend(worker.latencies)
+        errors += worker.errors
+        if first_error is None:
+            first_error = worker.first_error
+    return (latencies, errors, first_error, elapsed)
+
+
+def _run_threads(workload, concurrency, iterations, duration, warmup):
+    counter = itertools.count()
+    barrier = threading.Barrier(concurrency + 1)
+    workers = []
+    threads = []
+
+    def thread_main(worker):
+        _warm_up(workload, warmup)
+        barrier.wait()
+        barrier.wait()
+        worker.run()
+
+    for i in range(concurrency):
+        worker = _Worker(workload, counter, iterations, None)
+        workers.append(worker)
+        thread = threading.Thread(target=thread_main, args=(worker,),
+            name="fakeable-bench-{}".format(i))
+        thread.daemon = True
+        threads.append(thread)
+        thread.start()
+
+    # wait for all threads to finish warming up, then set the deadline and
+    # release them all at once
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.deadline = None if duration is None else start + duration
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    return _merge(workers, time.perf_counter() - start)
+
+
+def _process_main(workload, iterations, duration, warmup):
+    _warm_up(workload, warmup)
+    start = time.perf_counter()
+    deadline = None if duration is None else start + duration
+    worker = _Worker(workload, itertools.count(), iterations, deadline)
+    worker.run()
+    worker.elapsed = time.perf_counter() - start
+    # only the measurements need to be sent back to the parent process
+    worker.workload = worker.counter = None
+    return worker
+
+
+def _run_processes(workload, fakes, concurrency, iterations, duration,
+        warmup):
+    if iterations is None:
+        shares = [None] * concurrency
+    else:
+        (share, remainder) = divmod(iterations, concurrency)
+        shares = [share + (1 if i < remainder else 0)
+            for i in range(concurrency)]
+
+    with concurrent.futures.ProcessPoolExecutor(concurrency,
+            initializer=install_fakes, initargs=(fakes,)) as executor:
+        futures = [executor.submit(_process_main, workload, share, duration,
+            warmup) for share in shares]
+        workers = [future.result() for future in futures]
+
+    # the clock is started by each worker process, rather than here, so that
+    # the time taken to start the worker processes is not measured
+    elapsed = max(worker.elapsed for worker in workers)
+    return _merge(workers, elapsed)
+
+
+async def _run_tasks(workload, concurrency, iterations, duration, warmup):
+    for _ in range(warmup * concurrency):
+        try:
+            await workload()
+        except Exception:
+            pass
+    counter = itertools.count()
+    start = time.perf_counter()
+    deadline = None if duration is None else start + duration
+    workers = [_Worker(workload, counter, iterations, deadline)
+        for _ in range(concurrency)]
+    await asyncio.gather(*(worker.run_async() for worker in workers))
+    return _merge(workers, time.perf_counter() - start)
+
+
+class AllocationReport(object):
+    """
+    The memory allocated by the construction of instances of a
+    :class:`fakeable.Fakeable` class along one construction path, as
+    measured by :func:`measure_allocations`.
+
+    Attributes:
+        *path* (string)
+            the construction path; see :func:`measure_allocations`.
+        *constructions* (int)
+            the number of constructions measured.
+        *peak_bytes* (float)
+            the mean, over the constructions, of the peak number of bytes
+            allocated during a construction, including temporary objects
+            such as argument tuples and exceptions.
+        *retained_bytes* (float) and *retained_blocks* (float)
+            the mean number of bytes, and of memory blocks (roughly, of
+            objects), that are still allocated after a construction, which
+            includes the created object itself.
+    """
+
+    def __init__(self, path, constructions, peak_bytes, retained_bytes,
+            retained_blocks):
+        self.path = path
+        self.constructions = constructions
+        self.peak_bytes = peak_bytes
+        self.retained_bytes = retained_bytes
+        self.retained_blocks = retained_blocks
+
+    def check(self, max_peak_bytes=None, max_retained_bytes=None,
+            max_retained_blocks=None):
+        """
+        Checks the results against the given budgets, each of which is
+        ignored if None.  Raises :exc:`RegressionError` describing every
+        budget that was exceeded.
+        """
+        failures = []
+        for (label, actual, limit) in (
+                ("peak bytes", self.peak_bytes, max_peak_bytes),
+                ("retained bytes", self.retained_bytes, max_retained_bytes),
+                ("retained blocks", self.retained_blocks,
+                    max_retained_blocks)):
+            if limit is not None and actual > limit:
+                failures.append("{} per construction {:.1f} exceeds "
+                    "{}".format(label, actual, limit))
+        if failures:
+            raise RegressionError("{} construction: {}".format(self.path,
+                "; ".join(failures)))
+
+    def __str__(self):
+        return ("{}: {:.1f} peak bytes, {:.1f} retained bytes, {:.1f} "
+            "retained blocks per construction ({} constructions)").format(
+            self.path, self.peak_bytes, self.retained_bytes,
+            self.retained_blocks, self.constructions)
+
+
+class _AllocationSubject(metaclass=fakeable.Fakeable):
+    """
+    The Fakeable class constructed by measure_allocations().
+    """
+
+    __FAKE_NAME__ = "fakeable_bench._AllocationSubject"
+
+    def __init__(self, arg1, arg2, key=None):
+        pass
+
+
+class _FakeAllocationSubject(object):
+
+    def __init__(self, arg1, arg2, key=None):
+        pass
+
+
+def _ignore_created(name, obj, obj_type):
+    pass
+
+
+def measure_allocations(paths=CONSTRUCTION_PATHS, constructions=1000,
+        warmup=100):
+    """
+    Measures, using ``tracemalloc``, the memory allocated by the construction
+    of an instance of a :class:`fakeable.Fakeable` class, with positional and
+    keyword arguments, along each of the given construction paths, and
+    returns a dict that maps each path to an :class:`AllocationReport`.
+    Combined with :meth:`AllocationReport.check`, this catches allocation
+    regressions on the construction hot path in continuous integration.
+
+    The construction paths are:
+        ``"real"``
+            no fake is registered, so a real instance is created.
+        ``"object"``
+            a fake object is registered with ``set_fake_object()``.
+        ``"class"``
+            a fake class is registered with ``set_fake_class()``.
+        ``"callbacks"``
+            no fake is registered, but a created callback is.
+
+    *Example*::
+
+        reports = fakeable_bench.measure_allocations()
+        reports["real"].check(max_peak_bytes=1024, max_retained_blocks=2)
+
+    The fakes and callbacks used are registered only while measuring; the
+    fakes and callbacks registered by the caller are left untouched.
+    Measurements are made with the garbage collector disabled, and are only
+    comparable between runs on the same Python version.
+    """
+    for path in paths:
+        if path not in CONSTRUCTION_PATHS:
+            raise ValueError("invalid construction path: {!r} (expected one "
+                "of {})".format(path, ", ".join(CONSTRUCTION_PATHS)))
+    if constructions < 1:
+        raise ValueError("invalid constructions: {!r}".format(constructions))
+
+    fake_factory = fakeable.FAKE_FACTORY
+    name = _AllocationSubject.__FAKE_NAME__
+    fake_object = _FakeAllocationSubject(1, 2)
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    reports = {}
+    try:
+        for path in paths:
+            if path == "object":
+                fake_factory.set_fake_object(name, fake_object)
+            elif path == "class":
+                fake_factory.set_fake_class(name, _FakeAllocationSubject)
+            elif path == "callbacks":
+                fake_factory.add_created_callback(_ignore_created)
+            try:
+                reports[path] = _measure_path(path, constructions, warmup)
+            finally:
+                fake_factory.unset(name)
+                fake_factory.remove_created_callback(_ignore_created)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+        if not was_tracing:
+            tracemalloc.stop()
+    return reports
+
+
+def _measure_path(path, constructions, warmup):
+    subject = _AllocationSubject
+    for _ in range(warmup):
+        subject(1, 2, key=3)
+
+    # the peak of each construction, with the created object discarded
+    peak_total = 0
+    for _ in range(constructions):
+        tracemalloc.reset_peak()
+        (before, _) = tracemalloc.get_traced_memory()
+        subject(1, 2, key=3)
+        peak_total += tracemalloc.get_traced_memory()[1] - before
+
+    # the memory still allocated after the constructions, with the created
+    # objects kept alive; the list is allocated beforehand so that it does
+    # not grow while measuring
+    instances = [None] * constructions
+    snapshot_filter = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    before = tracemalloc.take_snapshot().filter_traces(snapshot_filter)
+    for i in range(constructions):
+        instances[i] = subject(1, 2, key=3)
+    after = tracemalloc.take_snapshot().filter_traces(snapshot_filter)
+    retained_bytes = 0
+    retained_blocks = 0
+    for statistic in after.compare_to(before, "filename"):
+        retained_bytes += statistic.size_diff
+        retained_blocks += statistic.count_diff
+    del instances
+
+    return AllocationReport(path, constructions, peak_total / constructions,
+        retained_bytes / constructions, retained_blocks / constructions)
+
+
+class RegistryReport(object):
+    """
+    The memory used by, and the speed of lookups in, a large registry of
+    fakes, as measured by :func:`measure_registry`.
+
+    Attributes:
+        *registrations* (int)
+            the number of fakes registered.
+        *bytes_per_registration* (float)
+            the mean number of bytes allocated by each registration, including
+            its share of the registry's hash table.
+        *lookup_seconds* (float)
+            the mean time, in seconds, to create a fake object from the
+            registry, by name, as done for each construction.
+    """
+
+    def __init__(self, registrations, bytes_per_registration,
+            lookup_seconds):
+        self.registrations = registrations
+        self.bytes_per_registration = bytes_per_registration
+        self.lookup_seconds = lookup_seconds
+
+    def check(self, max_bytes_per_registration=None, max_lookup_seconds=None):
+        """
+        Checks the results against the given budgets, each of which is
+        ignored if None.  Raises :exc:`RegressionError` describing every
+        budget that was exceeded.
+        """
+        failures = []
+        if (max_bytes_per_registration is not None
+                and self.bytes_per_registration > max_bytes_per_registration):
+            failures.append("{:.1f} bytes per registration exceeds {}".format(
+                self.bytes_per_registration, max_bytes_per_registration))
+        if (max_lookup_seconds is not None
+                and self.lookup_seconds > max_lookup_seconds):
+            failures.append("lookup time {} exceeds {:.9f}s".format(
+                _format_seconds(self.lookup_seconds), max_lookup_seconds))
+        if failures:
+            raise RegressionError("; ".join(failures))
+
+    def __str__(self):
+        return ("{} registrations: {:.1f} bytes per registration, "
+            "{:.0f}ns per lookup").format(self.registrations,
+            self.bytes_per_registration, self.lookup_seconds * 1e9)
+
+
+def measure_registry(registrations=100000, lookups=100000, kind="object"):
+    """
+    Registers the given number of fakes in a new
+    :class:`fakeable.FakeFactory`, measuring the memory that they use with
+    ``tracemalloc``, then times the given number of lookups of those fakes,
+    and returns a :class:`RegistryReport` with the results.
+    *kind* is the kind of fake to register: "object" to register fake
+    objects with ``set_fake_object()`` or "class" to register fake classes
+    with ``set_fake_class()``.  The global registry is not affected.
+
+    *Example*::
+
+        report = fakeable_bench.measure_registry()
+        report.check(max_bytes_per_registration=128)
+    """
+    if kind not in ("object", "class"):
+        raise ValueError("invalid kind: {!r} (expected \"object\" or "
+            "\"class\")".format(kind))
+    if registrations < 1:
+        raise ValueError("invalid registrations: {!r}".format(registrations))
+    fake_factory = fakeable.FakeFactory()
+    # the names are created beforehand so that they are not counted
+    names = ["Fake{}".format(i) for i in range(registrations)]
+    if kind == "object":
+        register = fake_factory.set_fake_object
+        value = _FakeAllocationSubject(1, 2)
+    else:
+        register = fake_factory.set_fake_class
+        value = object
+
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    try:
+        (before, _) = tracemalloc.get_traced_memory()
+        for name in names:
+            register(name, value)
+        (after, _) = tracemalloc.get_traced_memory()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    create = fake_factory.create
+    order = [names[(i * 7919) % registrations] for i in range(lookups)]
+    args = ()
+    kwargs = {}
+    start = time.perf_counter()
+    for name in order:
+        create(name, None, args, kwargs)
+    elapsed = time.perf_counter() - start
+
+    return RegistryReport(registrations, (after - before) / registrations,
+        elapsed / lookups if lookups else 0.0)
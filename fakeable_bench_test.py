@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Denver Coneybeare
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import fakeable
+import fakeable_bench
+
+import tracemalloc
+import unittest
+
+import six
+
+
+class MyBackend(six.with_metaclass(fakeable.Fakeable)):
+    def query(self):
+        raise IOError("the real backend is not available in unit tests")
+
+
+class MyFakeBackend(object):
+    def query(self):
+        return 42
+
+
+class MyFailingBackend(object):
+    def query(self):
+        raise IOError("failed")
+
+
+def my_workload():
+    return MyBackend().query()
+
+
+async def my_async_workload():
+    return MyBackend().query()
+
+
+class Test_run(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def test_Threads_Iterations(self):
+        report = fakeable_bench.run(my_workload,
+            fakes={"MyBackend": MyFakeBackend}, concurrency=4,
+            iterations=1000)
+        self.assertEqual(report.count, 1000)
+        self.assertEqual(report.errors, 0)
+        self.assertEqual(report.mode, "thread")
+        self.assertEqual(report.concurrency, 4)
+        self.assertGreater(report.throughput, 0)
+        self.assertLessEqual(report.p50, report.p99)
+        self.assertLessEqual(report.p99, report.p999)
+
+    def test_Threads_Duration(self):
+        report = fakeable_bench.run(my_workload,
+            fakes={"MyBackend": MyFakeBackend}, concurrency=2, duration=0.05)
+        self.assertGreater(report.count, 0)
+        self.assertGreaterEqual(report.elapsed, 0.05)
+
+    def test_Processes(self):
+        report = fakeable_bench.run(my_workload,
+            fakes={"MyBackend": MyFakeBackend}, concurrency=2, mode="process",
+            iterations=101)
+        self.assertEqual(report.count, 101)
+        self.assertEqual(report.errors, 0)
+
+    def test_Asyncio(self):
+        report = fakeable_bench.run(my_async_workload,
+            fakes={"MyBackend": MyFakeBackend}, concurrency=8, mode="asyncio",
+            iterations=100, warmup=2)
+        self.assertEqual(report.count, 100)
+        self.assertEqual(report.errors, 0)
+
+    def test_Errors(self):
+        report = fakeable_bench.run(my_workload,
+            fakes={"MyBackend": MyFailingBackend}, iterations=10)
+        self.assertEqual(report.errors, 10)
+        self.assertEqual(report.error_rate, 1.0)
+        self.assertIn("failed", report.first_error)
+        self.assertIsNone(report.p50)
+
+    def test_StandIn(self):
+        stand_in = fakeable_bench.stand_in("set_fake_latency", MyFakeBackend,
+            latency=0.001)
+        report = fakeable_bench.run(my_workload,
+            fakes={"MyBackend": stand_in}, iterations=10)
+        self.assertEqual(report.errors, 0)
+        self.assertGreaterEqual(report.p50, 0.001)
+
+    def test_FakesRestoredAfterwards(self):
+        fake_object = MyFakeBackend()
+        fakeable.set_fake_object("MyBackend", fake_object)
+        fakeable_bench.run(my_workload,
+            fakes={"MyBackend": MyFailingBackend, "Other": object()},
+            iterations=1)
+        self.assertIs(MyBackend(), fake_object)
+        self.assertNotIn("Other", fakeable.FAKE_FACTORY.fake_factories)
+
+    def test_ReplacedEntriesStillUsable(self):
+        pool = fakeable.set_warm_pool("MyBackend", size=1)
+        fakeable_bench.run(my_workload, fakes={"MyBackend": MyFakeBackend},
+            iterations=1)
+        self.assertIs(fakeable.FAKE_FACTORY.fake_factories["MyBackend"], pool)
+        self.assertTrue(pool.wait_until_full(5))
+        self.assertIsInstance(MyBackend(), MyBackend)
+        self.assertEqual(pool.hits, 1)
+
+    def test_InvalidArguments(self):
+        with self.assertRaises(ValueError):
+            fakeable_bench.run(my_workload, mode="fibers", iterations=1)
+        with self.assertRaises(ValueError):
+            fakeable_bench.run(my_workload)
+        with self.assertRaises(ValueError):
+            fakeable_bench.run(my_workload, iterations=1, duration=1)
+
+
+class Test_BenchmarkReport(unittest.TestCase):
+
+    def make_report(self):
+        latencies = [(i + 1) / 1000.0 for i in range(1000)]
+        return fakeable_bench.BenchmarkReport(latencies, 0, None, 2.0,
+            "thread", 1)
+
+    def test_Percentiles(self):
+        report = self.make_report()
+        self.assertEqual(report.p50, 0.5)
+        self.assertEqual(report.p99, 0.99)
+        self.assertEqual(report.p999, 0.999)
+        self.assertEqual(report.throughput, 500)
+
+    def test_check_Passes(self):
+        report = self.make_report()
+        report.check(max_p50=0.5, max_p99=1, max_p999=1, min_throughput=500,
+            max_error_rate=0)
+
+    def test_check_Fails(self):
+        report = self.make_report()
+        with self.assertRaises(fakeable_bench.RegressionError) as cm:
+            report.check(max_p99=0.5, min_throughput=1000)
+        message = str(cm.exception)
+        self.assertIn("p99", message)
+        self.assertIn("throughput", message)
+
+    def test_str(self):
+        self.assertIn("1000 invocations", str(self.make_report()))
+
+
+class Test_measure_allocations(
+        fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def test_AllPaths(self):
+        reports = fakeable_bench.measure_allocations(constructions=50,
+            warmup=5)
+        self.assertEqual(sorted(reports), sorted(
+            fakeable_bench.CONSTRUCTION_PATHS))
+        for (path, report) in reports.items():
+            self.assertEqual(report.path, path)
+            self.assertEqual(report.constructions, 50)
+            self.assertGreater(report.peak_bytes, 0)
+        # the fake object is not a new object, so nothing is retained
+        self.assertLess(reports["object"].retained_blocks, 1)
+        self.assertGreaterEqual(reports["real"].retained_blocks, 1)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_RegisteredFakesUntouched(self):
+        callback = lambda name, obj, obj_type: None
+        fakeable.add_created_callback(callback)
+        fakeable.set_fake_object("MyBackend", 5)
+        fakeable_bench.measure_allocations(["object", "callbacks"],
+            constructions=10)
+        self.assertEqual(MyBackend(), 5)
+        self.assertEqual(fakeable.FAKE_FACTORY.fakeable_created_callbacks,
+            [callback])
+        self.assertNotIn("fakeable_bench._AllocationSubject",
+            fakeable.FAKE_FACTORY.fake_factories)
+
+    def test_InvalidArguments(self):
+        with self.assertRaises(ValueError):
+            fakeable_bench.measure_allocations(["bogus"])
+        with self.assertRaises(ValueError):
+            fakeable_bench.measure_allocations(constructions=0)
+
+
+class Test_AllocationReport(unittest.TestCase):
+
+    def make_report(self):
+        return fakeable_bench.AllocationReport("real", 100, 800.0, 72.0, 2.0)
+
+    def test_check_Passes(self):
+        self.make_report().check(max_peak_bytes=800, max_retained_bytes=72,
+            max_retained_blocks=2)
+
+    def test_check_Fails(self):
+        with self.assertRaises(fakeable_bench.RegressionError) as cm:
+            self.make_report().check(max_peak_bytes=512,
+                max_retained_blocks=1)
+        message = str(cm.exception)
+        self.assertIn("peak bytes", message)
+        self.assertIn("retained blocks", message)
+        self.assertNotIn("retained bytes", message)
+
+    def test_str(self):
+        self.assertIn("real: 800.0 peak bytes", str(self.make_report()))
+
+
+class Test_measure_registry(unittest.TestCase):
+
+    def test_Object(self):
+        report = fakeable_bench.measure_registry(1000, 1000)
+        self.assertEqual(report.registrations, 1000)
+        self.assertGreater(report.bytes_per_registration, 0)
+        self.assertGreater(report.lookup_seconds, 0)
+        self.assertNotIn("Fake0", fakeable.FAKE_FACTORY.fake_factories)
+
+    def test_Class(self):
+        report = fakeable_bench.measure_registry(1000, 10, kind="class")
+        self.assertGreater(report.bytes_per_registration, 0)
+
+    def test_InvalidArguments(self):
+        with self.assertRaises(ValueError):
+            fakeable_bench.measure_registry(kind="factory")
+        with self.assertRaises(ValueError):
+            fakeable_bench.measure_registry(0)
+
+    def test_check(self):
+        report = fakeable_bench.RegistryReport(1000, 100.0, 1e-7)
+        report.check(max_bytes_per_registration=100, max_lookup_seconds=1e-7)
+        with self.assertRaises(fakeable_bench.RegressionError):
+            report.check(max_bytes_per_registration=64)
+        with self.assertRaises(fakeable_bench.RegressionError):
+            report.check(max_lookup_seconds=1e-8)
+
+
+if __name__ == "__main__":
+    unittest.main()
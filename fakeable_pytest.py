@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Denver Coneybeare
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A pytest plugin that isolates the tests from the fakes registered by other
+tests and reports on the fakes used by the test suite.
+
+Enable it with ``-p fakeable_pytest`` on the command line, or by adding
+``pytest_plugins = ["fakeable_pytest"]`` to the top-level ``conftest.py``.
+
+Each test runs between :func:`fakeable.snapshot_registry` and
+:func:`fakeable.restore_registry`, so the fakes and callbacks that it, or its
+function-scoped fixtures, registers are unregistered after it in time
+proportional to the number of changes it made, while those registered by
+fixtures of wider scope are kept.  The ``fake_factory`` fixture returns the
+:class:`fakeable.FakeFactory`, whose methods register fakes::
+
+    def test_something(fake_factory):
+        fake_factory.set_fake_class("Something", FakeSomething)
+        assert do_something()
+
+With the ``--fakeable-report`` option, the registered fakes that were never
+used to create an instance and the Fakeable classes whose instances took the
+most time to create are reported at the end of the session; when the tests
+are distributed by pytest-xdist, the profiles of the workers are combined by
+the controller.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import pytest
+
+import fakeable
+
+__all__ = [
+    "fake_factory",
+    "FakeableReporter",
+]
+
+# the key of the profile in the workeroutput of pytest-xdist workers
+WORKER_OUTPUT_KEY = "fakeable_profile"
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("fakeable")
+    group.addoption("--fakeable-report", action="store_true", default=False,
+        help="report the registered fakes that were never used and the "
+        "Fakeable classes that were the most expensive to construct")
+    group.addoption("--fakeable-report-count", type=int, default=10,
+        metavar="N", help="the number of classes to list in the fakeable "
+        "report (default: %(default)s)")
+
+
+def pytest_configure(config):
+    if config.getoption("fakeable_report"):
+        config.pluginmanager.register(FakeableReporter(config),
+            "fakeable-reporter")
+
+
+@pytest.fixture(autouse=True)
+def _fakeable_isolation():
+    snapshot = fakeable.snapshot_registry()
+    try:
+        yield
+    finally:
+        fakeable.restore_registry(snapshot)
+
+
+@pytest.fixture
+def fake_factory(_fakeable_isolation):
+    """
+    Returns :data:`fakeable.FAKE_FACTORY`; the fakes registered with it are
+    unregistered after the test.
+    """
+    return fakeable.FAKE_FACTORY
+
+
+class FakeableReporter(object):
+    """
+    Profiles the construction of the instances of Fakeable classes during
+    the session with a :class:`fakeable.ConstructionProfile` and reports on
+    it at the end of the session; registered by the ``--fakeable-report``
+    option.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.profile = fakeable.ConstructionProfile()
+        self.previous_profile = fakeable.set_construction_profile(
+            self.profile)
+
+    def pytest_unconfigure(self, config):
+        fakeable.set_construction_profile(self.previous_profile)
+
+    def pytest_sessionfinish(self, session):
+        workeroutput = getattr(session.config, "workeroutput", None)
+        if workeroutput is not None:
+            workeroutput[WORKER_OUTPUT_KEY] = self.profile.to_dict()
+
+    @pytest.hookimpl(optionalhook=True)
+    def pytest_testnodedown(self, node, error):
+        data = getattr(node, "workeroutput", {}).get(WORKER_OUTPUT_KEY)
+        if data is not None:
+            self.profile.merge(data)
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if hasattr(self.config, "workerinput"):
+            return
+        write_line = terminalreporter.write_line
+        terminalreporter.write_sep("=", "fakeable report")
+
+        never_hit = self.profile.never_hit()
+        if never_hit:
+            write_line("registered fakes that were never used ({}):".format(
+                len(never_hit)))
+            for (name, entry_type) in never_hit:
+                write_line("  {} ({})".format(name, entry_type))
+        else:
+            write_line("every registered fake was used")
+
+        costs = self.profile.most_expensive(
+            self.config.getoption("fakeable_report_count"))
+        if costs:
+            write_line("most expensive Fakeable classes to construct:")
+            write_line("  {:>10} {:>10} {:>10}  {}".format(
+                "total (s)", "count", "max (ms)", "name"))
+            for cost in costs:
+                write_line("  {:>10.4f} {:>10} {:>10.3f}  {}".format(
+                    cost.total_seconds, cost.count, cost.max_seconds * 1000,
+                    cost.name))
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2013 Denver Coneybeare
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+import fakeable
+import fakeable_pytest
+
+TEST_MODULE = """
+import pytest
+
+import fakeable
+
+
+class Database(metaclass=fakeable.Fakeable):
+    pass
+
+
+class FakeDatabase(object):
+    pass
+
+
+@pytest.fixture(scope="module")
+def unused_fake():
+    fakeable.set_fake_object("Unused", object())
+    yield
+    fakeable.unset("Unused")
+
+
+def test_register(fake_factory, unused_fake):
+    fake_factory.set_fake_class("Database", FakeDatabase)
+    assert isinstance(Database(), FakeDatabase)
+
+
+def test_isolated(unused_fake):
+    assert isinstance(Database(), Database)
+    assert fakeable.FAKE_FACTORY.get("Unused") is not None
+
+
+def test_clear():
+    fakeable.clear()
+
+
+def test_not_cleared():
+    assert fakeable.FAKE_FACTORY.get("Unused") is not None
+"""
+
+
+class Test_plugin(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        with open(os.path.join(self.temp_dir, "test_module.py"), "w") as f:
+            f.write(textwrap.dedent(TEST_MODULE))
+
+    def run_pytest(self, *args):
+        env = dict(os.environ)
+        package_dir = os.path.dirname(os.path.abspath(fakeable.__file__))
+        env["PYTHONPATH"] = os.pathsep.join(
+            [package_dir] + env.get("PYTHONPATH", "").split(os.pathsep))
+        process = subprocess.run([sys.executable, "-m", "pytest", "-p",
+            "fakeable_pytest", "-p", "no:cacheprovider"] + list(args),
+            cwd=self.temp_dir, env=env, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, universal_newlines=True)
+        return (process.returncode, process.stdout)
+
+    def test_Isolation(self):
+        (returncode, output) = self.run_pytest("test_module.py")
+        self.assertEqual(returncode, 0, output)
+        self.assertNotIn("fakeable report", output)
+
+    def test_Report(self):
+        (returncode, output) = self.run_pytest("--fakeable-report",
+            "test_module.py")
+        self.assertEqual(returncode, 0, output)
+        self.assertIn("fakeable report", output)
+        self.assertIn("  Unused (FakeObjectEntry)", output)
+        self.assertNotIn("Database (FakeClassEntry)", output)
+        self.assertIn("most expensive Fakeable classes to construct", output)
+        self.assertRegex(output, r"\s2\s+[0-9.]+  Database\n")
+
+
+class Test_FakeableReporter(unittest.TestCase):
+
+    def test_pytest_testnodedown(self):
+        profile = fakeable.ConstructionProfile()
+        profile.registered.add(("Database", "FakeClassEntry"))
+        reporter = fakeable_pytest.FakeableReporter.__new__(
+            fakeable_pytest.FakeableReporter)
+        reporter.profile = fakeable.ConstructionProfile()
+
+        class Node(object):
+            workeroutput = {
+                fakeable_pytest.WORKER_OUTPUT_KEY: profile.to_dict()}
+
+        reporter.pytest_testnodedown(Node(), None)
+        reporter.pytest_testnodedown(object(), None)
+        self.assertEqual(reporter.profile.never_hit(),
+            [("Database", "FakeClassEntry")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -19,7 +19,26 @@ from __future__ import unicode_literals
 
 import fakeable
 
+import asyncio
+import gc
+import itertools
+import concurrent.futures
+import contextvars
+import json
+import multiprocessing
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
 import unittest
+import warnings
+import weakref
+import unittest.mock
 
 import six
 
@@ -56,6 +75,112 @@ class MyCoolClassCustomFakeName(six.with_metaclass(fakeable.Fakeable)):
         self.arg2 = arg2
 
 
+class MyCalculator(six.with_metaclass(fakeable.Fakeable)):
+    def __init__(self, offset=0):
+        self.offset = offset
+
+    def add(self, x, y):
+        return x + y + self.offset
+
+    def divide(self, x, y):
+        return x / y
+
+
+class MyFastCalculator(object):
+    def __init__(self, offset=0):
+        self.offset = offset
+
+    def add(self, x, y):
+        return x + y + self.offset
+
+    def divide(self, x, y):
+        return x / y
+
+
+class MyBrokenCalculator(MyFastCalculator):
+    def add(self, x, y):
+        return x + y + self.offset + 1
+
+    def divide(self, x, y):
+        raise ValueError("broken")
+
+
+class MyAsyncClient(six.with_metaclass(fakeable.Fakeable)):
+    async def fetch(self, key):
+        return "value of " + key
+
+    def close(self):
+        return "closed"
+
+
+class MyAsyncPool(six.with_metaclass(fakeable.Fakeable)):
+    def __init__(self, size=1):
+        self.size = size
+        self.connections = None
+
+    async def __ainit__(self):
+        await asyncio.sleep(0)
+        self.connections = ["connection"] * self.size
+
+
+class MyFakeAsyncPool(object):
+    def __init__(self, size):
+        self.size = size
+        self.connections = []
+
+
+async def create_my_fake_async_pool(size=1):
+    await asyncio.sleep(0)
+    pool = MyFakeAsyncPool(size)
+    pool.connections = ["fake connection"] * size
+    return pool
+
+
+class MyExpensiveClass(six.with_metaclass(fakeable.Fakeable)):
+
+    instance_count = 0
+    fail = False
+
+    def __init__(self, arg1=None):
+        if MyExpensiveClass.fail:
+            raise ValueError("construction failed")
+        MyExpensiveClass.instance_count += 1
+        self.arg1 = arg1
+
+
+class MyConnection(six.with_metaclass(fakeable.Fakeable)):
+
+    def __init__(self, url=None):
+        self.url = url
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def create_my_cool_class_in_worker(arg1):
+    x = MyCoolClass(arg1)
+    return (type(x).__name__, x.arg1)
+
+
+def create_my_unfakeable_class():
+    return MyUnfakeableClass("rebuilt")
+
+
+def construction_stub(cls):
+    return fakeable.FAKE_FACTORY.construction_stubs[id(cls)][1]
+
+
+def count_fakes_in_worker():
+    return len(fakeable.FAKE_FACTORY.fake_factories)
+
+
 class FakeCreatedCallbackTester(object):
     """
     An object that can be specified to add_created_callback() to
@@ -630,5 +755,2496 @@ class Test_remove_created_callback(
         callback.assert_invocation_count(0)
 
 
+class Test_set_shadow_class(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def test_ReturnsRealResults(self):
+        fakeable.set_shadow_class("MyCalculator", MyBrokenCalculator)
+        x = MyCalculator(1)
+        self.assertIsInstance(x, MyCalculator)
+        self.assertEqual(x.add(2, 3), 6)
+        self.assertEqual(x.offset, 1)
+
+    def test_MatchingCandidate(self):
+        entry = fakeable.set_shadow_class(MyCalculator, MyFastCalculator)
+        x = MyCalculator(1)
+        x.add(2, 3)
+        x.add(4, 5)
+        self.assertTrue(entry.join(5))
+        stats = entry.stats["add"]
+        self.assertEqual(stats.calls, 2)
+        self.assertEqual(stats.mismatches, 0)
+        self.assertEqual(stats.candidate_errors, 0)
+        self.assertGreater(stats.real_seconds, 0)
+        self.assertGreater(stats.candidate_seconds, 0)
+        self.assertEqual(len(entry.mismatches), 0)
+        entry.close()
+
+    def test_MismatchingCandidate(self):
+        entry = fakeable.set_shadow_class("MyCalculator", MyBrokenCalculator)
+        x = MyCalculator(1)
+        x.add(2, 3)
+        self.assertTrue(entry.join(5))
+        self.assertEqual(entry.stats["add"].mismatches, 1)
+        mismatch = entry.mismatches[0]
+        self.assertEqual(mismatch.method, "add")
+        self.assertEqual(mismatch.args, (2, 3))
+        self.assertEqual(mismatch.real, 6)
+        self.assertEqual(mismatch.candidate, 7)
+        entry.close()
+
+    def test_CandidateRaisesException(self):
+        entry = fakeable.set_shadow_class("MyCalculator", MyBrokenCalculator)
+        x = MyCalculator()
+        self.assertEqual(x.divide(6, 3), 2)
+        self.assertTrue(entry.join(5))
+        stats = entry.stats["divide"]
+        self.assertEqual(stats.mismatches, 1)
+        self.assertEqual(stats.candidate_errors, 1)
+        self.assertIsInstance(entry.mismatches[0].candidate, ValueError)
+        entry.close()
+
+    def test_RealAndCandidateRaiseSameException(self):
+        entry = fakeable.set_shadow_class("MyCalculator", MyFastCalculator)
+        x = MyCalculator()
+        with self.assertRaises(ZeroDivisionError):
+            x.divide(1, 0)
+        self.assertTrue(entry.join(5))
+        stats = entry.stats["divide"]
+        self.assertEqual(stats.calls, 1)
+        self.assertEqual(stats.mismatches, 0)
+        entry.close()
+
+    def test_CustomCompare(self):
+        entry = fakeable.set_shadow_class("MyCalculator", MyBrokenCalculator,
+            compare=lambda real, candidate: abs(real - candidate) <= 1)
+        MyCalculator().add(1, 1)
+        self.assertTrue(entry.join(5))
+        self.assertEqual(entry.stats["add"].mismatches, 0)
+        entry.close()
+
+    def test_MutatedArguments(self):
+        class Appender(object):
+            def __init__(self, offset=0):
+                pass
+
+            def append(self, items):
+                items.append(len(items))
+                return list(items)
+
+        # without a copy, the candidate sees the item appended by the real
+        # method and returns [1, 1, 2]
+        for (deep_copy, mismatches) in ((False, 1), (True, 0)):
+            entry = fakeable.set_shadow_class("MyCalculator", Appender,
+                deep_copy=deep_copy)
+            with unittest.mock.patch.object(MyCalculator, "append",
+                    Appender.append, create=True):
+                self.assertEqual(MyCalculator().append([1]), [1, 1])
+            self.assertTrue(entry.join(5))
+            self.assertEqual(entry.stats["append"].calls, 1)
+            self.assertEqual(entry.stats["append"].mismatches, mismatches)
+            entry.close()
+
+    def test_Closed(self):
+        entry = fakeable.set_shadow_class("MyCalculator", MyFastCalculator)
+        x = MyCalculator(1)
+        entry.close()
+        self.assertEqual(x.add(1, 2), 4)
+        self.assertIs(type(MyCalculator()), MyCalculator)
+        self.assertIsNone(entry.executor)
+        self.assertEqual(entry.stats, {})
+
+    def test_ContextManagerUnregisters(self):
+        with fakeable.set_shadow_class("MyCalculator", MyFastCalculator):
+            x = MyCalculator()
+            self.assertIsNot(type(x), MyCalculator)
+        x = MyCalculator()
+        self.assertIs(type(x), MyCalculator)
+
+
+class Test_set_fake_latency(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def test_FixedLatency(self):
+        fakeable.set_fake_latency("MyCalculator", latency=0.05)
+        x = MyCalculator()
+        start = time.monotonic()
+        self.assertEqual(x.add(1, 2), 3)
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+        self.assertIsInstance(x, MyCalculator)
+
+    def test_WrapsFakeClass(self):
+        fakeable.set_fake_latency("MyCalculator", MyBrokenCalculator)
+        x = MyCalculator(1)
+        self.assertEqual(x.add(1, 2), 5)
+
+    def test_ErrorRate_DefaultError(self):
+        fakeable.set_fake_latency("MyCalculator", error_rate=1.0)
+        with self.assertRaises(ConnectionError):
+            MyCalculator().add(1, 2)
+
+    def test_ErrorRate_CustomErrorClass(self):
+        fakeable.set_fake_latency("MyCalculator", error_rate=1.0,
+            error=KeyError)
+        with self.assertRaises(KeyError):
+            MyCalculator().add(1, 2)
+
+    def test_ErrorRate_Zero(self):
+        fakeable.set_fake_latency("MyCalculator", error_rate=0.0)
+        self.assertEqual(MyCalculator().add(1, 2), 3)
+
+    def test_ErrorRate_Partial(self):
+        fakeable.set_fake_latency("MyCalculator", error_rate=0.5, seed=1234)
+        x = MyCalculator()
+        failures = 0
+        for _ in range(200):
+            try:
+                x.add(1, 2)
+            except ConnectionError:
+                failures += 1
+        self.assertGreater(failures, 50)
+        self.assertLess(failures, 150)
+
+    def test_Timeout(self):
+        fakeable.set_fake_latency("MyCalculator",
+            latency=fakeable.UniformLatency(10, 20), timeout=0.01)
+        with self.assertRaises(TimeoutError):
+            MyCalculator().add(1, 2)
+
+    def test_Methods(self):
+        fakeable.set_fake_latency("MyCalculator", error_rate=1.0,
+            methods=["divide"])
+        x = MyCalculator()
+        self.assertEqual(x.add(1, 2), 3)
+        with self.assertRaises(ConnectionError):
+            x.divide(1, 2)
+
+    def test_LognormalLatency(self):
+        latency = fakeable.LognormalLatency(0.01, 0.5)
+        entry = fakeable.set_fake_latency("MyCalculator", latency=latency,
+            seed=1)
+        samples = sorted(latency.sample(entry.random) for _ in range(1001))
+        self.assertAlmostEqual(samples[500], 0.01, delta=0.002)
+
+    def test_AsyncMethod(self):
+        fakeable.set_fake_latency("MyAsyncClient", latency=0.01)
+        x = MyAsyncClient()
+        self.assertEqual(asyncio.run(x.fetch("a")), "value of a")
+        self.assertEqual(x.close(), "closed")
+
+    def test_AsyncMethod_Error(self):
+        fakeable.set_fake_latency("MyAsyncClient", error_rate=1.0)
+        x = MyAsyncClient()
+        with self.assertRaises(ConnectionError):
+            asyncio.run(x.fetch("a"))
+
+
+class CassetteTestCase(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(CassetteTestCase, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "cassette")
+
+    def tearDown(self):
+        try:
+            shutil.rmtree(self.temp_dir)
+        finally:
+            super(CassetteTestCase, self).tearDown()
+
+    def record(self):
+        with fakeable.set_recording("MyCalculator", self.path):
+            x = MyCalculator(1)
+            y = MyCalculator(10)
+            self.assertIsInstance(x, MyCalculator)
+            self.assertEqual(x.add(1, 2), 4)
+            self.assertEqual(y.add(1, 2), 13)
+            self.assertEqual(x.add(5, 5), 11)
+            with self.assertRaises(ZeroDivisionError):
+                x.divide(1, 0)
+            self.assertEqual(x.add(1, 2), 4)
+
+
+class Test_set_recording(CassetteTestCase):
+
+    def test_WritesCassette(self):
+        self.record()
+        entry = fakeable.set_replay("MyCalculator", self.path)
+        self.assertEqual(len(entry), 7)
+        self.assertEqual(entry.load(0), (0, "__init__", (1,), {}, "init",
+            None))
+        self.assertEqual(entry.load(2), (0, "add", (1, 2), {}, "return", 4))
+        self.assertEqual(entry.load(5)[:5], (0, "divide", (1, 0), {},
+            "raise"))
+        self.assertIsInstance(entry.load(5)[5], ZeroDivisionError)
+
+    def test_WrapsFakeClass(self):
+        with fakeable.set_recording("MyCalculator", self.path,
+                MyBrokenCalculator):
+            self.assertEqual(MyCalculator().add(1, 2), 4)
+        entry = fakeable.set_replay("MyCalculator", self.path)
+        self.assertEqual(entry.load(1)[5], 4)
+
+    def test_AsyncMethod(self):
+        with fakeable.set_recording("MyAsyncClient", self.path):
+            x = MyAsyncClient()
+            self.assertEqual(asyncio.run(x.fetch("k")), "value of k")
+        fakeable.set_replay("MyAsyncClient", self.path)
+        x = MyAsyncClient()
+        self.assertEqual(asyncio.run(x.fetch("k")), "value of k")
+
+    def test_UnpicklableResult(self):
+        with fakeable.set_recording("MyCalculator", self.path,
+                MyUnpicklableResultCalculator):
+            MyCalculator().add(1, 2)
+        fakeable.set_replay("MyCalculator", self.path)
+        x = MyCalculator()
+        with self.assertRaises(fakeable.ReplayError):
+            x.add(1, 2)
+
+
+class MyUnpicklableResultCalculator(MyFastCalculator):
+    def add(self, x, y):
+        return lambda: x + y
+
+
+class Test_set_replay(CassetteTestCase):
+
+    def test_Strict(self):
+        self.record()
+        fakeable.set_replay("MyCalculator", self.path)
+        x = MyCalculator(1)
+        y = MyCalculator(10)
+        self.assertIsInstance(x, MyCalculator)
+        self.assertEqual(x.add(1, 2), 4)
+        self.assertEqual(y.add(1, 2), 13)
+        self.assertEqual(x.add(5, 5), 11)
+        with self.assertRaises(ZeroDivisionError):
+            x.divide(1, 0)
+        self.assertEqual(x.add(1, 2), 4)
+        with self.assertRaises(fakeable.ReplayError):
+            x.add(1, 2)
+
+    def test_SwappedOutWhileInUse(self):
+        self.record()
+        fakeable.set_replay("MyCalculator", self.path)
+        x = MyCalculator(1)
+        y = MyCalculator(10)
+        swap = fakeable.swap_registry([])
+        self.assertIsInstance(MyCalculator(1), MyCalculator)
+        self.assertEqual(x.add(1, 2), 4)
+        self.assertEqual(y.add(1, 2), 13)
+        (entry,) = swap.replaced
+        entry.close()
+
+    def test_Strict_WrongOrder(self):
+        self.record()
+        fakeable.set_replay("MyCalculator", self.path)
+        x = MyCalculator(1)
+        y = MyCalculator(10)
+        self.assertIsInstance(x, MyCalculator)
+        with self.assertRaises(fakeable.ReplayError):
+            y.add(1, 2)
+
+    def test_Strict_WrongConstructorArgs(self):
+        self.record()
+        fakeable.set_replay("MyCalculator", self.path)
+        with self.assertRaises(fakeable.ReplayError):
+            MyCalculator(2)
+
+    def test_Ordered(self):
+        self.record()
+        fakeable.set_replay("MyCalculator", self.path, match="ordered")
+        x = MyCalculator()
+        y = MyCalculator()
+        with self.assertRaises(ZeroDivisionError):
+            x.divide()
+        self.assertEqual(x.add(), 4)
+        self.assertEqual(x.add(), 11)
+        self.assertEqual(y.add(), 13)
+        self.assertEqual(x.add(), 4)
+        with self.assertRaises(fakeable.ReplayError):
+            x.add()
+
+    def test_Keyed(self):
+        self.record()
+        fakeable.set_replay("MyCalculator", self.path, match="keyed")
+        x = MyCalculator()
+        self.assertEqual(x.add(5, 5), 11)
+        self.assertEqual(x.add(1, 2), 4)
+        self.assertEqual(x.add(1, 2), 13)
+        self.assertEqual(x.add(1, 2), 4)
+        self.assertEqual(x.add(1, 2), 4)
+        with self.assertRaises(fakeable.ReplayError):
+            x.add(2, 2)
+
+    def test_Keyed_RecordingNotClosed(self):
+        entry = fakeable.set_recording("MyCalculator", self.path)
+        x = MyCalculator()
+        x.add(1, 2)
+        x.add(3, 4)
+        fakeable.set_replay("MyCalculator", self.path, match="keyed")
+        self.assertEqual(MyCalculator().add(3, 4), 7)
+        entry.close()
+
+    def test_InvalidMatch(self):
+        self.record()
+        with self.assertRaises(ValueError):
+            fakeable.set_replay("MyCalculator", self.path, match="fuzzy")
+
+    def test_NotACassette(self):
+        with open(self.path, "wb") as f:
+            f.write(b"hello world")
+        with self.assertRaises(ValueError):
+            fakeable.set_replay("MyCalculator", self.path)
+
+    def test_Ordered_LoadsOnlyMatchingRecords(self):
+        self.record()
+        entry = fakeable.set_replay("MyCalculator", self.path,
+            match="ordered")
+        x = MyCalculator()
+        with unittest.mock.patch.object(entry, "load",
+                wraps=entry.load) as load:
+            self.assertEqual(x.add(), 4)
+            self.assertEqual(x.add(), 11)
+        # one check of the method name and one read of the outcome per call
+        self.assertEqual([call[1][0] for call in load.mock_calls],
+            [2, 2, 4, 4])
+
+    def test_Keyed_OtherProcess(self):
+        class Sorter(object):
+            def __init__(self, offset=0):
+                pass
+
+            def add(self, x, y):
+                return sorted(x) + sorted(y)
+
+        with fakeable.set_recording("MyCalculator", self.path, Sorter):
+            MyCalculator().add({"b", "a", "c", "d"}, {"y": 1.0, "x": 2})
+        code = textwrap.dedent("""
+            import fakeable, fakeable_test
+            fakeable.set_replay("MyCalculator", {!r}, match="keyed")
+            x = fakeable_test.MyCalculator()
+            print(x.add({{"d", "c", "b", "a"}}, {{"x": 2.0, "y": 1}}))
+            """).format(self.path)
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.path.dirname(os.path.abspath(__file__))
+        for seed in ("1", "2", "3"):
+            env["PYTHONHASHSEED"] = seed
+            output = subprocess.check_output([sys.executable, "-c", code],
+                env=env, universal_newlines=True)
+            self.assertEqual(output.strip(),
+                "['a', 'b', 'c', 'd', 'x', 'y']")
+
+    def test_OldCassette(self):
+        with open(self.path, "wb") as f:
+            f.write(b"FAKECAS1")
+        with open(self.path + ".idx", "wb"):
+            pass
+        with self.assertRaisesRegex(ValueError, "older version"):
+            fakeable.set_replay("MyCalculator", self.path)
+
+
+class Test_hash_call(unittest.TestCase):
+
+    def assertSameHash(self, args1, args2):
+        self.assertEqual(fakeable._hash_call("m", args1, {}),
+            fakeable._hash_call("m", args2, {}))
+
+    def assertDifferentHash(self, args1, args2):
+        self.assertNotEqual(fakeable._hash_call("m", args1, {}),
+            fakeable._hash_call("m", args2, {}))
+
+    def test_Order(self):
+        self.assertSameHash(({"a", "b", "c"},), ({"c", "b", "a"},))
+        self.assertSameHash(({"a": 1, "b": 2},), ({"b": 2, "a": 1},))
+        self.assertEqual(fakeable._hash_call("m", (), {"a": 1, "b": 2}),
+            fakeable._hash_call("m", (), {"b": 2, "a": 1}))
+
+    def test_Numbers(self):
+        self.assertSameHash((1,), (1.0,))
+        self.assertSameHash((True, 0), (1, False))
+        self.assertSameHash(({1: "a"},), ({True: "a"},))
+        self.assertDifferentHash((1,), (1.5,))
+        self.assertDifferentHash((1,), ("1",))
+        self.assertDifferentHash(((1,),), ([1],))
+
+    def test_Memoization(self):
+        item = ("shared",)
+        self.assertSameHash(([item, item],), ([("shared",), ("shared",)],))
+
+    def test_DefaultRepr(self):
+        first = MyUnfakeableClass(1, [2])
+        second = MyUnfakeableClass(1, [2])
+        self.assertSameHash((first,), (second,))
+        self.assertDifferentHash((first,), (MyUnfakeableClass(1, [3]),))
+
+    def test_ReprWithAddress(self):
+        class Handle(object):
+            def __repr__(self):
+                return "<Handle at {:#x}>".format(id(self))
+
+        self.assertSameHash((Handle(),), (Handle(),))
+
+    def test_Recursive(self):
+        items = [1]
+        items.append(items)
+        fakeable._hash_call("m", (items,), {})
+
+
+class Test_set_spy(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def test_RecordsCalls(self):
+        spy = fakeable.set_spy("MyCalculator", capture_args=True)
+        x = MyCalculator(1)
+        self.assertIsInstance(x, MyCalculator)
+        self.assertEqual(x.add(1, 2), 4)
+        self.assertEqual(x.add(3, 4), 8)
+        self.assertEqual(x.divide(4, 2), 2)
+        self.assertEqual(len(spy), 3)
+        self.assertEqual(spy.count(), 3)
+        self.assertEqual(spy.count("add"), 2)
+        self.assertEqual(spy.count("add", args=(3, 4)), 1)
+        self.assertEqual(spy.count("add", args=(5, 6)), 0)
+        self.assertEqual(spy.count("subtract"), 0)
+
+    def test_first(self):
+        spy = fakeable.set_spy("MyCalculator")
+        x = MyCalculator()
+        before = time.time()
+        x.add(1, 2)
+        x.divide(4, 2)
+        call = spy.first("divide")
+        self.assertEqual(call.method, "divide")
+        self.assertEqual(call.instance, 0)
+        self.assertGreaterEqual(call.timestamp, before)
+        self.assertGreaterEqual(call.duration, 0)
+        self.assertFalse(call.raised)
+        self.assertIsNone(call.args)
+        self.assertIsNone(call.args_hash)
+        self.assertIsNone(spy.first("subtract"))
+
+    def test_filter_ByInstance(self):
+        spy = fakeable.set_spy("MyCalculator", MyFastCalculator,
+            capture_args=True)
+        x = MyCalculator()
+        y = MyCalculator()
+        x.add(1, 2)
+        y.add(1, 2)
+        y.add(2, 2)
+        calls = spy.filter(instance=1)
+        self.assertEqual([call.instance for call in calls], [1, 1])
+        self.assertEqual(spy.count("add", args=(1, 2)), 2)
+
+    def test_RecordsExceptions(self):
+        spy = fakeable.set_spy("MyCalculator")
+        with self.assertRaises(ZeroDivisionError):
+            MyCalculator().divide(1, 0)
+        self.assertTrue(spy.first("divide").raised)
+
+    def test_CaptureArgs(self):
+        spy = fakeable.set_spy("MyCalculator", capture_args=True)
+        MyCalculator().add(1, y=2)
+        call = spy.first("add", args=(1,), kwargs={"y": 2})
+        self.assertEqual(call.args, (1,))
+        self.assertEqual(call.kwargs, {"y": 2})
+
+    def test_Capacity(self):
+        spy = fakeable.set_spy("MyCalculator", capacity=3, capture_args=True)
+        x = MyCalculator()
+        for i in range(5):
+            x.add(i, 0)
+        self.assertEqual(len(spy), 3)
+        self.assertEqual(spy.total, 5)
+        self.assertEqual(spy.dropped, 2)
+        self.assertEqual(spy.count("add", args=(1, 0)), 0)
+        self.assertEqual(spy.count("add", args=(2, 0)), 1)
+        self.assertEqual(spy.count("add", args=(4, 0)), 1)
+
+    def test_AsyncMethod(self):
+        spy = fakeable.set_spy("MyAsyncClient", capture_args=True)
+        x = MyAsyncClient()
+        self.assertEqual(asyncio.run(x.fetch("k")), "value of k")
+        self.assertEqual(spy.count("fetch", args=("k",)), 1)
+
+    def test_clear(self):
+        spy = fakeable.set_spy("MyCalculator")
+        MyCalculator().add(1, 2)
+        spy.clear()
+        self.assertEqual(spy.count(), 0)
+
+    def test_ArgsWithoutMethod(self):
+        spy = fakeable.set_spy("MyCalculator", capture_args=True)
+        with self.assertRaises(TypeError):
+            spy.count(args=(1, 2))
+
+    def test_ArgsNotCaptured(self):
+        spy = fakeable.set_spy("MyCalculator")
+        with unittest.mock.patch.object(fakeable, "_hash_call") as hash_call:
+            MyCalculator().add(1, 2)
+        hash_call.assert_not_called()
+        self.assertEqual(spy.count("add"), 1)
+        with self.assertRaises(TypeError):
+            spy.count("add", args=(1, 2))
+
+    def test_LargeInstanceNumbers(self):
+        spy = fakeable.set_spy("MyCalculator")
+        spy.record(2 ** 40, "add", (), {}, 0.0, 0.0, False)
+        self.assertEqual(spy.first("add").instance, 2 ** 40)
+
+
+class Test_import(unittest.TestCase):
+
+    def test_OptionalModulesNotImported(self):
+        code = ("import sys, fakeable; print(sorted(x for x in ('argparse', "
+            "'asyncio', 'concurrent.futures', 'inspect', 'json', 'mmap', "
+            "'pickle') if x in sys.modules))")
+        output = subprocess.check_output([sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.abspath(fakeable.__file__)))
+        self.assertEqual(output.decode("utf8").strip(), "[]")
+
+
+class Test_Fakeable_acreate(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def test_NoFakeRegistered_AwaitsAinit(self):
+        x = asyncio.run(MyAsyncPool.acreate(2))
+        self.assertIsInstance(x, MyAsyncPool)
+        self.assertEqual(x.connections, ["connection", "connection"])
+
+    def test_WrapperEntryRegistered_AwaitsAinit(self):
+        spy = fakeable.set_spy("MyAsyncPool")
+        x = asyncio.run(MyAsyncPool.acreate(2))
+        self.assertIsInstance(x, MyAsyncPool)
+        self.assertEqual(x.connections, ["connection", "connection"])
+        self.assertEqual(spy.count("__ainit__"), 0)
+
+    def test_InstanceLimitRegistered_AwaitsAinit(self):
+        fakeable.set_instance_limit("MyAsyncPool", 1)
+        x = asyncio.run(MyAsyncPool.acreate(1))
+        self.assertEqual(x.connections, ["connection"])
+
+    def test_NoFakeRegistered_NoAinit(self):
+        x = asyncio.run(MyCoolClass.acreate(1, arg2=2))
+        self.assertIsInstance(x, MyCoolClass)
+        self.assertEqual(x.arg1, 1)
+        self.assertEqual(x.arg2, 2)
+
+    def test_FakeObjectRegistered(self):
+        fake_object = object()
+        fakeable.set_fake_object("MyAsyncPool", fake_object)
+        self.assertIs(asyncio.run(MyAsyncPool.acreate()), fake_object)
+
+    def test_FakeClassRegisteredByClass(self):
+        fakeable.set_fake_class(MyAsyncPool, MyFakeAsyncPool)
+        x = asyncio.run(MyAsyncPool.acreate(3))
+        self.assertIsInstance(x, MyFakeAsyncPool)
+        self.assertEqual(x.size, 3)
+
+    def test_AsyncFactoryRegistered(self):
+        fakeable.set_fake_factory("MyAsyncPool", create_my_fake_async_pool)
+        x = asyncio.run(MyAsyncPool.acreate(size=2))
+        self.assertIsInstance(x, MyFakeAsyncPool)
+        self.assertEqual(x.connections, ["fake connection"] * 2)
+
+    def test_AsyncFactoryRegistered_SyncCreationFails(self):
+        fakeable.set_fake_factory("MyAsyncPool", create_my_fake_async_pool)
+        with self.assertRaises(TypeError):
+            MyAsyncPool()
+
+    def test_NotifiesCallbacks(self):
+        callback = FakeCreatedCallbackTester(self)
+        fakeable.add_created_callback(callback)
+        fakeable.set_fake_factory("MyAsyncPool", create_my_fake_async_pool)
+        x = asyncio.run(MyAsyncPool.acreate())
+        invocation = callback.assert_invoked_exactly_once()
+        self.assertIs(invocation.obj, x)
+        self.assertIs(invocation.obj_type, MyAsyncPool)
+
+
+class Test_set_fake_factory(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def test_SyncFactory(self):
+        fakeable.set_fake_factory("MyCoolClass", MyUnfakeableClass)
+        x = MyCoolClass(1, arg2=2)
+        self.assertIsInstance(x, MyUnfakeableClass)
+        self.assertEqual(x.arg1, 1)
+        self.assertEqual(x.arg2, 2)
+
+    def test_ContextManager(self):
+        fake_object = object()
+        with fakeable.set_fake_factory("MyCoolClass", lambda: fake_object):
+            self.assertIs(MyCoolClass(), fake_object)
+        self.assertIsInstance(MyCoolClass(), MyCoolClass)
+
+
+class Test_add_created_callback_Coroutine(
+        fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def test_ScheduledOnRunningLoop(self):
+        events = []
+
+        async def callback(name, obj, obj_type):
+            events.append("callback started")
+            await asyncio.sleep(0)
+            events.append("callback finished")
+
+        async def main():
+            fakeable.add_created_callback(callback)
+            MyCoolClass()
+            events.append("created")
+            await fakeable.join_created_callbacks()
+
+        asyncio.run(main())
+        self.assertEqual(events,
+            ["created", "callback started", "callback finished"])
+
+    def test_ExceptionReportedToLoop(self):
+        contexts = []
+
+        async def callback(name, obj, obj_type):
+            raise ValueError("callback failed")
+
+        async def main():
+            asyncio.get_running_loop().set_exception_handler(
+                lambda loop, context: contexts.append(context))
+            fakeable.add_created_callback(callback)
+            await MyCoolClass.acreate()
+            await fakeable.join_created_callbacks()
+
+        asyncio.run(main())
+        self.assertEqual(len(contexts), 1)
+        self.assertIsInstance(contexts[0]["exception"], ValueError)
+
+    def test_NoRunningLoop(self):
+        events = []
+        proceed = threading.Event()
+
+        async def callback(name, obj, obj_type):
+            proceed.wait(5)
+            events.append((name, threading.current_thread().name))
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        asyncio.set_event_loop(loop)
+        self.addCleanup(asyncio.set_event_loop, None)
+        fakeable.add_created_callback(callback)
+        MyCoolClass()
+        self.assertEqual(events, [])
+        self.assertIs(asyncio.get_event_loop_policy().get_event_loop(), loop)
+        proceed.set()
+        loop.run_until_complete(fakeable.join_created_callbacks())
+        self.assertEqual(events, [("MyCoolClass", "fakeable-callbacks")])
+
+
+class Test_registry_spec(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def test_RoundTrip(self):
+        fakeable.set_fake_class(MyCoolClass, MyUnfakeableClass)
+        fakeable.set_fake_object("CustomName", 42)
+        spec = pickle.loads(pickle.dumps(fakeable.registry_spec()))
+        fakeable.clear()
+        self.assertTrue(fakeable.install_registry_spec(spec))
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+        self.assertEqual(MyCoolClassCustomFakeName(), 42)
+
+    def test_Cached(self):
+        fakeable.set_fake_class("MyCoolClass", MyUnfakeableClass)
+        spec1 = fakeable.registry_spec()
+        spec2 = fakeable.registry_spec()
+        self.assertIs(spec1, spec2)
+        fakeable.set_fake_object("CustomName", 42)
+        spec3 = fakeable.registry_spec()
+        self.assertIsNot(spec1, spec3)
+        self.assertNotEqual(spec1.digest, spec3.digest)
+
+    def test_InstallSameSpecTwice(self):
+        fakeable.set_fake_class("MyCoolClass", MyUnfakeableClass)
+        spec = fakeable.registry_spec()
+        self.assertTrue(fakeable.install_registry_spec(spec))
+        self.assertFalse(fakeable.install_registry_spec(spec))
+
+    def test_InstallSameSpecAfterChange(self):
+        fakeable.set_fake_class("MyCoolClass", MyUnfakeableClass)
+        spec = fakeable.registry_spec()
+        self.assertTrue(fakeable.install_registry_spec(spec))
+        fakeable.unset("MyCoolClass")
+        self.assertTrue(fakeable.install_registry_spec(spec))
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+
+    def test_Cached_EmptyFactories(self):
+        fakeable.set_fake_class("MyCoolClass", MyUnfakeableClass)
+        spec = fakeable.registry_spec(factories={})
+        self.assertIs(fakeable.registry_spec(factories={}), spec)
+        self.assertIs(fakeable.registry_spec(), spec)
+
+    def test_Factories(self):
+        fakeable.set_fake_object("MyCoolClass", threading.Lock())
+        with self.assertRaises(TypeError):
+            fakeable.registry_spec()
+        spec = fakeable.registry_spec(
+            factories={"MyCoolClass": create_my_unfakeable_class})
+        fakeable.clear()
+        fakeable.install_registry_spec(pickle.loads(pickle.dumps(spec)))
+        self.assertEqual(MyCoolClass().arg1, "rebuilt")
+
+    def test_UnsupportedEntry(self):
+        fakeable.set_spy("MyCoolClass")
+        with self.assertRaises(TypeError):
+            fakeable.registry_spec()
+
+    def test_LocalClassNotImportable(self):
+        class LocalFake(object):
+            pass
+        fakeable.set_fake_class("MyCoolClass", LocalFake)
+        with self.assertRaises(TypeError):
+            fakeable.registry_spec()
+
+
+class Test_process_pool_kwargs(
+        fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def test_SpawnedWorkers(self):
+        fakeable.set_fake_class("MyCoolClass", MyUnfakeableClass)
+        context = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(2, mp_context=context,
+                **fakeable.process_pool_kwargs()) as executor:
+            results = list(executor.map(create_my_cool_class_in_worker,
+                [1, 2, 3]))
+        self.assertEqual(results, [("MyUnfakeableClass", 1),
+            ("MyUnfakeableClass", 2), ("MyUnfakeableClass", 3)])
+
+    def test_ChainedInitializer(self):
+        fakeable.set_fake_class("MyCoolClass", MyUnfakeableClass)
+        context = multiprocessing.get_context("spawn")
+        kwargs = fakeable.process_pool_kwargs(fakeable.set_fake_object,
+            ("Extra", 1))
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=context,
+                **kwargs) as executor:
+            self.assertEqual(executor.submit(count_fakes_in_worker).result(),
+                2)
+
+
+class Test_use_control_block(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(Test_use_control_block, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "control")
+        self.control_block = fakeable.ControlBlock.create(self.path, slots=4)
+        self.fake_object = object()
+        fakeable.use_control_block(self.control_block,
+            {1: MyUnfakeableClass, 2: self.fake_object})
+
+    def tearDown(self):
+        try:
+            fakeable.use_control_block(None)
+            self.control_block.close()
+            shutil.rmtree(self.temp_dir)
+        finally:
+            super(Test_use_control_block, self).tearDown()
+
+    def test_NoEntries(self):
+        self.assertIsInstance(MyCoolClass(), MyCoolClass)
+
+    def test_SetEntry(self):
+        self.control_block.set("MyCoolClass", 1)
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+        self.control_block.set("MyCoolClass", 2)
+        self.assertIs(MyCoolClass(), self.fake_object)
+        self.control_block.set("MyCoolClass", 0)
+        self.assertIsInstance(MyCoolClass(), MyCoolClass)
+
+    def test_RemoveEntry(self):
+        self.control_block.set("MyCoolClass", 1)
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+        self.assertTrue(self.control_block.remove("MyCoolClass"))
+        self.assertFalse(self.control_block.remove("MyCoolClass"))
+        self.assertIsInstance(MyCoolClass(), MyCoolClass)
+
+    def test_UnknownEntryIdUsesRealClass(self):
+        self.control_block.set("MyCoolClass", 99)
+        self.assertIsInstance(MyCoolClass(), MyCoolClass)
+
+    def test_ChangedBySeparateMapping(self):
+        other = fakeable.ControlBlock(self.path)
+        try:
+            other.set("CustomName", 2)
+        finally:
+            other.close()
+        self.assertIs(MyCoolClassCustomFakeName(), self.fake_object)
+        self.assertEqual(self.control_block.table(), {"CustomName": 2})
+
+    def test_ChangedByCommandLine(self):
+        subprocess.check_call([sys.executable, "-m", "fakeable", "control",
+            self.path, "set", "MyCoolClass", "1"],
+            cwd=os.path.dirname(os.path.abspath(fakeable.__file__)))
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+
+    def test_Generation(self):
+        generation = self.control_block.generation
+        self.control_block.set("MyCoolClass", 1)
+        self.assertEqual(self.control_block.generation, generation + 2)
+
+    def test_NoFreeSlots(self):
+        for i in range(4):
+            self.control_block.set("Name{}".format(i), 1)
+        with self.assertRaises(ValueError):
+            self.control_block.set("Name4", 1)
+
+    def test_NameTooLong(self):
+        with self.assertRaises(ValueError):
+            self.control_block.set("x" * 65, 1)
+
+    def test_NotAControlBlock(self):
+        path = os.path.join(self.temp_dir, "other")
+        with open(path, "wb") as f:
+            f.write(b"x" * 100)
+        with self.assertRaises(ValueError):
+            fakeable.ControlBlock(path)
+
+    def test_StopUsing(self):
+        self.control_block.set("MyCoolClass", 1)
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+        fakeable.use_control_block(None)
+        self.assertIsInstance(MyCoolClass(), MyCoolClass)
+
+    def test_CloseStopsUsing(self):
+        self.control_block.set("MyCoolClass", 1)
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+        self.control_block.close()
+        self.assertIsNone(fakeable.FAKE_FACTORY.control_block)
+        self.assertIsInstance(MyCoolClass(), MyCoolClass)
+        self.control_block = fakeable.ControlBlock(self.path)
+
+    def test_StandInWithInstallAttribute(self):
+        fake_object = unittest.mock.Mock()
+        self.control_block.set("MyCoolClass", 3)
+        fakeable.use_control_block(self.control_block, {3: fake_object})
+        self.assertIs(MyCoolClass(), fake_object)
+        fake_object.install.assert_not_called()
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "requires os.fork()")
+class Test_set_fork_policy(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def tearDown(self):
+        try:
+            fakeable.set_fork_policy()
+        finally:
+            super(Test_set_fork_policy, self).tearDown()
+
+    def fork(self, child_main):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                code = child_main()
+            except BaseException:
+                code = 2
+            os._exit(code)
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            (waited_pid, status) = os.waitpid(pid, os.WNOHANG)
+            if waited_pid != 0:
+                return os.WEXITSTATUS(status)
+            time.sleep(0.01)
+        os.kill(pid, 9)
+        os.waitpid(pid, 0)
+        self.fail("child process deadlocked")
+
+    def fork_with_lock_held(self, lock, child_main):
+        # forks while another thread holds the given lock, as it would under
+        # load; the child must not wait for that thread, which it lacks
+        acquired = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with lock:
+                acquired.set()
+                release.wait(10)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        try:
+            acquired.wait(5)
+            return self.fork(child_main)
+        finally:
+            release.set()
+            thread.join()
+
+    def test_ForkWhileIndexIsLocked(self):
+        def child_main():
+            cls = fakeable.Fakeable(str("MyForkedClass"), (object,), {})
+            found = fakeable.find_fakeable_class("MyForkedClass")
+            return 0 if found is cls else 1
+
+        self.assertEqual(self.fork_with_lock_held(
+            fakeable.FAKEABLE_INDEX.lock, child_main), 0)
+
+    def test_ForkWhileWatchIsLocked(self):
+        watch = fakeable.watch("MyCoolClass")
+        self.addCleanup(watch.close)
+
+        def child_main():
+            instance = MyCoolClass()
+            return 0 if watch.get(timeout=5).obj is instance else 1
+
+        self.assertEqual(self.fork_with_lock_held(watch._condition,
+            child_main), 0)
+
+    def test_ForkWhileProfileIsLocked(self):
+        profile = fakeable.ConstructionProfile()
+        fakeable.set_construction_profile(profile)
+        self.addCleanup(fakeable.set_construction_profile, None)
+
+        def child_main():
+            MyCoolClass()
+            return 0 if profile.constructions["MyCoolClass"][0] == 1 else 1
+
+        self.assertEqual(self.fork_with_lock_held(profile.lock, child_main),
+            0)
+
+    def test_ForkWhileHistogramsAreLocked(self):
+        histograms = fakeable.LifetimeHistograms()
+        fakeable.add_destroyed_callback(histograms)
+
+        def child_main():
+            MyCoolClass()
+            gc.collect()
+            return 0 if histograms["MyCoolClass"].count == 1 else 1
+
+        self.assertEqual(self.fork_with_lock_held(histograms._lock,
+            child_main), 0)
+
+    def test_ForkWhileRegistryIsModified(self):
+        stop = threading.Event()
+
+        def toggle():
+            while not stop.is_set():
+                fakeable.set_fake_class("MyCoolClass", MyUnfakeableClass)
+                MyCoolClass()
+                fakeable.unset("MyCoolClass")
+
+        def child_main():
+            MyCoolClass()
+            fakeable.set_fake_object("MyCoolClass", 5)
+            return 0 if MyCoolClass() == 5 else 1
+
+        threads = [threading.Thread(target=toggle) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        try:
+            for i in range(20):
+                self.assertEqual(self.fork(child_main), 0)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def test_ShadowInChild(self):
+        entry = fakeable.set_shadow_class("MyCalculator", MyFastCalculator)
+        MyCalculator().add(1, 2)
+        entry.join()
+
+        def child_main():
+            MyCalculator().add(3, 4)
+            entry.join(timeout=5)
+            return 0 if entry.stats["add"].calls == 2 else 1
+
+        self.assertEqual(self.fork(child_main), 0)
+        entry.close()
+
+    def test_SpyInChild_ClearCaches(self):
+        fakeable.set_fork_policy(clear_caches=True)
+        entry = fakeable.set_spy("MyCalculator")
+        MyCalculator().add(1, 2)
+
+        def child_main():
+            if entry.total != 0:
+                return 1
+            MyCalculator().add(3, 4)
+            return 0 if entry.count("add") == 1 else 1
+
+        self.assertEqual(self.fork(child_main), 0)
+        self.assertEqual(entry.count("add"), 1)
+
+    def test_RecordingStopsInChild(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        path = os.path.join(temp_dir, "cassette")
+        entry = fakeable.set_recording("MyCalculator", path)
+        calculator = MyCalculator()
+        calculator.add(1, 2)
+
+        def child_main():
+            calculator.add(8, 9)
+            return 0 if MyCalculator().add(3, 4) == 7 else 1
+
+        self.assertEqual(self.fork(child_main), 0)
+        calculator.add(5, 6)
+        entry.close()
+        fakeable.set_replay("MyCalculator", path, match="ordered")
+        calculator = MyCalculator()
+        self.assertEqual(calculator.add(1, 2), 3)
+        self.assertEqual(calculator.add(5, 6), 11)
+
+
+class Test_load_config(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(Test_load_config, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    def write_config(self, fakes, file_name="fakes.json"):
+        path = os.path.join(self.temp_dir, file_name)
+        with open(path, "w") as f:
+            if isinstance(fakes, str):
+                f.write(fakes)
+            else:
+                json.dump({"fakes": fakes}, f)
+        return path
+
+    def test_Class(self):
+        path = self.write_config({
+            "MyCoolClass": "fakeable_test:MyUnfakeableClass",
+            "MyCalculator": {"type": "class",
+                "target": "fakeable_test:MyFastCalculator"},
+        })
+        entries = fakeable.load_config(path)
+        self.assertEqual(len(entries), 2)
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+        self.assertIsInstance(MyCalculator(), MyFastCalculator)
+
+    def test_Object(self):
+        path = self.write_config({"MyCoolClass": {"type": "object",
+            "target": "fakeable_test:MyUnfakeableClass1"}})
+        fakeable.load_config(path)
+        self.assertIs(MyCoolClass(), MyUnfakeableClass1)
+
+    def test_Options(self):
+        path = self.write_config({"MyCalculator": {"type": "spy",
+            "capacity": 4}})
+        (entry,) = fakeable.load_config(path)
+        calculator = MyCalculator()
+        calculator.add(1, 2)
+        self.assertIsInstance(calculator, MyCalculator)
+        self.assertEqual(entry.count("add"), 1)
+        self.assertEqual(entry.capacity, 4)
+
+    def test_Toml(self):
+        if fakeable._import_tomllib() is None:
+            self.skipTest("requires tomllib or tomli")
+        path = self.write_config(
+            "[fakes]\n"
+            "MyCoolClass = \"fakeable_test:MyUnfakeableClass\"\n"
+            "[fakes.MyCalculator]\n"
+            "type = \"latency\"\n"
+            "latency = 0.0\n", "fakes.toml")
+        fakeable.load_config(path)
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+        self.assertEqual(MyCalculator().add(1, 2), 3)
+
+    def test_ImportsLazily(self):
+        path = self.write_config({
+            "MyCoolClass": "fakeable_test_no_such_module:MyFake"})
+        fakeable.load_config(path)
+        with self.assertRaises(ImportError):
+            MyCoolClass()
+
+    def test_Invalid(self):
+        invalid_fakes = [
+            {"MyCoolClass": 5},
+            {"MyCoolClass": {"type": "bogus", "target": "a:b"}},
+            {"MyCoolClass": {"target": "NoColon"}},
+            {"MyCoolClass": {"type": "class"}},
+            {"MyCoolClass": {"target": "a:b", "bogus": 1}},
+            {"MyCoolClass": {"type": "replay", "target": "a:b", "path": "x"}},
+            {"MyCoolClass": {"type": "recording"}},
+        ]
+        for fakes in invalid_fakes:
+            path = self.write_config(fakes)
+            with self.assertRaises(ValueError, msg=fakes):
+                fakeable.load_config(path)
+        path = self.write_config("{")
+        with self.assertRaises(ValueError):
+            fakeable.load_config(path)
+
+    def test_NoCacheByDefault(self):
+        path = self.write_config({
+            "MyCoolClass": "fakeable_test:MyUnfakeableClass"})
+        fakeable.load_config(path)
+        self.assertEqual(os.listdir(os.path.dirname(path)),
+            [os.path.basename(path)])
+
+    def test_Cache(self):
+        path = self.write_config({
+            "MyCoolClass": "fakeable_test:MyUnfakeableClass"})
+        cache_path = path + ".cache"
+        fakeable.load_config(path, cache_path)
+        self.assertTrue(os.path.exists(cache_path))
+        fakeable.clear()
+        with unittest.mock.patch.object(fakeable, "_parse_config",
+                side_effect=AssertionError("parsed again")):
+            fakeable.load_config(path, cache_path)
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+
+    def test_CacheInvalidatedWhenFileChanges(self):
+        path = self.write_config({
+            "MyCoolClass": "fakeable_test:MyUnfakeableClass"})
+        fakeable.load_config(path, path + ".cache")
+        self.write_config({
+            "MyCoolClass": "fakeable_test:MyUnfakeableClass1"})
+        fakeable.load_config(path, path + ".cache")
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass1)
+
+    def test_CorruptedCache(self):
+        path = self.write_config({
+            "MyCoolClass": "fakeable_test:MyUnfakeableClass"})
+        fakeable.load_config(path, path + ".cache")
+        with open(path + ".cache", "r+b") as f:
+            f.seek(-4, os.SEEK_END)
+            f.write(b"\xff" * 4)
+        fakeable.load_config(path, path + ".cache")
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+
+    def test_Close(self):
+        cassette = os.path.join(self.temp_dir, "cassette")
+        path = self.write_config({"MyCalculator": {"type": "recording",
+            "path": cassette}})
+        (entry,) = fakeable.load_config(path)
+        entry.close()
+        self.assertIsNone(entry.entry)
+        with entry:
+            self.assertEqual(MyCalculator().add(1, 2), 3)
+        self.assertNotIn("MyCalculator", fakeable.FAKE_FACTORY.fake_factories)
+        self.assertTrue(entry.entry._closed)
+        self.assertTrue(os.path.exists(cassette + ".keys"))
+
+    def test_RegistrySpec(self):
+        path = self.write_config({
+            "MyCoolClass": "fakeable_test:MyUnfakeableClass"})
+        fakeable.load_config(path)
+        spec = pickle.loads(pickle.dumps(fakeable.registry_spec()))
+        fakeable.clear()
+        fakeable.install_registry_spec(spec)
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+
+
+def create_fakeable_class(name, fake_name=None, module=__name__):
+    dict_ = {"__module__": module}
+    if fake_name is not None:
+        dict_["__FAKE_NAME__"] = fake_name
+    return fakeable.Fakeable(str(name), (object,), dict_)
+
+
+class Test_find_fakeable_class(unittest.TestCase):
+
+    def test_Found(self):
+        self.assertIs(fakeable.find_fakeable_class("MyCoolClass"),
+            MyCoolClass)
+
+    def test_CustomFakeName(self):
+        self.assertIs(fakeable.find_fakeable_class("CustomName"),
+            MyCoolClassCustomFakeName)
+        self.assertIsNone(
+            fakeable.find_fakeable_class("MyCoolClassCustomFakeName"))
+
+    def test_NotFound(self):
+        self.assertIsNone(fakeable.find_fakeable_class("NoSuchClass"))
+        self.assertIsNone(fakeable.find_fakeable_class("MyUnfakeableClass"))
+
+    def test_ClassesAreNotKeptAlive(self):
+        create_fakeable_class("MyShortLivedClass")
+        gc.collect()
+        self.assertIsNone(fakeable.find_fakeable_class("MyShortLivedClass"))
+
+    def test_fakeable_classes(self):
+        classes = fakeable.fakeable_classes()
+        self.assertIs(classes["MyCoolClass"], MyCoolClass)
+        self.assertIs(classes["MyCalculator"], MyCalculator)
+        self.assertNotIn("MyUnfakeableClass", classes)
+
+
+class Test_duplicate_fake_names(unittest.TestCase):
+
+    def test_Duplicate(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            cls1 = create_fakeable_class("MyDuplicate1", "MyDuplicate")
+            cls2 = create_fakeable_class("MyDuplicate2", "MyDuplicate")
+        self.assertEqual([x.category for x in caught],
+            [fakeable.DuplicateFakeNameWarning])
+        self.assertEqual(fakeable.duplicate_fake_names(),
+            {"MyDuplicate": [cls1, cls2]})
+        self.assertIs(fakeable.find_fakeable_class("MyDuplicate"), cls2)
+        del cls1, cls2
+        gc.collect()
+        self.assertEqual(fakeable.duplicate_fake_names(), {})
+
+    def test_Redefinition(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            create_fakeable_class("MyRedefinedClass")
+            cls = create_fakeable_class("MyRedefinedClass")
+        self.assertEqual(caught, [])
+        self.assertEqual(fakeable.duplicate_fake_names(), {})
+        self.assertIs(fakeable.find_fakeable_class("MyRedefinedClass"), cls)
+
+
+class Test_set_strict(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(Test_set_strict, self).setUp()
+        fakeable.set_strict()
+        self.addCleanup(fakeable.set_strict, False)
+
+    def test_KnownName(self):
+        fakeable.set_fake_class("MyCoolClass", MyUnfakeableClass)
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+
+    def test_KnownClass(self):
+        fakeable.set_fake_object(MyCoolClass, 5)
+        self.assertEqual(MyCoolClass(), 5)
+
+    def test_UnknownName(self):
+        with self.assertRaises(ValueError):
+            fakeable.set_fake_class("MyCoolClas", MyUnfakeableClass)
+        with self.assertRaises(ValueError):
+            fakeable.set_spy("MyUnfakeableClass")
+        with self.assertRaises(ValueError):
+            fakeable.set_fake_object(MyUnfakeableClass, 5)
+
+    def test_Disabled(self):
+        fakeable.set_strict(False)
+        fakeable.set_fake_class("MyCoolClas", MyUnfakeableClass)
+
+
+class Test_set_warm_pool(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(Test_set_warm_pool, self).setUp()
+        MyExpensiveClass.instance_count = 0
+        MyExpensiveClass.fail = False
+
+    def set_warm_pool(self, *args, **kwargs):
+        entry = fakeable.set_warm_pool(*args, **kwargs)
+        self.addCleanup(entry.close)
+        return entry
+
+    def test_TakesFromPool(self):
+        entry = self.set_warm_pool("MyExpensiveClass", size=2, args=(5,))
+        self.assertTrue(entry.wait_until_full(timeout=5))
+        self.assertEqual(MyExpensiveClass.instance_count, 2)
+        pooled = list(entry.instances)
+        instance = MyExpensiveClass(5)
+        self.assertIs(instance, pooled[0])
+        self.assertEqual(instance.arg1, 5)
+        self.assertEqual((entry.hits, entry.misses), (1, 0))
+        self.assertTrue(entry.wait_until_full(timeout=5))
+        self.assertEqual(MyExpensiveClass.instance_count, 3)
+
+    def test_ByClass(self):
+        entry = self.set_warm_pool(MyExpensiveClass, size=1)
+        entry.wait_until_full(timeout=5)
+        pooled = entry.instances[0]
+        self.assertIs(MyExpensiveClass(), pooled)
+
+    def test_UnsetStopsThread(self):
+        entry = self.set_warm_pool("MyExpensiveClass", size=1)
+        entry.wait_until_full(timeout=5)
+        thread = entry._thread
+        fakeable.unset("MyExpensiveClass")
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(entry.instances), 0)
+
+    def test_OtherArguments(self):
+        entry = self.set_warm_pool("MyExpensiveClass", size=1, args=(5,))
+        entry.wait_until_full(timeout=5)
+        instance = MyExpensiveClass(6)
+        self.assertEqual(instance.arg1, 6)
+        self.assertEqual(len(entry.instances), 1)
+        self.assertEqual(entry.hits, 0)
+
+    def test_Empty(self):
+        entry = self.set_warm_pool("MyExpensiveClass", size=1)
+        entry.wait_until_full(timeout=5)
+        entry.close()
+        self.assertIsInstance(MyExpensiveClass(), MyExpensiveClass)
+
+    def test_ConstructionFails(self):
+        MyExpensiveClass.fail = True
+        entry = self.set_warm_pool("MyExpensiveClass", size=1)
+        self.assertFalse(entry.wait_until_full(timeout=5))
+        self.assertIsInstance(entry.error, ValueError)
+        with self.assertRaises(ValueError):
+            MyExpensiveClass()
+        MyExpensiveClass.fail = False
+        MyExpensiveClass()
+        self.assertTrue(entry.wait_until_full(timeout=5))
+
+    def test_Acreate(self):
+        entry = self.set_warm_pool("MyAsyncPool", size=1, args=(2,))
+        entry.wait_until_full(timeout=5)
+        pooled = entry.instances[0]
+        pool = asyncio.run(MyAsyncPool.acreate(2))
+        self.assertIs(pool, pooled)
+        self.assertEqual(pool.connections, ["connection"] * 2)
+
+    def test_UnknownName(self):
+        with self.assertRaises(ValueError):
+            fakeable.set_warm_pool("MyUnfakeableClass")
+
+    def test_InvalidSize(self):
+        with self.assertRaises(ValueError):
+            fakeable.set_warm_pool("MyExpensiveClass", size=0)
+
+    def test_DaemonThreadsDisallowed(self):
+        thread_class = threading.Thread
+
+        def create_thread(*args, **kwargs):
+            if kwargs.get("daemon"):
+                raise RuntimeError("daemon threads are disabled")
+            return thread_class(*args, **kwargs)
+
+        with unittest.mock.patch.object(fakeable.threading, "Thread",
+                create_thread):
+            entry = fakeable.set_warm_pool(MyExpensiveClass, size=1)
+        self.addCleanup(entry.close)
+        self.assertFalse(entry._thread.daemon)
+        self.assertTrue(entry.wait_until_full(5))
+        self.assertIsInstance(MyExpensiveClass(), MyExpensiveClass)
+        self.assertEqual(entry.hits, 1)
+
+
+class Test_set_instance_limit(
+        fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def test_Close(self):
+        entry = fakeable.set_instance_limit("MyConnection", 2, timeout=0)
+        connection1 = MyConnection("a")
+        connection2 = MyConnection("b")
+        self.assertIsInstance(connection1, MyConnection)
+        self.assertEqual(connection1.url, "a")
+        with self.assertRaises(fakeable.InstanceLimitError):
+            MyConnection("c")
+        connection1.close()
+        self.assertTrue(connection1.closed)
+        connection1.close()
+        connection3 = MyConnection("c")
+        stats = entry.stats()
+        self.assertEqual((stats.live, stats.peak, stats.acquired,
+            stats.timeouts), (2, 2, 3, 1))
+        connection2.close()
+        connection3.close()
+        self.assertEqual(entry.stats().live, 0)
+
+    def test_With(self):
+        entry = fakeable.set_instance_limit("MyConnection", 1, timeout=0)
+        with MyConnection() as connection:
+            self.assertIsInstance(connection, MyConnection)
+            self.assertEqual(entry.stats().live, 1)
+        self.assertTrue(connection.closed)
+        self.assertEqual(entry.stats().live, 0)
+
+    def test_GarbageCollected(self):
+        entry = fakeable.set_instance_limit("MyConnection", 1, timeout=0)
+        MyConnection()
+        gc.collect()
+        MyConnection()
+        self.assertEqual(entry.stats().acquired, 2)
+
+    def test_ConstructorFails(self):
+        def create_connection():
+            raise ConnectionError("refused")
+        entry = fakeable.set_instance_limit("MyConnection", 1, timeout=0,
+            wrapped=create_connection)
+        with self.assertRaises(ConnectionError):
+            MyConnection()
+        self.assertEqual(entry.stats().live, 0)
+
+    def test_BlocksUntilReleased(self):
+        entry = fakeable.set_instance_limit("MyConnection", 1)
+        connection = MyConnection()
+        created = []
+        thread = threading.Thread(target=lambda: created.append(
+            MyConnection()))
+        thread.start()
+        while entry.stats().contended == 0:
+            time.sleep(0.001)
+        self.assertEqual(created, [])
+        connection.close()
+        thread.join(timeout=5)
+        self.assertEqual(len(created), 1)
+        stats = entry.stats()
+        self.assertEqual((stats.live, stats.contended), (1, 1))
+        self.assertGreater(stats.wait_seconds, 0)
+
+    def test_Timeout(self):
+        entry = fakeable.set_instance_limit("MyConnection", 1, timeout=0.01)
+        connection = MyConnection()
+        with self.assertRaises(fakeable.InstanceLimitError):
+            MyConnection()
+        self.assertEqual(entry.stats().timeouts, 1)
+        connection.close()
+        MyConnection()
+
+    def test_Acreate(self):
+        entry = fakeable.set_instance_limit("MyConnection", 1)
+
+        async def main():
+            connection = await MyConnection.acreate()
+            task = asyncio.ensure_future(MyConnection.acreate("b"))
+            await asyncio.sleep(0.01)
+            self.assertFalse(task.done())
+            connection.close()
+            connection = await task
+            self.assertEqual(connection.url, "b")
+            return entry.stats()
+
+        stats = asyncio.run(main())
+        self.assertEqual((stats.live, stats.acquired, stats.contended),
+            (1, 2, 1))
+
+    def test_AcreateTimeout(self):
+        fakeable.set_instance_limit("MyConnection", 1, timeout=0.01)
+
+        async def main():
+            connection = await MyConnection.acreate()
+            with self.assertRaises(fakeable.InstanceLimitError):
+                await MyConnection.acreate()
+            connection.close()
+            await MyConnection.acreate()
+
+        asyncio.run(main())
+
+    def test_InvalidLimit(self):
+        with self.assertRaises(ValueError):
+            fakeable.set_instance_limit("MyConnection", 0)
+
+
+class Test_add_destroyed_callback(
+        fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(Test_add_destroyed_callback, self).setUp()
+        self.destroyed = []
+        fakeable.add_destroyed_callback(self.callback)
+
+    def callback(self, name, obj_type, lifetime):
+        self.destroyed.append((name, obj_type, lifetime))
+
+    def test_RealInstance(self):
+        instance = MyCoolClass()
+        gc.collect()
+        self.assertEqual(self.destroyed, [])
+        del instance
+        gc.collect()
+        self.assertEqual(len(self.destroyed), 1)
+        (name, obj_type, lifetime) = self.destroyed[0]
+        self.assertEqual((name, obj_type), ("MyCoolClass", MyCoolClass))
+        self.assertGreaterEqual(lifetime, 0)
+
+    def test_FakeObjectReportedOnce(self):
+        fake = MyUnfakeableClass()
+        fakeable.set_fake_object("MyCoolClass", fake)
+        MyCoolClass()
+        MyCoolClass()
+        fakeable.unset("MyCoolClass")
+        del fake
+        gc.collect()
+        self.assertEqual(len(self.destroyed), 1)
+
+    def test_NotWeakReferenceable(self):
+        fakeable.set_fake_object("MyCoolClass", 5)
+        MyCoolClass()
+        self.assertEqual(self.destroyed, [])
+
+    def test_NotTrackedWithoutCallbacks(self):
+        fakeable.remove_destroyed_callback(self.callback)
+        instance = MyCoolClass()
+        fakeable.add_destroyed_callback(self.callback)
+        del instance
+        gc.collect()
+        self.assertEqual(self.destroyed, [])
+
+    def test_remove_destroyed_callback(self):
+        instance = MyCoolClass()
+        self.assertTrue(fakeable.remove_destroyed_callback(self.callback))
+        self.assertFalse(fakeable.remove_destroyed_callback(self.callback))
+        del instance
+        gc.collect()
+        self.assertEqual(self.destroyed, [])
+
+    def test_clear(self):
+        instance = MyCoolClass()
+        fakeable.clear()
+        del instance
+        gc.collect()
+        self.assertEqual(self.destroyed, [])
+
+
+class Test_LifetimeHistograms(
+        fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def test_Aggregates(self):
+        histograms = fakeable.LifetimeHistograms()
+        fakeable.add_destroyed_callback(histograms)
+        for i in range(3):
+            MyCoolClass()
+        gc.collect()
+        histogram = histograms["MyCoolClass"]
+        self.assertEqual(histogram.count, 3)
+        self.assertEqual(sum(histogram.buckets), 3)
+        with self.assertRaises(KeyError):
+            histograms["MyCalculator"]
+        histograms.clear()
+        self.assertEqual(histograms.snapshot(), {})
+
+    def test_Buckets(self):
+        histogram = fakeable.LifetimeHistogram()
+        for seconds in (0.5e-6, 1e-6, 2e-6, 3e-6, 1.0):
+            histogram.add(seconds)
+        self.assertEqual(histogram.buckets[:3], [2, 1, 1])
+        self.assertEqual(histogram.buckets[20], 1)
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.max_seconds, 1.0)
+        self.assertAlmostEqual(histogram.mean, 1.0000065 / 5)
+        self.assertEqual(histogram.percentile(40), 1e-6)
+        self.assertEqual(histogram.percentile(80), 4e-6)
+        self.assertEqual(histogram.percentile(100), 1.0)
+
+    def test_Empty(self):
+        histogram = fakeable.LifetimeHistogram()
+        self.assertEqual(histogram.mean, 0.0)
+        self.assertEqual(histogram.percentile(50), 0.0)
+
+
+class Test_Fakeable_ConstructionStub(
+        fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def test_RebuiltWhenRegistryChanges(self):
+        self.assertIsInstance(MyCoolClass(), MyCoolClass)
+        fakeable.set_fake_object("MyCoolClass", 5)
+        self.assertEqual(MyCoolClass(), 5)
+        fakeable.set_fake_class(MyCoolClass, MyUnfakeableClass)
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+        fakeable.unset(MyCoolClass)
+        self.assertEqual(MyCoolClass(), 5)
+        fakeable.clear()
+        self.assertIsInstance(MyCoolClass(), MyCoolClass)
+
+    def test_RebuiltWhenCallbacksChange(self):
+        created = []
+        MyCoolClass()
+        fakeable.add_created_callback(lambda *args: created.append(args))
+        instance = MyCoolClass()
+        self.assertEqual(created, [("MyCoolClass", instance, MyCoolClass)])
+
+    def test_Specialized(self):
+        MyCoolClass()
+        self.assertIs(construction_stub(MyCoolClass), fakeable._create_real)
+        fakeable.set_spy("MyCoolClass")
+        MyCoolClass()
+        self.assertIsNot(construction_stub(MyCoolClass), fakeable._create_real)
+
+    def test_NotInheritedBySubclass(self):
+        base = create_fakeable_class("MyStubBase")
+        subclass = fakeable.Fakeable(str("MyStubSubclass"), (base,), {})
+        fakeable.set_fake_object("MyStubBase", 5)
+        self.assertEqual(base(), 5)
+        self.assertIsInstance(subclass(), subclass)
+
+    def test_NotStoredInClass(self):
+        MyCoolClass()
+        self.assertNotIn("_fakeable_stub", vars(MyCoolClass))
+
+    def test_ForgottenWithClass(self):
+        cls = create_fakeable_class("MyStubTemporary")
+        cls()
+        key = id(cls)
+        self.assertIn(key, fakeable.FAKE_FACTORY.construction_stubs)
+        del cls
+        gc.collect()
+        self.assertNotIn(key, fakeable.FAKE_FACTORY.construction_stubs)
+
+    def test_DirectWriteRejected(self):
+        with self.assertRaises(TypeError):
+            fakeable.FAKE_FACTORY.fake_factories["MyCoolClass"] = 5
+        self.assertIsInstance(MyCoolClass(), MyCoolClass)
+
+    def test_StaleStubReleasesEntry(self):
+        fake = MyUnfakeableClass()
+        fake_ref = weakref.ref(fake)
+        fakeable.set_fake_object("MyCoolClass", fake)
+        MyCoolClass()
+        fakeable.unset("MyCoolClass")
+        del fake
+        gc.collect()
+        self.assertIsNone(fake_ref())
+
+
+class Test_CreationLog(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(Test_CreationLog, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.path = os.path.join(self.temp_dir, "creations.log")
+
+    def create_log(self, **kwargs):
+        log = fakeable.CreationLog(self.path, **kwargs)
+        self.addCleanup(log.close)
+        fakeable.add_created_callback(log)
+        return log
+
+    def test_Records(self):
+        log = self.create_log(record_ids=True)
+        before = time.time()
+        instance = MyCoolClass()
+        MyCoolClassCustomFakeName()
+        log.close()
+        events = list(fakeable.read_creation_log(self.path))
+        self.assertEqual(len(events), 2)
+        self.assertEqual(events[0].name, "MyCoolClass")
+        self.assertEqual(events[0].cls, "fakeable_test:MyCoolClass")
+        self.assertEqual(events[0].thread, threading.get_ident())
+        self.assertEqual(events[0].id, id(instance))
+        self.assertGreaterEqual(events[0].timestamp, before)
+        self.assertEqual(events[1].name, "CustomName")
+        self.assertEqual(events[1].cls,
+            "fakeable_test:MyCoolClassCustomFakeName")
+
+    def test_Buffered(self):
+        log = self.create_log()
+        MyCoolClass()
+        self.assertEqual(list(fakeable.read_creation_log(self.path)), [])
+        log.flush()
+        self.assertEqual(len(list(fakeable.read_creation_log(self.path))), 1)
+        self.assertIsNone(
+            next(fakeable.read_creation_log(self.path)).id)
+
+    def test_Append(self):
+        log = self.create_log()
+        MyCoolClass()
+        log.close()
+        fakeable.clear()
+        log = self.create_log()
+        MyCoolClass()
+        log.close()
+        self.assertEqual(len(list(fakeable.read_creation_log(self.path))), 2)
+
+    def test_Rotation(self):
+        log = self.create_log(max_bytes=200, backups=2, buffer_size=1)
+        for i in range(20):
+            MyCoolClass()
+        log.close()
+        self.assertTrue(os.path.exists(self.path + ".1"))
+        self.assertTrue(os.path.exists(self.path + ".2"))
+        self.assertFalse(os.path.exists(self.path + ".3"))
+        for path in (self.path, self.path + ".1", self.path + ".2"):
+            self.assertLessEqual(os.path.getsize(path), 200)
+        current = list(fakeable.read_creation_log(self.path))
+        everything = list(fakeable.read_creation_log(self.path, rotated=True))
+        self.assertLess(len(current), len(everything))
+        self.assertLess(len(everything), 20)
+        self.assertEqual(everything[-len(current):], current)
+        timestamps = [event.timestamp for event in everything]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_TruncatedRecord(self):
+        log = self.create_log()
+        MyCoolClass()
+        MyCoolClass()
+        log.close()
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        self.assertEqual(len(list(fakeable.read_creation_log(self.path))), 1)
+
+    def test_ZeroFilledTail(self):
+        log = self.create_log()
+        MyCoolClass()
+        log.close()
+        with open(self.path, "ab") as f:
+            f.write(b"\0" * 4096)
+        self.assertEqual(len(list(fakeable.read_creation_log(self.path))), 1)
+
+    def test_CorruptedLengths(self):
+        log = self.create_log()
+        MyCoolClass()
+        log.close()
+        with open(self.path, "ab") as f:
+            f.write(fakeable.CreationLog.HEADER.pack(
+                fakeable.CreationLog.HEADER.size, 0.0, 0, 0, 100, 100))
+            f.write(b"x" * 200)
+        self.assertEqual(len(list(fakeable.read_creation_log(self.path))), 1)
+
+    def test_FlushedAtExit(self):
+        code = ("import fakeable, fakeable_test, sys; "
+            "fakeable.add_created_callback(fakeable.CreationLog(sys.argv[1]));"
+            " fakeable_test.MyCoolClass()")
+        subprocess.check_call([sys.executable, "-c", code, self.path],
+            cwd=os.path.dirname(os.path.abspath(fakeable.__file__)))
+        self.assertEqual(len(list(fakeable.read_creation_log(self.path))), 1)
+
+    def test_NotALog(self):
+        with open(self.path, "wb") as f:
+            f.write(b"something else entirely")
+        with self.assertRaises(ValueError):
+            list(fakeable.read_creation_log(self.path))
+
+    def test_Closed(self):
+        log = self.create_log()
+        log.close()
+        MyCoolClass()
+        log.flush()
+        self.assertEqual(list(fakeable.read_creation_log(self.path)), [])
+
+
+class Test_watch(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def test_Iterator(self):
+        with fakeable.watch("MyCoolClass") as watch:
+            instance1 = MyCoolClass()
+            MyCalculator()
+            instance2 = MyCoolClass()
+        self.assertEqual([x.obj for x in watch], [instance1, instance2])
+        self.assertEqual(list(watch), [])
+
+    def test_ByClass(self):
+        fakeable.set_fake_object("MyCoolClass", 5)
+        with fakeable.watch(MyCoolClass) as watch:
+            MyCoolClass()
+            creation = watch.get(timeout=0)
+        self.assertEqual(creation,
+            fakeable.Creation("MyCoolClass", 5, MyCoolClass))
+
+    def test_wait_for(self):
+        with fakeable.watch("MyCoolClass") as watch:
+            threads = [threading.Thread(target=MyCoolClass) for i in range(3)]
+            for thread in threads:
+                thread.start()
+            instances = watch.wait_for(3, timeout=5)
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(instances), 3)
+        for instance in instances:
+            self.assertIsInstance(instance, MyCoolClass)
+
+    def test_Timeout(self):
+        with fakeable.watch("MyCoolClass") as watch:
+            with self.assertRaises(TimeoutError):
+                watch.get(timeout=0.01)
+            MyCoolClass()
+            with self.assertRaises(TimeoutError):
+                watch.wait_for(2, timeout=0.01)
+
+    def test_OverflowDrop(self):
+        with fakeable.watch("MyCoolClass", maxsize=2,
+                overflow="drop") as watch:
+            for i in range(5):
+                MyCoolClass()
+        self.assertEqual(len(list(watch)), 2)
+        self.assertEqual(watch.dropped, 3)
+
+    def test_OverflowDropOldest(self):
+        with fakeable.watch("MyCoolClass", maxsize=2) as watch:
+            instances = [MyCoolClass() for i in range(5)]
+        self.assertEqual([x.obj for x in watch], instances[3:])
+        self.assertEqual(watch.dropped, 3)
+
+    def test_OverflowBlock(self):
+        with fakeable.watch("MyCoolClass", maxsize=1,
+                overflow="block") as watch:
+            thread = threading.Thread(
+                target=lambda: [MyCoolClass() for i in range(3)])
+            thread.start()
+            self.assertEqual(len(watch.wait_for(3, timeout=5)), 3)
+            thread.join()
+        self.assertEqual(watch.dropped, 0)
+
+    def test_Async(self):
+        async def main():
+            with fakeable.watch("MyCoolClass") as watch:
+                asyncio.get_running_loop().call_later(0.01, MyCoolClass)
+                creation = await watch.aget(timeout=5)
+                self.assertIsInstance(creation.obj, MyCoolClass)
+                with self.assertRaises(TimeoutError):
+                    await watch.aget(timeout=0.01)
+                thread = threading.Thread(
+                    target=lambda: [MyCoolClass() for i in range(2)])
+                thread.start()
+                instances = await watch.await_count(2, timeout=5)
+                thread.join()
+                self.assertEqual(len(instances), 2)
+                MyCoolClass()
+            return [creation async for creation in watch]
+
+        self.assertEqual(len(asyncio.run(main())), 1)
+
+    def test_AsyncNeverBlocksEventLoop(self):
+        async def main():
+            with fakeable.watch("MyCoolClass", maxsize=1,
+                    overflow="block") as watch:
+                MyCoolClass()
+                MyCoolClass()
+            return watch.dropped
+
+        self.assertEqual(asyncio.run(main()), 1)
+
+    def test_AsyncWaitersRemoved(self):
+        async def main():
+            with fakeable.watch("MyCoolClass") as watch:
+                for i in range(3):
+                    with self.assertRaises(TimeoutError):
+                        await watch.aget(timeout=0)
+                task = asyncio.get_running_loop().create_task(watch.aget())
+                await asyncio.sleep(0)
+                task.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+                return len(watch._async_waiters)
+
+        self.assertEqual(asyncio.run(main()), 0)
+
+    def test_clear(self):
+        watch = fakeable.watch("MyCoolClass")
+        fakeable.clear()
+        MyCoolClass()
+        self.assertTrue(watch.closed)
+        self.assertEqual(list(watch), [])
+
+    def test_Closed(self):
+        with fakeable.watch("MyCoolClass") as watch:
+            MyCoolClass()
+
+        def creations():
+            while True:
+                yield watch.get(timeout=0)
+
+        self.assertEqual(len(list(itertools.islice(creations(), 1))), 1)
+        with self.assertRaises(fakeable.WatchClosedError):
+            next(creations())
+        with self.assertRaises(fakeable.WatchClosedError):
+            asyncio.run(watch.aget())
+
+    def test_OtherClassesNotNotified(self):
+        with fakeable.watch("MyCoolClass"):
+            MyCalculator()
+            self.assertIs(construction_stub(MyCalculator),
+                fakeable._create_real)
+
+    def test_InvalidArguments(self):
+        with self.assertRaises(ValueError):
+            fakeable.watch("MyCoolClass", overflow="bogus")
+        with self.assertRaises(ValueError):
+            fakeable.watch("MyCoolClass", maxsize=0)
+
+
+class Test_set_fake_sequence(
+        fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def test_Sequence(self):
+        fakeable.set_fake_sequence("MyCoolClass",
+            [1, ValueError("second"), 3])
+        self.assertEqual(MyCoolClass(), 1)
+        with self.assertRaises(ValueError):
+            MyCoolClass()
+        self.assertEqual(MyCoolClass(), 3)
+        with self.assertRaises(fakeable.SequenceExhaustedError):
+            MyCoolClass()
+
+    def test_ExceptionClass(self):
+        fakeable.set_fake_sequence("MyCoolClass", [KeyError])
+        with self.assertRaises(KeyError):
+            MyCoolClass()
+
+    def test_Generator(self):
+        consumed = []
+
+        def generate():
+            for i in itertools.count():
+                consumed.append(i)
+                yield i
+
+        fakeable.set_fake_sequence("MyCoolClass", generate())
+        self.assertEqual([MyCoolClass() for i in range(3)], [0, 1, 2])
+        self.assertEqual(consumed, [0, 1, 2])
+
+    def test_Cycle(self):
+        fakeable.set_fake_sequence("MyCoolClass", (1, 2), cycle=True)
+        self.assertEqual([MyCoolClass() for i in range(5)], [1, 2, 1, 2, 1])
+
+    def test_CycleIterator(self):
+        fakeable.set_fake_sequence("MyCoolClass", iter([1, 2]), cycle=True)
+        self.assertEqual([MyCoolClass() for i in range(5)], [1, 2, 1, 2, 1])
+
+    def test_ExhaustedLast(self):
+        for items in ([1, 2], iter([1, 2])):
+            fakeable.set_fake_sequence("MyCoolClass", items, exhausted="last")
+            self.assertEqual([MyCoolClass() for i in range(4)], [1, 2, 2, 2])
+
+    def test_ExhaustedReal(self):
+        for items in ([1], iter([1])):
+            fakeable.set_fake_sequence("MyCoolClass", items, exhausted="real")
+            self.assertEqual(MyCoolClass(), 1)
+            self.assertIsInstance(MyCoolClass(), MyCoolClass)
+
+    def test_Empty(self):
+        fakeable.set_fake_sequence("MyCoolClass", [], cycle=True)
+        with self.assertRaises(fakeable.SequenceExhaustedError):
+            MyCoolClass()
+
+    def test_Concurrent(self):
+        for items in (list(range(4000)), iter(range(4000))):
+            fakeable.set_fake_sequence("MyCoolClass", items)
+            results = []
+
+            def create():
+                results.extend(MyCoolClass() for i in range(1000))
+
+            threads = [threading.Thread(target=create) for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(sorted(results), list(range(4000)))
+
+    def test_InvalidExhausted(self):
+        with self.assertRaises(ValueError):
+            fakeable.set_fake_sequence("MyCoolClass", [], exhausted="bogus")
+
+    def test_RegistrySpec(self):
+        fakeable.set_fake_sequence("MyCoolClass", [1, 2])
+        fakeable.registry_spec()
+        fakeable.set_fake_sequence("MyCoolClass", iter([1, 2]))
+        with self.assertRaises(TypeError):
+            fakeable.registry_spec()
+
+
+class Test_set_fake_singleton(
+        fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def create_in_threads(self, count=4):
+        results = [None] * count
+
+        def create(i):
+            results[i] = (MyCoolClass(i), MyCoolClass())
+
+        threads = [threading.Thread(target=create, args=(i,))
+            for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_Thread(self):
+        entry = fakeable.set_fake_singleton("MyCoolClass", MyUnfakeableClass)
+        x = MyCoolClass(1, 2)
+        self.assertIsInstance(x, MyUnfakeableClass)
+        self.assertEqual((x.arg1, x.arg2), (1, 2))
+        self.assertIs(MyCoolClass(3), x)
+        results = self.create_in_threads()
+        for (i, (first, second)) in enumerate(results):
+            self.assertIs(first, second)
+            self.assertEqual(first.arg1, i)
+        self.assertEqual(len(set(id(first) for (first, _) in results)), 4)
+        self.assertEqual(entry.created, 5)
+
+    def test_ThreadEnds(self):
+        fakeable.set_fake_singleton("MyCoolClass", MyUnfakeableClass)
+        refs = [weakref.ref(first) for (first, _) in self.create_in_threads()]
+        gc.collect()
+        self.assertEqual([ref() for ref in refs], [None] * 4)
+
+    def test_Task(self):
+        fakeable.set_fake_singleton("MyCoolClass", MyUnfakeableClass,
+            scope="task")
+        outside = MyCoolClass()
+
+        async def create(i):
+            first = MyCoolClass(i)
+            await asyncio.sleep(0)
+            self.assertIs(MyCoolClass(), first)
+            return weakref.ref(first)
+
+        async def main():
+            return await asyncio.gather(*[create(i) for i in range(3)])
+
+        refs = asyncio.run(main())
+        self.assertIs(MyCoolClass(), outside)
+        gc.collect()
+        self.assertEqual([ref() for ref in refs], [None] * 3)
+
+    def test_Context(self):
+        fakeable.set_fake_singleton("MyCoolClass", MyUnfakeableClass,
+            scope="context")
+        context = contextvars.copy_context()
+        inside = context.run(MyCoolClass)
+        self.assertIs(context.run(MyCoolClass), inside)
+        self.assertIsNot(MyCoolClass(), inside)
+
+    def test_AsyncFactory(self):
+        async def factory(arg1=None):
+            await asyncio.sleep(0)
+            return MyUnfakeableClass(arg1)
+
+        entry = fakeable.set_fake_singleton("MyCoolClass", factory,
+            scope="task")
+
+        async def main():
+            first = await MyCoolClass.acreate(1)
+            self.assertIs(await MyCoolClass.acreate(2), first)
+            return first
+
+        self.assertEqual(asyncio.run(main()).arg1, 1)
+        self.assertEqual(entry.created, 1)
+        with self.assertRaises(TypeError):
+            MyCoolClass()
+
+    def test_InvalidScope(self):
+        with self.assertRaises(ValueError):
+            fakeable.set_fake_singleton("MyCoolClass", MyUnfakeableClass,
+                scope="process")
+
+
+class Test_snapshot_registry(
+        fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def test_Restore(self):
+        fakeable.set_fake_object("MyCoolClass", 1)
+        fakeable.set_fake_object("MyCoolClassCustomFakeName", 2)
+        callback = unittest.mock.Mock()
+        snapshot = fakeable.snapshot_registry()
+        fakeable.set_fake_object("MyCoolClass", 3)
+        fakeable.set_fake_class("CustomName", MyUnfakeableClass)
+        fakeable.unset("MyCoolClassCustomFakeName")
+        fakeable.add_created_callback(callback)
+        fakeable.restore_registry(snapshot)
+        self.assertEqual(MyCoolClass(), 1)
+        self.assertIsInstance(MyCoolClassCustomFakeName(),
+            MyCoolClassCustomFakeName)
+        self.assertEqual(
+            fakeable.FAKE_FACTORY.get("MyCoolClassCustomFakeName"), 2)
+        callback.assert_not_called()
+
+    def test_ClosesDroppedEntries(self):
+        with unittest.mock.patch.object(fakeable.FakeObjectEntry,
+                "close") as close:
+            fakeable.set_fake_object("MyCoolClass", 1)
+            fakeable.unset("MyCoolClass")
+            self.assertEqual(close.call_count, 1)
+            fakeable.set_fake_object("MyCoolClass", 1)
+            fakeable.set_fake_object("MyCoolClass", 2)
+            self.assertEqual(close.call_count, 2)
+            fakeable.clear()
+            self.assertEqual(close.call_count, 3)
+
+    def test_ClosesEntriesOnlyOnceDropped(self):
+        with unittest.mock.patch.object(fakeable.FakeObjectEntry,
+                "close") as close:
+            fakeable.set_fake_object("MyCoolClass", 1)
+            snapshot = fakeable.snapshot_registry()
+            fakeable.unset("MyCoolClass")
+            fakeable.set_fake_object("CustomName", 2)
+            close.assert_not_called()
+            # the snapshot restores CustomName to being unregistered
+            fakeable.set_fake_object("CustomName", 3)
+            self.assertEqual(close.call_count, 1)
+            fakeable.clear()
+            self.assertEqual(close.call_count, 1)
+            fakeable.restore_registry(snapshot)
+            self.assertEqual(close.call_count, 2)
+        self.assertEqual(MyCoolClass(), 1)
+
+    def test_JournalBounded(self):
+        fakeable.set_fake_object("MyCoolClass", 1)
+        snapshot = fakeable.snapshot_registry()
+        for i in range(100):
+            fakeable.set_fake_object("MyCoolClass", i)
+            fakeable.unset("MyCoolClass")
+            fakeable.set_fake_object("CustomName", i)
+            fakeable.clear()
+        self.assertLessEqual(len(fakeable.FAKE_FACTORY._journal), 6)
+        fakeable.restore_registry(snapshot)
+        self.assertEqual(MyCoolClass(), 1)
+        self.assertIsInstance(MyCoolClassCustomFakeName(),
+            MyCoolClassCustomFakeName)
+
+    def test_JournalBounded_Nested(self):
+        outer = fakeable.snapshot_registry()
+        fakeable.set_fake_object("MyCoolClass", 1)
+        inner = fakeable.snapshot_registry()
+        for i in range(100):
+            fakeable.set_fake_object("MyCoolClass", i + 2)
+        fakeable.restore_registry(inner)
+        self.assertEqual(MyCoolClass(), 1)
+        for i in range(100):
+            fakeable.set_fake_object("MyCoolClass", i + 2)
+        self.assertEqual(len(fakeable.FAKE_FACTORY._journal), 1)
+        fakeable.restore_registry(outer)
+        self.assertIsInstance(MyCoolClass(), MyCoolClass)
+
+    def test_RestoreClear(self):
+        fakeable.set_fake_object("MyCoolClass", 1)
+        callback = unittest.mock.Mock()
+        fakeable.add_created_callback(callback)
+        snapshot = fakeable.snapshot_registry()
+        fakeable.clear()
+        self.assertIsInstance(MyCoolClass(), MyCoolClass)
+        fakeable.restore_registry(snapshot)
+        self.assertEqual(MyCoolClass(), 1)
+        callback.assert_called_once_with("MyCoolClass", 1, MyCoolClass)
+
+    def test_Nested(self):
+        outer = fakeable.snapshot_registry()
+        fakeable.set_fake_object("MyCoolClass", 1)
+        inner = fakeable.snapshot_registry()
+        fakeable.set_fake_object("MyCoolClass", 2)
+        fakeable.restore_registry(inner)
+        self.assertEqual(MyCoolClass(), 1)
+        fakeable.restore_registry(outer)
+        self.assertIsInstance(MyCoolClass(), MyCoolClass)
+        self.assertIsNone(fakeable.FAKE_FACTORY._journal)
+
+    def test_RestoreDiscardsLaterSnapshots(self):
+        outer = fakeable.snapshot_registry()
+        inner = fakeable.snapshot_registry()
+        fakeable.restore_registry(outer)
+        with self.assertRaises(ValueError):
+            fakeable.restore_registry(inner)
+        with self.assertRaises(ValueError):
+            fakeable.restore_registry(outer)
+
+    def test_ConstantTime(self):
+        for i in range(1000):
+            fakeable.set_fake_object("MyFake{}".format(i), i)
+        snapshot = fakeable.snapshot_registry()
+        fakeable.set_fake_object("MyCoolClass", 1)
+        self.assertEqual(len(fakeable.FAKE_FACTORY._journal), 1)
+        fakeable.restore_registry(snapshot)
+        self.assertEqual(len(fakeable.FAKE_FACTORY.fake_factories), 1000)
+
+
+class Test_set_construction_profile(
+        fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(Test_set_construction_profile, self).setUp()
+        self.profile = fakeable.ConstructionProfile()
+        fakeable.set_fake_object("MyCoolClassCustomFakeName", 1)
+        self.assertIsNone(fakeable.set_construction_profile(self.profile))
+        self.addCleanup(fakeable.set_construction_profile, None)
+
+    def test_Profile(self):
+        fakeable.set_fake_class(MyCoolClass, MyUnfakeableClass)
+        fakeable.set_fake_object("NoSuchClass", 1)
+        MyCoolClass()
+        MyCoolClass()
+        MyCalculator()
+        self.assertEqual(self.profile.never_hit(), [
+            ("MyCoolClassCustomFakeName", "FakeObjectEntry"),
+            ("NoSuchClass", "FakeObjectEntry"),
+        ])
+        self.assertEqual(self.profile.hits,
+            {("MyCoolClass", "FakeClassEntry"): 2})
+        costs = self.profile.most_expensive()
+        self.assertEqual(sorted((cost.name, cost.count) for cost in costs),
+            [("MyCalculator", 1), ("MyCoolClass", 2)])
+        self.assertEqual(len(self.profile.most_expensive(1)), 1)
+
+    def test_Acreate(self):
+        fakeable.set_fake_class(MyCoolClass, MyUnfakeableClass)
+        asyncio.run(MyCoolClass.acreate())
+        asyncio.run(MyCalculator.acreate())
+        self.assertEqual(self.profile.hits,
+            {("MyCoolClass", "FakeClassEntry"): 1})
+        costs = self.profile.most_expensive()
+        self.assertEqual(sorted((cost.name, cost.count) for cost in costs),
+            [("MyCalculator", 1), ("MyCoolClass", 1)])
+
+    def test_Merge(self):
+        fakeable.set_fake_class("MyCoolClass", MyUnfakeableClass)
+        MyCoolClass()
+        other = fakeable.ConstructionProfile()
+        other.merge(json.loads(json.dumps(self.profile.to_dict())))
+        other.merge(self.profile.to_dict())
+        self.assertEqual(other.registered, self.profile.registered)
+        self.assertEqual(other.hits, {("MyCoolClass", "FakeClassEntry"): 2})
+        self.assertEqual(other.most_expensive()[0].count, 2)
+
+
+class Test_set_tracer(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(Test_set_tracer, self).setUp()
+        self.collector = fakeable.SpanCollector()
+        self.assertIsNone(fakeable.set_tracer(self.collector))
+        self.addCleanup(fakeable.set_tracer, None)
+
+    def test_Real(self):
+        x = MyCoolClass(1)
+        (span,) = self.collector.spans()
+        self.assertEqual(span.name, "MyCoolClass")
+        self.assertIs(span.cls, MyCoolClass)
+        self.assertFalse(span.faked)
+        self.assertGreaterEqual(span.duration, 0.0)
+        self.assertEqual(span.thread, threading.get_ident())
+        self.assertIsNone(span.error)
+        self.assertEqual(x.arg1, 1)
+
+    def test_Fake(self):
+        fakeable.set_fake_object("MyCoolClass", 1)
+        MyCoolClass()
+        (span,) = self.collector.drain()
+        self.assertTrue(span.faked)
+        self.assertEqual(len(self.collector), 0)
+
+    def test_Error(self):
+        error = ValueError("failed")
+        fakeable.set_fake_factory("MyCoolClass", unittest.mock.Mock(
+            side_effect=error))
+        with self.assertRaises(ValueError):
+            MyCoolClass()
+        (span,) = self.collector.spans()
+        self.assertIs(span.error, error)
+
+    def test_Nested(self):
+        tracer = unittest.mock.Mock()
+        fakeable.set_tracer(tracer)
+        fakeable.set_fake_factory("MyCoolClass", lambda: MyCalculator())
+        MyCoolClass()
+        self.assertEqual([call[0] for call in tracer.mock_calls],
+            ["begin", "begin", "end", "end"])
+        self.assertEqual(tracer.mock_calls[0],
+            unittest.mock.call.begin("MyCoolClass", MyCoolClass, True))
+        self.assertIs(tracer.mock_calls[2][1][0], tracer.begin.return_value)
+
+    def test_Acreate(self):
+        asyncio.run(MyCoolClass.acreate())
+        (span,) = self.collector.spans()
+        self.assertIs(span.cls, MyCoolClass)
+
+    def test_RealInstancesOfEntries(self):
+        pool = fakeable.set_warm_pool(MyCoolClass, size=1)
+        pool.wait_until_full()
+        MyCoolClass()
+        asyncio.run(MyCoolClass.acreate())
+        fakeable.set_instance_limit(MyCoolClass, 2)
+        MyCoolClass()
+        asyncio.run(MyCoolClass.acreate())
+        fakeable.set_instance_limit(MyCoolClass, 2, MyUnfakeableClass)
+        MyCoolClass()
+        self.assertEqual([span.faked for span in self.collector.spans()],
+            [False, False, False, False, True])
+
+    def test_Capacity(self):
+        collector = fakeable.SpanCollector(capacity=2)
+        fakeable.set_tracer(collector)
+        for i in range(3):
+            MyCoolClass(i)
+        self.assertEqual(len(collector.spans()), 2)
+        collector.clear()
+        self.assertEqual(collector.spans(), [])
+
+    def test_Uninstall(self):
+        fakeable.set_tracer(None)
+        MyCoolClass()
+        self.assertIs(construction_stub(MyCoolClass), fakeable._create_real)
+        self.assertEqual(self.collector.spans(), [])
+
+
+class Test_Subinterpreters(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            import _interpreters as interpreters
+        except ImportError:
+            try:
+                import _xxsubinterpreters as interpreters
+            except ImportError:
+                self.skipTest("subinterpreters are not supported")
+        self.interpreters = interpreters
+
+    def run_in_subinterpreter(self, code):
+        interp = self.interpreters.create()
+        self.addCleanup(self.interpreters.destroy, interp)
+        package_dir = os.path.dirname(os.path.abspath(fakeable.__file__))
+        setup = "import sys\nsys.path.insert(0, {!r})\n".format(package_dir)
+        result = self.interpreters.run_string(interp, setup + code)
+        # _interpreters returns the uncaught exception instead of raising it
+        self.assertIsNone(result)
+
+    def test_IsolatedRegistry(self):
+        fakeable.clear()
+        self.addCleanup(fakeable.clear)
+        fakeable.set_fake_object("MyCoolClass", 1)
+        self.run_in_subinterpreter(textwrap.dedent("""
+            import fakeable
+            assert not fakeable.FAKE_FACTORY.fake_factories
+            fakeable.set_fake_object("Other", 2)
+            """))
+        self.assertEqual(list(fakeable.FAKE_FACTORY.fake_factories),
+            ["MyCoolClass"])
+
+
+class Test_swap_registry(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def test_Swap(self):
+        fakeable.set_fake_object("MyCoolClass", 1)
+        fakeable.set_fake_object("MyCalculator", 2)
+        staging = fakeable.FakeFactory()
+        entry = staging.set_fake_class("MyCoolClass", MyUnfakeableClass)
+        swap = fakeable.swap_registry(staging)
+        self.assertEqual(swap.generation, fakeable.FAKE_FACTORY.generation)
+        self.assertEqual(swap.entries, 1)
+        self.assertGreaterEqual(swap.swap_seconds, 0.0)
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+        self.assertIsInstance(MyCalculator(), MyCalculator)
+        self.assertIs(entry.fake_factory, fakeable.FAKE_FACTORY)
+        entry.unregister()
+        self.assertIsInstance(MyCoolClass(), MyCoolClass)
+
+    def test_ReplacedEntries(self):
+        with unittest.mock.patch.object(fakeable.FakeObjectEntry,
+                "close") as close:
+            fakeable.set_fake_object("MyCoolClass", 1)
+            fakeable.set_fake_object("MyCalculator", 2)
+            (kept, replaced) = fakeable.FAKE_FACTORY.fake_factories.values()
+            snapshot = fakeable.snapshot_registry()
+            self.assertEqual(fakeable.swap_registry([]).replaced, [])
+            fakeable.restore_registry(snapshot)
+            swap = fakeable.swap_registry([kept])
+            self.assertEqual(swap.replaced, [replaced])
+            close.assert_not_called()
+        self.assertEqual(MyCoolClass(), 1)
+
+    def test_InFlight(self):
+        started = threading.Event()
+        proceed = threading.Event()
+
+        def slow_factory():
+            started.set()
+            proceed.wait(5)
+            return "old"
+
+        fakeable.set_fake_factory("MyCoolClass", slow_factory)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(MyCoolClass()))
+        thread.start()
+        started.wait(5)
+        fakeable.swap_registry([fakeable.FakeObjectEntry(
+            fakeable.FAKE_FACTORY, "MyCoolClass", "new")])
+        self.assertEqual(MyCoolClass(), "new")
+        proceed.set()
+        thread.join()
+        self.assertEqual(results, ["old"])
+
+    def test_Strict(self):
+        fakeable.set_strict()
+        self.addCleanup(fakeable.set_strict, False)
+        staging = fakeable.FakeFactory()
+        staging.set_fake_object("NoSuchClass", 1)
+        fakeable.set_fake_object("MyCoolClass", 1)
+        with self.assertRaises(ValueError):
+            fakeable.swap_registry(staging)
+        self.assertEqual(MyCoolClass(), 1)
+
+    def test_Snapshot(self):
+        fakeable.set_fake_object("MyCoolClass", 1)
+        snapshot = fakeable.snapshot_registry()
+        fakeable.swap_registry([])
+        self.assertIsInstance(MyCoolClass(), MyCoolClass)
+        fakeable.restore_registry(snapshot)
+        self.assertEqual(MyCoolClass(), 1)
+
+
+class Test_watch_config(fakeable.FakeableCleanupMixin, unittest.TestCase):
+
+    def setUp(self):
+        super(Test_watch_config, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.path = os.path.join(self.temp_dir, "fakes.json")
+
+    def write_config(self, fakes):
+        with open(self.path, "w") as f:
+            json.dump({"fakes": fakes}, f)
+
+    def test_Reload(self):
+        self.write_config({"MyCoolClass": "fakeable_test:MyUnfakeableClass"})
+        reloads = []
+        with fakeable.watch_config(self.path, interval=3600,
+                callback=reloads.append) as watcher:
+            self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+            self.assertIsNone(watcher.check())
+            self.write_config({
+                "MyCalculator": "fakeable_test:MyFastCalculator",
+                "MyCoolClass": {"type": "object",
+                    "target": "fakeable_test:MyUnfakeableClass1"},
+            })
+            reload = watcher.check()
+        self.assertEqual(reload.entries, 2)
+        self.assertIsNone(reload.error)
+        self.assertGreaterEqual(reload.swap_seconds, 0.0)
+        self.assertGreaterEqual(reload.load_seconds, 0.0)
+        self.assertEqual(len(reloads), 2)
+        self.assertIs(reloads[-1], reload)
+        self.assertIs(watcher.last_reload, reload)
+        self.assertEqual(watcher.reloads, 2)
+        self.assertIs(MyCoolClass(), MyUnfakeableClass1)
+        self.assertIsInstance(MyCalculator(), MyFastCalculator)
+
+    def test_Polling(self):
+        self.write_config({})
+        reloaded = threading.Event()
+        watcher = fakeable.watch_config(self.path, interval=0.01,
+            callback=lambda reload: reloaded.set())
+        self.addCleanup(watcher.close)
+        reloaded.clear()
+        self.write_config({"MyCoolClass": "fakeable_test:MyUnfakeableClass"})
+        self.assertTrue(reloaded.wait(5))
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+
+    def test_InvalidReload(self):
+        self.write_config({"MyCoolClass": "fakeable_test:MyUnfakeableClass"})
+        watcher = fakeable.watch_config(self.path, interval=3600)
+        self.addCleanup(watcher.close)
+        self.write_config({"MyCoolClass": {"type": "bogus"}})
+        reload = watcher.reload()
+        self.assertIsInstance(reload.error, ValueError)
+        self.assertIsNone(reload.generation)
+        self.assertIsInstance(MyCoolClass(), MyUnfakeableClass)
+        self.assertIsNone(watcher.check())
+
+    def test_InvalidInitially(self):
+        self.write_config({"MyCoolClass": {"type": "bogus"}})
+        with self.assertRaises(ValueError):
+            fakeable.watch_config(self.path)
+
+
+class Test_main(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "control")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_control(self):
+        self.assertEqual(fakeable.main(["control", self.path, "create"]), 0)
+        self.assertEqual(fakeable.main(["control", self.path, "set", "A",
+            "3"]), 0)
+        self.assertEqual(fakeable.main(["control", self.path, "remove",
+            "A"]), 0)
+        self.assertEqual(fakeable.main(["control", self.path, "remove",
+            "A"]), 1)
+        control_block = fakeable.ControlBlock(self.path)
+        try:
+            self.assertEqual(control_block.table(), {})
+        finally:
+            control_block.close()
+
+
 if __name__ == "__main__":
     unittest.main()
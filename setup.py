@@ -26,7 +26,7 @@ distutils.core.setup(
     author="Denver Coneybeare",
     author_email="denver@sleepydragon.org",
     url="https://github.com/sleepydragonsw/fakeable",
-    py_modules=["fakeable"],
+    py_modules=["fakeable", "fakeable_bench", "fakeable_pytest"],
     classifiers=[
         "Development Status :: 5 - Production/Stable",
         "Intended Audience :: Developers",
@@ -34,8 +34,9 @@ distutils.core.setup(
         "Natural Language :: English",
         "Operating System :: OS Independent",
         "Programming Language :: Python",
-        "Programming Language :: Python :: 2",
         "Programming Language :: Python :: 3",
+        "Programming Language :: Python :: 3 :: Only",
+        "Programming Language :: Python :: 3.6",
         "Topic :: Software Development :: Testing",
     ],
     license="Apache License version 2.0",